@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class MachineLogsConfig(AppConfig):
+    # Python path of this app, the same as its label in migrations_fix_example.py
+    name = "api"
+    default_auto_field = "django.db.models.BigAutoField"
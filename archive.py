@@ -0,0 +1,264 @@
+"""
+Cold storage of old machine logs in compressed Parquet files.
+
+Raw logs are kept in the database for MACHINE_LOG_HOT_DAYS days. Older,
+closed months are exported by manage.py archive_machine_logs to
+MACHINE_LOG_ARCHIVE_DIR, one zstd-compressed Parquet file per date under
+DATE=YYYY-MM-DD/ (hive-style, so a date range only opens its own files), and
+then deleted from the table in batches.
+
+The raw log views read archived dates back with iter_archived_logs() and
+archived_page(). The line, machine and operator reports read the rollup
+tables, which are not archived, so their history is unaffected. Archived
+dates are therefore skipped by rollup rebuilds (see rollups.py). Their logs
+are no longer covered by the unique Log ID constraints, so ingest checks
+late retransmits of archived dates against the files (archived_rows()).
+
+Requires pyarrow. Without it, or without MACHINE_LOG_ARCHIVE_DIR, nothing is
+archived and the readers return no rows.
+"""
+import os
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import models
+
+from .models import MachineLog
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+ARCHIVE_DIR = getattr(settings, "MACHINE_LOG_ARCHIVE_DIR", None)
+HOT_DAYS = getattr(settings, "MACHINE_LOG_HOT_DAYS", 90)
+
+# Logs deleted per statement after a date was archived
+ARCHIVE_DELETE_BATCH_SIZE = 5000
+ARCHIVE_COMPRESSION = "zstd"
+ARCHIVE_FILE_NAME = "logs.parquet"
+
+
+def archive_enabled():
+    return bool(ARCHIVE_DIR) and pa is not None
+
+
+def _arrow_type(field):
+    """Parquet column type holding the field's values without loss."""
+    if field.is_relation:
+        # The stored value is the target's primary key
+        return _arrow_type(field.target_field)
+    if isinstance(field, (models.AutoField, models.IntegerField)):
+        return pa.int64()
+    if isinstance(field, models.DecimalField):
+        decimal = pa.decimal128 if field.max_digits <= 38 else pa.decimal256
+        return decimal(field.max_digits, field.decimal_places)
+    if isinstance(field, models.FloatField):
+        return pa.float64()
+    if isinstance(field, models.BooleanField):
+        return pa.bool_()
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp("us", tz="UTC" if settings.USE_TZ else None)
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    if isinstance(field, models.TimeField):
+        return pa.time64("us")
+    if isinstance(field, models.DurationField):
+        return pa.duration("us")
+    if isinstance(field, (models.CharField, models.TextField)):
+        return pa.string()
+    # Fail the archival rather than store the values in a lossy form
+    raise TypeError(f"No archive column type for {field.__class__.__name__} {field.name}")
+
+
+def _log_fields():
+    """Concrete MachineLog fields stored in the files; DATE is the directory name."""
+    return [field for field in MachineLog._meta.concrete_fields if field.attname != "DATE"]
+
+
+def _date_dir(log_date):
+    return os.path.join(ARCHIVE_DIR, f"DATE={log_date.isoformat()}")
+
+
+def archived_dates(from_date=None, to_date=None):
+    """Sorted archived dates between from_date and to_date (inclusive, None for open)."""
+    if not archive_enabled() or not os.path.isdir(ARCHIVE_DIR):
+        return []
+    dates = []
+    with os.scandir(ARCHIVE_DIR) as entries:
+        for entry in entries:
+            if not entry.name.startswith("DATE="):
+                continue
+            try:
+                log_date = date.fromisoformat(entry.name[len("DATE="):])
+            except ValueError:
+                continue
+            if (from_date is None or log_date >= from_date) and (to_date is None or log_date <= to_date):
+                dates.append(log_date)
+    return sorted(dates)
+
+
+def archive_date(log_date, batch_size=ARCHIVE_DELETE_BATCH_SIZE):
+    """
+    Export the logs of one date to its Parquet file and delete them from the
+    table. Logs that arrived after the date was archived are merged into the
+    existing file. Returns the number of archived logs.
+    """
+    fields = _log_fields()
+    schema = pa.schema([(field.attname, _arrow_type(field)) for field in fields])
+    logs = MachineLog.objects.filter(DATE=log_date)
+
+    columns = {field.attname: [] for field in fields}
+    for row in logs.order_by("id").values_list(*columns).iterator(chunk_size=batch_size):
+        for values, value in zip(columns.values(), row):
+            values.append(value)
+    table = pa.Table.from_pydict(columns, schema=schema)
+    if not table.num_rows:
+        return 0
+    max_id = max(columns["id"])
+
+    directory = _date_dir(log_date)
+    path = os.path.join(directory, ARCHIVE_FILE_NAME)
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(path):
+        existing = pq.read_table(path, schema=schema)
+        replaced = pc.is_in(existing["id"], value_set=table["id"].combine_chunks())
+        existing = existing.filter(pc.invert(replaced))
+        table = pa.concat_tables([existing, table])
+
+    # Written under a hidden name first, the dataset reader skips dot files
+    temporary_path = os.path.join(directory, f".{ARCHIVE_FILE_NAME}.tmp")
+    pq.write_table(table, temporary_path, compression=ARCHIVE_COMPRESSION)
+    if pq.read_metadata(temporary_path).num_rows != table.num_rows:
+        os.remove(temporary_path)
+        raise IOError(f"Archive file of {log_date} is incomplete")
+    os.replace(temporary_path, path)
+
+    archived = len(columns["id"])
+    while True:
+        ids = list(logs.filter(id__lte=max_id).order_by("id").values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        MachineLog.objects.filter(id__in=ids).delete()
+    return archived
+
+
+def archive_closed_months(hot_days=HOT_DAYS):
+    """
+    Archive every closed month that lies entirely before the hot window.
+
+    Returns:
+        dict of date to the number of archived logs
+    """
+    cutoff = (datetime.now().date() - timedelta(days=hot_days)).replace(day=1)
+    dates = MachineLog.objects.filter(DATE__lt=cutoff).dates("DATE", "day")
+    return {log_date: archive_date(log_date) for log_date in dates}
+
+
+def _filter_expression(filters):
+    expression = None
+
+    def both(condition):
+        return condition if expression is None else expression & condition
+
+    for lookup, value in filters.items():
+        name, _, operator = lookup.partition("__")
+        field = MachineLog._meta.get_field(name)
+        if operator == "in":
+            expression = both(ds.field(field.attname).isin([field.to_python(item) for item in value]))
+        elif operator == "gt":
+            expression = both(ds.field(field.attname) > field.to_python(value))
+        elif operator in ("", "exact"):
+            expression = both(ds.field(field.attname) == field.to_python(value))
+        else:
+            raise ValueError(f"Unsupported archive lookup: {lookup}")
+    return expression
+
+
+def _as_date(value):
+    return MachineLog._meta.get_field("DATE").to_python(value) if value else None
+
+
+def _date_file(log_date):
+    return os.path.join(_date_dir(log_date), ARCHIVE_FILE_NAME)
+
+
+def is_archived(log_date):
+    """Whether the logs of log_date were archived."""
+    return archive_enabled() and os.path.isfile(_date_file(log_date))
+
+
+def archived_rows(log_date, columns, **filters):
+    """
+    Columns of the archived logs of one date as dicts, with DATE, or an
+    empty list if the date is not archived.
+
+    Args:
+        filters: FIELD=value, FIELD__in=values or FIELD__gt=value
+    """
+    if not is_archived(log_date):
+        return []
+    table = ds.dataset(_date_file(log_date), format="parquet").to_table(
+        columns=columns, filter=_filter_expression(filters)
+    )
+    return [{"DATE": log_date, **row} for row in table.to_pylist()]
+
+
+def archived_page(from_date=None, to_date=None, limit=100, before=None, **filters):
+    """
+    Up to limit archived logs, newest first by (DATE, id), as unsaved
+    MachineLog instances.
+
+    The dates are read newest first, one file at a time, until the page is
+    full. The cursor is pushed down as a filter on the sort keys, so a page
+    only opens the files it returns logs from.
+
+    Args:
+        before: (DATE, id) of the last log of the previous page, only older
+            logs are returned
+    """
+    from_date, to_date = _as_date(from_date), _as_date(to_date)
+    dates = archived_dates(from_date, to_date)
+    if before is not None:
+        before_date, before_id = before
+        dates = [log_date for log_date in dates if log_date <= before_date]
+
+    base_expression = _filter_expression(filters)
+    logs = []
+    for log_date in reversed(dates):
+        expression = base_expression
+        if before is not None and log_date == before_date:
+            older = ds.field("id") < before_id
+            expression = older if expression is None else expression & older
+        # Find the page's ids on the id column, then read only those rows in full
+        dataset = ds.dataset(_date_file(log_date), format="parquet")
+        ids = dataset.to_table(columns=["id"], filter=expression)["id"]
+        ids = ids.take(pc.array_sort_indices(ids, order="descending")).slice(0, limit - len(logs))
+        if not len(ids):
+            continue
+        rows = dataset.to_table(filter=ds.field("id").isin(ids.to_pylist())).sort_by([("id", "descending")])
+        logs.extend(MachineLog(DATE=log_date, **row) for row in rows.to_pylist())
+        if len(logs) >= limit:
+            break
+    return logs
+
+
+def iter_archived_logs(from_date=None, to_date=None, batch_size=5000, **filters):
+    """
+    Archived logs between from_date and to_date as unsaved MachineLog
+    instances, by date and id. Files are read batch_size rows at a time, so
+    memory does not grow with the range.
+    """
+    from_date, to_date = _as_date(from_date), _as_date(to_date)
+    expression = _filter_expression(filters)
+    for log_date in archived_dates(from_date, to_date):
+        for batch in pq.ParquetFile(_date_file(log_date)).iter_batches(batch_size=batch_size):
+            table = pa.Table.from_batches([batch])
+            if expression is not None:
+                table = table.filter(expression)
+            for row in table.to_pylist():
+                yield MachineLog(DATE=log_date, **row)
+
@@ -1,4 +1,6 @@
 # Standard library imports
+from collections import defaultdict
+from itertools import chain
 from datetime import datetime, timedelta, date
 
 # Django imports
@@ -22,8 +24,28 @@ from rest_framework.views import APIView
 from rest_framework import status
 
 # Local application imports
-from .models import MachineLog, DuplicateLog, ModeMessage, Operator
+from .models import MachineLog, MachineLogDailyRollup, DuplicateLog, ModeMessage, Operator
 from .serializers import MachineLogSerializer
+from .archive import archived_dates, iter_archived_logs
+from .operator_directory import operator_directory
+from .pagination import page_logs, parse_limit
+from .projection import log_dict_rows, machine_log_projection
+from .report_cache import cached_report_columns, report_cache, report_dates
+from .report_engine import ReportColumns, ratio
+from .report_queries import (
+    OPERATOR_MODE_TOTALS, consolidated_day_totals, consolidated_logs, daily_rollups, hourly_rollups,
+    hourly_totals, machine_logs, operator_daily_seconds, operator_daily_totals, operator_logs,
+    operator_rollups, operator_totals
+)
+from .shift_calendar import shift_calendar
+from .streaming import (
+    chunked, encode, json_array, json_object, streaming_json_response, wants_stream
+)
+from .ingest import (
+    database_available, db_health, dedup_index, enqueue_logs, insert_logs_ignore_conflicts,
+    log_spool, normalize_log_ids, remember_logs, save_or_spool, spool_logs, write_buffer,
+    OUTAGE_ERRORS, WRITE_BEHIND_ENABLED
+)
 
 # Dictionary to map mode numbers to descriptions
 MODES = {
@@ -34,118 +56,210 @@ MODES = {
     5: "Maintenance",
 }
 
-@api_view(['POST'])
-def log_machine_data(request):
-    """
-    View to handle machine data logging with updated Tx Log ID and Str Log ID conditions.
-    
-    - Tx_LOGID:
-      - If > 1000, subtracts 1000 and stores only the adjusted value.
-      - Checks if the adjusted Log ID exists for the same Machine ID, Date, Start Time, and End Time before saving.
-    - Str_LOGID:
-      - If > 1000, subtracts 1000 and stores only the adjusted value.
-      - Checks if the adjusted Log ID exists for the same Machine ID, Date, Start Time, and End Time before saving.
+# Largest number of records accepted by log_machine_data_batch
+MAX_LOG_BATCH_SIZE = 5000
+
+
+def validate_machine_log(data):
     """
-    data = request.data
-    print("Processing machine log data...")
+    Validate a single incoming machine log record.
+
+    Checks the mode, runs the serializer, requires MACHINE_ID, DATE,
+    START_TIME and END_TIME and applies the Tx_LOGID / Str_LOGID
+    retransmit rule.
 
+    Returns:
+        (validated_data, checks, None) for a valid record, where checks lists
+        the adjusted Log IDs that need a duplicate check, or
+        (None, None, error) where error is the rejection response body
+    """
     # Validate mode
     try:
         mode = int(data.get("MODE"))
     except (TypeError, ValueError):
-        return Response({"message": "Invalid mode format"}, status=400)
+        return None, None, {"message": "Invalid mode format"}
 
     if mode not in MODES:
-        return Response({"message": f"Invalid mode: {mode}. Valid modes are {list(MODES.keys())}"}, status=400)
+        return None, None, {"message": f"Invalid mode: {mode}. Valid modes are {list(MODES.keys())}"}
 
     # Validate serializer
     serializer = MachineLogSerializer(data=data)
     if not serializer.is_valid():
-        return Response({"message": "Validation failed", "errors": serializer.errors}, status=400)
+        return None, None, {"message": "Validation failed", "errors": serializer.errors}
 
     validated_data = serializer.validated_data
 
-    # Extract Log IDs, Machine ID, Date, Start Time and End Time
-    tx_log_id = validated_data.get("Tx_LOGID")
-    str_log_id = validated_data.get("Str_LOGID")
-    machine_id = validated_data.get("MACHINE_ID")
-    log_date = validated_data.get("DATE")  # Assumes DATE is provided and validated in serializer
-    start_time = validated_data.get("START_TIME")
-    end_time = validated_data.get("END_TIME")
+    for field in ("MACHINE_ID", "DATE", "START_TIME", "END_TIME"):
+        if validated_data.get(field) is None:
+            return None, None, {"message": f"{field} is required"}
 
-    if machine_id is None:
-        return Response({"message": "MACHINE_ID is required"}, status=400)
+    # Tx_LOGID / Str_LOGID handling
+    try:
+        checks = normalize_log_ids(validated_data)
+    except ValueError as e:
+        return None, None, {"message": f"Invalid {e} format"}
 
-    if log_date is None:
-        return Response({"message": "DATE is required"}, status=400)
-        
-    if start_time is None:
-        return Response({"message": "START_TIME is required"}, status=400)
-        
-    if end_time is None:
-        return Response({"message": "END_TIME is required"}, status=400)
+    return validated_data, checks, None
+
+
+@api_view(['POST'])
+def log_machine_data(request):
+    """
+    View to handle machine data logging with updated Tx Log ID and Str Log ID conditions.
     
-    # Tx_LOGID Handling
-    if tx_log_id is not None:
-        try:
-            tx_log_id = int(tx_log_id)  # Convert to integer
-        except ValueError:
-            return Response({"message": "Invalid Tx_LOGID format"}, status=400)
-        
-        if tx_log_id > 1000:
-            adjusted_tx_log_id = tx_log_id - 1000  # Subtract 1000
-            
-            # Check if the adjusted TX Log ID exists for the same MACHINE_ID, DATE, START_TIME, and END_TIME
-            if MachineLog.objects.filter(
-                Tx_LOGID=adjusted_tx_log_id,
-                MACHINE_ID=machine_id,
-                DATE=log_date,
-                START_TIME=start_time,
-                END_TIME=end_time
-            ).exists():
-                return Response({
-                    "code": 200,
-                    "message": "Log saved successfully"
-                }, status=200)
-            
-            # Update validated data with adjusted Tx_LOGID
-            validated_data["Tx_LOGID"] = adjusted_tx_log_id
+    - Tx_LOGID:
+      - If > 1000, subtracts 1000 and stores only the adjusted value.
+      - Skipped if the adjusted Log ID exists for the same Machine ID, Date, Start Time, and End Time.
+    - Str_LOGID:
+      - If > 1000, subtracts 1000 and stores only the adjusted value.
+      - Skipped if the adjusted Log ID exists for the same Machine ID, Date, Start Time, and End Time.
 
-    # Str_LOGID Handling
-    if str_log_id is not None:
-        try:
-            str_log_id = int(str_log_id)  # Convert to integer
-        except ValueError:
-            return Response({"message": "Invalid Str_LOGID format"}, status=400)
-
-        if str_log_id > 1000:
-            adjusted_str_log_id = str_log_id - 1000  # Subtract 1000
-
-            # Check if the adjusted STR Log ID exists for the same MACHINE_ID, DATE, START_TIME, and END_TIME
-            if MachineLog.objects.filter(
-                Str_LOGID=adjusted_str_log_id,
-                MACHINE_ID=machine_id,
-                DATE=log_date,
-                START_TIME=start_time,
-                END_TIME=end_time
-            ).exists():
-                return Response({
-                    "code": 200,
-                    "message": "Log saved successfully"
-                }, status=200)
-
-            # Update validated data with adjusted Str_LOGID
-            validated_data["Str_LOGID"] = adjusted_str_log_id
-
-    # Save the log data
-    MachineLog.objects.create(**validated_data)
+    Duplicates are rejected by the unique Log ID constraints on MachineLog
+    with a conflict-ignoring insert, which stays correct with several workers.
+    The constraints also skip a first transmission (Log ID <= 1000) that
+    repeats the Log ID and time window of a stored log.
+    """
+    data = request.data
+    print("Processing machine log data...")
+
+    validated_data, checks, error = validate_machine_log(data)
+    if error:
+        return Response(error, status=400)
+
+    # In write-behind mode the flusher thread deduplicates and saves the record
+    if enqueue_logs([(validated_data, checks)])[0]:
+        return Response({
+            "code": 200,
+            "message": "Log saved successfully",
+        }, status=200)
+
+    # While the database is down, accept the log into the outage spool
+    if not database_available() and spool_logs([(validated_data, checks)]):
+        return Response({
+            "code": 200,
+            "message": "Log saved successfully",
+        }, status=200)
+
+    # Save the log data. Retransmitted duplicates are rejected by the unique
+    # Log ID constraints in the same statement, so no exists() check is needed.
+    try:
+        inserted = insert_logs_ignore_conflicts([validated_data])
+    except OUTAGE_ERRORS:
+        db_health.mark_failure()
+        if not spool_logs([(validated_data, checks)]):
+            raise
+        inserted = 0
+    else:
+        remember_logs([validated_data])
 
     return Response({
         "code": 200,
         "message": "Log saved successfully",
+        "inserted": inserted,
+    }, status=200)
+
+
+@api_view(['POST'])
+def log_machine_data_batch(request):
+    """
+    View to log a batch of machine records in a single request.
+
+    Accepts a JSON array of records (or {"logs": [...]}) in the same format as
+    log_machine_data. Every record is validated on its own, retransmitted
+    duplicates are resolved with one lookup per (MACHINE_ID, DATE) group and
+    the remaining records are inserted with a conflict-ignoring bulk insert.
+    "inserted" is the number of rows the database actually accepted.
+
+    Returns:
+        Response with counts and a per-record status in request order:
+        - created: the record was saved
+        - duplicate: the record was already stored (or repeated in the batch)
+        - queued: accepted by the write-behind buffer, saved shortly after
+        - spooled: the database is unavailable, kept on disk and replayed later
+        - invalid: the record failed validation, with the error message
+    """
+    records = request.data
+    if isinstance(records, dict):
+        records = records.get("logs")
+
+    if not isinstance(records, list):
+        return Response({"message": "Expected a list of log records"}, status=400)
+
+    if len(records) > MAX_LOG_BATCH_SIZE:
+        return Response({"message": f"Batch too large. Maximum is {MAX_LOG_BATCH_SIZE} records"}, status=400)
+
+    results = [None] * len(records)
+    valid_indexes = []
+    valid_records = []
+    for index, data in enumerate(records):
+        if not isinstance(data, dict):
+            results[index] = {"index": index, "status": "invalid", "message": "Expected an object"}
+            continue
+
+        validated_data, checks, error = validate_machine_log(data)
+        if error:
+            results[index] = {"index": index, "status": "invalid", **error}
+            continue
+
+        valid_indexes.append(index)
+        valid_records.append((validated_data, checks))
+
+    # In write-behind mode records are acknowledged as queued and saved by the
+    # flusher thread; whatever does not fit in the queue is saved right here
+    queued = enqueue_logs(valid_records)
+    statuses, inserted = save_or_spool([
+        record for record, was_queued in zip(valid_records, queued) if not was_queued
+    ])
+    statuses = iter(statuses)
+    for index, was_queued in zip(valid_indexes, queued):
+        log_status = "queued" if was_queued else next(statuses)
+        results[index] = {"index": index, "status": log_status}
+
+    counts = [result["status"] for result in results]
+    return Response({
+        "code": 200,
+        "message": "Batch processed",
+        "created": counts.count("created"),
+        "inserted": inserted,
+        "duplicates": counts.count("duplicate"),
+        "queued": counts.count("queued"),
+        "spooled": counts.count("spooled"),
+        "invalid": counts.count("invalid"),
+        "results": results,
+    }, status=200)
+
+
+@api_view(['GET'])
+def ingest_stats(request):
+    """
+    Report the state of the ingestion pipeline.
+
+    Returns:
+        Write-behind queue depth and flush latency, dedup index hit counters
+        and outage spool state
+    """
+    return Response({
+        "writeBehind": {"enabled": WRITE_BEHIND_ENABLED, **write_buffer.stats()},
+        "dedupIndex": dict(dedup_index.stats),
+        "spool": {
+            "enabled": log_spool is not None,
+            "databaseHealthy": db_health.healthy,
+            **(log_spool.stats if log_spool is not None else {}),
+        },
     }, status=200)
 
 
+@api_view(['GET'])
+def report_cache_stats(request):
+    """
+    Report the state of the report result cache.
+
+    Returns:
+        Cached partials, capacity and hit / miss / eviction / invalidation counters
+    """
+    return Response(report_cache.snapshot(), status=200)
+
+
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .models import MachineLog
@@ -155,24 +269,36 @@ from .serializers import MachineLogSerializer
 def get_machine_logs(request):
     """
     View to retrieve machine logs with optional date filtering.
+    With limit (and the cursor of the previous page's `next`) one page is
+    returned, see pagination.py.
     """
     from_date = request.query_params.get('from_date')
     to_date = request.query_params.get('to_date')
     
-    logs = MachineLog.objects.all().order_by('-created_at')
+    logs = machine_logs(from_date, to_date).order_by('-created_at')
     
-    if from_date:
-        logs = logs.filter(DATE__gte=from_date)
-    if to_date:
-        logs = logs.filter(DATE__lte=to_date)
+    if 'limit' in request.query_params:
+        try:
+            page = page_logs(logs, parse_limit(request.query_params['limit']), request.query_params.get('cursor'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        serialized_logs = [log for chunk in machine_log_projection.rows(page.hot_logs) for log in chunk]
+        for index, log in enumerate(serialized_logs, start=page.first_index):
+            log['index'] = index
+        return Response({"results": serialized_logs, "next": page.next_cursor})
     
-    serialized_logs = MachineLogSerializer(logs, many=True).data
-
     # Add indexing (starting from 1)
-    for idx, log in enumerate(serialized_logs, start=1):
-        log['index'] = idx
+    def indexed_chunks():
+        index = 0
+        for chunk in machine_log_projection.rows(logs):
+            for index, log in enumerate(chunk, start=index + 1):
+                log['index'] = index
+            yield chunk
 
-    return Response(serialized_logs)
+    if wants_stream(request):
+        return streaming_json_response(request, json_array(indexed_chunks()))
+    
+    return Response([log for chunk in indexed_chunks() for log in chunk])
 
 
 @api_view(['POST'])
@@ -320,8 +446,10 @@ class MachineLogListView(APIView):
     """
     def get(self, request, format=None):
         machine_logs = MachineLog.objects.all()
-        serializer = MachineLogSerializer(machine_logs, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        chunks = machine_log_projection.rows(machine_logs)
+        if wants_stream(request):
+            return streaming_json_response(request, json_array(chunks))
+        return Response([log for chunk in chunks for log in chunk], status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 def operator_reports_by_name(request, operator_name):
@@ -341,159 +469,51 @@ def operator_reports_by_name(request, operator_name):
         - Needle runtime
         - Daily breakdown in table format
     """
-    try:
-        if operator_name == "All":
-            operator = Operator.objects.all()
-            logs = MachineLog.objects.all()
-        else:
-            # Fetch operator by name
-            operator = Operator.objects.get(operator_name=operator_name)
-            logs = MachineLog.objects.filter(OPERATOR_ID=operator.rfid_card_no)    
-       
-    except Operator.DoesNotExist:
-        return Response({"error": "Operator not found"}, status=404)
+    rfids = ()
+    if operator_name != "All":
+        # Resolve the operator name to its RFID card number(s)
+        rfids = operator_directory.rfids_of(operator_name)
+        if not rfids:
+            return Response({"error": "Operator not found"}, status=404)
 
     # Get date filters from query parameters
     from_date_str = request.GET.get('from_date', '')
     to_date_str = request.GET.get('to_date', '')
 
     # Apply date filtering if dates are provided
+    from_date = to_date = None
     if from_date_str:
         from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date()
-        logs = logs.filter(DATE__gte=from_date)
 
     if to_date_str:
         to_date = datetime.strptime(to_date_str, '%Y-%m-%d').date()
-        logs = logs.filter(DATE__lte=to_date)
-
-    # Exclude records where OPERATOR_ID is 0 AND MODE is 2
-    logs = logs.exclude(Q(OPERATOR_ID=0) & Q(MODE=2))
-
-    # Calculate duration in hours for each log entry with time constraints (8:25 AM to 7:35 PM)
-    logs = logs.annotate(
-        start_seconds=ExpressionWrapper(
-            ExtractHour('START_TIME') * 3600 + 
-            ExtractMinute('START_TIME') * 60 + 
-            ExtractSecond('START_TIME'),
-            output_field=FloatField()
-        ),
-        end_seconds=ExpressionWrapper(
-            ExtractHour('END_TIME') * 3600 + 
-            ExtractMinute('END_TIME') * 60 + 
-            ExtractSecond('END_TIME'),
-            output_field=FloatField()
-        ),
-        # Calculate adjusted start and end times within working hours (8:25 AM to 7:35 PM)
-        adjusted_start_seconds=Case(
-            When(start_seconds__lt=30300, then=Value(30300)),  # 8:25 AM (8.416667 * 3600)
-            When(start_seconds__gt=70500, then=Value(70500)),  # 7:35 PM (19.583333 * 3600)
-            default=F('start_seconds'),
-            output_field=FloatField()
-        ),
-        adjusted_end_seconds=Case(
-            When(end_seconds__lt=30300, then=Value(30300)),  # 8:25 AM (8.416667 * 3600)
-            When(end_seconds__gt=70500, then=Value(70500)),  # 7:35 PM (19.583333 * 3600)
-            default=F('end_seconds'),
-            output_field=FloatField()
-        ),
-        # Calculate duration only for the time within working hours
-        duration_hours=Case(
-            # Case when both start and end are outside working hours
-            When(
-                Q(end_seconds__lte=30300) | Q(start_seconds__gte=70500),
-                then=Value(0)
-            ),
-            # Case when log spans working hours
-            default=ExpressionWrapper(
-                (F('adjusted_end_seconds') - F('adjusted_start_seconds')) / 3600,
-                output_field=FloatField()
-            ),
-            output_field=FloatField()
-        ),
-        reserve_numeric=Cast('RESERVE', output_field=IntegerField())
-    ).filter(duration_hours__gt=0)  # Only include logs with positive duration within working hours
-
-    # Filter for working hours (8:25 AM to 7:35 PM)
-    logs = logs.filter(
-        start_seconds__gte=30300,  # 8:25 AM (8.416667 * 3600)
-        end_seconds__lte=70500     # 7:35 PM (19.583333 * 3600)
-    )
 
-    # Exclude specific break periods (entirely within these ranges)
-    logs = logs.exclude(
-        Q(start_seconds__gte=37800, end_seconds__lte=38400) |  # 10:30-10:40
-        Q(start_seconds__gte=48000, end_seconds__lte=50400) |  # 13:20-14:00
-        Q(start_seconds__gte=58800, end_seconds__lte=59400)    # 16:20-16:30
+    # Rollups of the operator(s), without records where OPERATOR_ID is 0 AND MODE is 2
+    logs = operator_rollups(rfids or None, from_date, to_date)
+
+    # Rollups only hold the working time of each log (shift hours without
+    # breaks, see working_time.py and rollups.py)
+
+    # Fetch the rollup rows once, every metric below is computed from them
+    columns = cached_report_columns(
+        'operator_reports_by_name', (operator_name, rfids), logs, from_date, to_date
     )
+    _, totals = columns.aggregate()
 
     # Calculate total working days
-    distinct_dates = logs.values('DATE').distinct()
-    total_working_days = distinct_dates.count()
+    date_keys, _ = columns.group('DATE')
+    working_dates = [date_entry for (date_entry,) in date_keys]
+    total_working_days = len(working_dates)
     
-    # Get today's date
-    today = datetime.now().date()
-    
-    # Calculate the total available hours dynamically
-    total_available_hours = 0
-    
-    for entry in distinct_dates:
-        date_entry = entry['DATE']
-        
-        # Check if this date is today
-        if date_entry == today:
-            # For today, calculate hours from 8:25 AM to current time
-            current_time = datetime.now().time()
-            current_seconds = current_time.hour * 3600 + current_time.minute * 60 + current_time.second
-            
-            # Start time is 8:25 AM (30300 seconds)
-            start_seconds = 30300
-            
-            # End time is the minimum of current time or end of workday (7:35 PM)
-            end_seconds = min(current_seconds, 70500)
-            
-            # If current time is before workday start, set hours to 0
-            if current_seconds < start_seconds:
-                day_hours = 0
-            else:
-                # Calculate hours for today
-                day_hours = (end_seconds - start_seconds) / 3600
-                
-                # Subtract break times if they've already passed
-                if current_seconds > 38400:  # After 10:40 AM
-                    day_hours -= 10/60  # Subtract 10 minutes for first break
-                
-                if current_seconds > 50400:  # After 2:00 PM
-                    day_hours -= 40/60  # Subtract 40 minutes for second break
-                
-                if current_seconds > 59400:  # After 4:30 PM
-                    day_hours -= 10/60  # Subtract 10 minutes for third break
-        else:
-            # For past dates, use the full day hours (8:25 AM to 7:35 PM minus breaks)
-            day_hours = (70500 - 30300) / 3600 - 1  # 10.17 hours
-        
-        total_available_hours += day_hours
+    # Available hours per day from the shift calendar, today counts up to now
+    available_hours = dict(zip(working_dates, shift_calendar.available_hours(working_dates).tolist()))
+    total_available_hours = sum(available_hours.values())
 
     # Calculate total hours for each mode
-    mode_hours = logs.values('MODE').annotate(
-        total_hours=Sum('duration_hours')
-    )
-
-    # Initialize hour counters
-    total_production_hours = 0
-    total_meeting_hours = 0
-    total_no_feeding_hours = 0
-    total_maintenance_hours = 0
-
-    # Sum hours for each mode
-    for mode in mode_hours:
-        if mode['MODE'] == 1:  # Sewing (Production)
-            total_production_hours = mode['total_hours'] or 0
-        elif mode['MODE'] == 4:  # Meeting
-            total_meeting_hours = mode['total_hours'] or 0
-        elif mode['MODE'] == 3:  # No Feeding
-            total_no_feeding_hours = mode['total_hours'] or 0
-        elif mode['MODE'] == 5:  # Maintenance
-            total_maintenance_hours = mode['total_hours'] or 0
+    total_production_hours = float(totals['mode_1_seconds'][0]) / 3600  # Sewing (Production)
+    total_meeting_hours = float(totals['mode_4_seconds'][0]) / 3600  # Meeting
+    total_no_feeding_hours = float(totals['mode_3_seconds'][0]) / 3600  # No Feeding
+    total_maintenance_hours = float(totals['mode_5_seconds'][0]) / 3600  # Maintenance
 
     # Calculate total idle hours
     total_idle_hours = max(total_available_hours - (
@@ -515,118 +535,40 @@ def operator_reports_by_name(request, operator_name):
     production_percentage = (total_production_hours / total_available_hours * 100) if total_available_hours > 0 else 0
     npt_percentage = (total_non_production_hours / total_available_hours * 100) if total_available_hours > 0 else 0
 
-    # Calculate Average Sewing Speed
-    valid_speed_logs = logs.filter(reserve_numeric__gt=0)
-    average_sewing_speed = valid_speed_logs.aggregate(
-        avg_speed=Avg('reserve_numeric')
-    )['avg_speed'] or 0
-
-    # Calculate total stitch count
-    total_stitch_count = logs.aggregate(
-        total=Sum('STITCH_COUNT', default=0)
-    )['total'] or 0
+    # Calculate Average Sewing Speed, total stitch count and Needle Runtime metrics
+    average_sewing_speed = ratio(totals['speed_sum'][0], totals['speed_count'][0])
+    total_stitch_count = int(totals['stitch_count'][0])
+    total_needle_runtime = float(totals['sewing_needle_runtime'][0])  # Only sewing mode logs
 
-    # Calculate Needle Runtime metrics
-    sewing_logs = logs.filter(MODE=1)  # Only sewing mode logs
-    total_needle_runtime = sewing_logs.aggregate(
-        total_runtime=Sum('NEEDLE_RUNTIME', default=0)
-    )['total_runtime'] or 0
-    
-    needle_runtime_instances = sewing_logs.count()
-    average_needle_runtime = total_needle_runtime / needle_runtime_instances if needle_runtime_instances > 0 else 0
+    needle_runtime_instances = totals['sewing_log_count'][0]
+    average_needle_runtime = ratio(total_needle_runtime, needle_runtime_instances)
     
     # Convert needle runtime from seconds to hours for percentage calculation
     total_needle_runtime_hours = total_needle_runtime / 3600
     needle_runtime_percentage = (total_needle_runtime_hours / total_production_hours * 100) if total_production_hours > 0 else 0
 
-    # Fetch Table Data (daily breakdown) - only group by DATE and OPERATOR_ID
-    table_data = logs.values('DATE', 'OPERATOR_ID').annotate(
-        sewing_hours=Sum(Case(
-            When(MODE=1, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        meeting_hours=Sum(Case(
-            When(MODE=4, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        no_feeding_hours=Sum(Case(
-            When(MODE=3, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        maintenance_hours=Sum(Case(
-            When(MODE=5, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        total_stitch_count=Sum('STITCH_COUNT'),
-        sewing_speed=Avg(Case(
-            When(reserve_numeric__gt=0, then=F('reserve_numeric')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        needle_runtime=Sum('NEEDLE_RUNTIME')
-    ).order_by('DATE', 'OPERATOR_ID')
+    # Table Data (daily breakdown) - only group by DATE and OPERATOR_ID
+    table_keys, table_totals = columns.aggregate('DATE', 'OPERATOR_ID')
     
     mode_description_mapping = MODES
 
-    # Now format the data, fetching operator name from the Operator model
+    # Now format the data, with the operator name from the operator directory
+    operator_names = operator_directory.names_by_rfid()
     formatted_table_data = []
-    for data in table_data:
-        # Get operator details from the Operator model
-        try:
-            operator = Operator.objects.get(rfid_card_no=data['OPERATOR_ID'])
-            operator_name = operator.operator_name
-            rfid_card_no = operator.rfid_card_no
-        except Operator.DoesNotExist:
-            operator_name = "Unknown"
-            rfid_card_no = "Unknown"
-        
-        # Get the date from the data
-        entry_date = data['DATE']
+    for i, (entry_date, operator_id) in enumerate(table_keys):
+        operator_name = operator_names.get(operator_id, "Unknown")
         
-        # Calculate total available hours for this day
-        day_total_hours = 0
-        
-        # Check if this date is today
-        if entry_date == today:
-            # For today, calculate hours from 8:25 AM to current time
-            current_time = datetime.now().time()
-            current_seconds = current_time.hour * 3600 + current_time.minute * 60 + current_time.second
-            
-            # Start time is 8:25 AM (30300 seconds)
-            start_seconds = 30300
-            
-            # End time is the minimum of current time or end of workday (7:35 PM)
-            end_seconds = min(current_seconds, 70500)
-            
-            # If current time is before workday start, set hours to 0
-            if current_seconds < start_seconds:
-                day_total_hours = 0
-            else:
-                # Calculate hours for today
-                day_total_hours = (end_seconds - start_seconds) / 3600
-                
-                # Subtract break times if they've already passed
-                if current_seconds > 38400:  # After 10:40 AM
-                    day_total_hours -= 10/60  # Subtract 10 minutes for first break
-                
-                if current_seconds > 50400:  # After 2:00 PM
-                    day_total_hours -= 40/60  # Subtract 40 minutes for second break
-                
-                if current_seconds > 59400:  # After 4:30 PM
-                    day_total_hours -= 10/60  # Subtract 10 minutes for third break
-        else:
-            # For past dates, use the full day hours (8:25 AM to 7:35 PM minus breaks)
-            day_total_hours = (70500 - 30300) / 3600 - 1  # 10.17 hours
+        # Total available hours for this day
+        day_total_hours = available_hours[entry_date]
         
         # Calculate sewing and non-sewing hours
-        sewing_hours = data['sewing_hours'] or 0
-        meeting_hours = data['meeting_hours'] or 0
-        no_feeding_hours = data['no_feeding_hours'] or 0
-        maintenance_hours = data['maintenance_hours'] or 0
+        sewing_hours = float(table_totals['mode_1_seconds'][i]) / 3600
+        meeting_hours = float(table_totals['mode_4_seconds'][i]) / 3600
+        no_feeding_hours = float(table_totals['mode_3_seconds'][i]) / 3600
+        maintenance_hours = float(table_totals['mode_5_seconds'][i]) / 3600
+
+        # Average speed over all logs of the day, logs without a speed count as 0
+        sewing_speed = ratio(table_totals['speed_sum'][i], table_totals['log_count'][i])
         
         # Calculate idle hours as the remainder
         idle_hours = max(day_total_hours - (sewing_hours + meeting_hours + no_feeding_hours + maintenance_hours), 0)
@@ -637,7 +579,7 @@ def operator_reports_by_name(request, operator_name):
         
         formatted_table_data.append({
             'Date': str(entry_date),
-            'Operator ID': data['OPERATOR_ID'],
+            'Operator ID': operator_id,
             'Operator Name': operator_name,
             'Total Hours': round(day_total_hours, 2),
             'Sewing Hours': round(sewing_hours, 2),
@@ -647,9 +589,9 @@ def operator_reports_by_name(request, operator_name):
             'Maintenance Hours': round(maintenance_hours, 2),
             'Productive Time in %': round(productive_time_percentage, 2),
             'NPT in %': round(npt_percentage, 2),
-            'Sewing Speed': round(data['sewing_speed'] or 0, 2),
-            'Stitch Count': data['total_stitch_count'] or 0,
-            'Needle Runtime': data['needle_runtime'] or 0
+            'Sewing Speed': round(sewing_speed, 2),
+            'Stitch Count': int(table_totals['stitch_count'][i]),
+            'Needle Runtime': float(table_totals['needle_runtime'][i])
         })
 
     return Response({
@@ -672,193 +614,25 @@ from django.db.models.functions import ExtractHour, ExtractMinute, ExtractSecond
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from datetime import datetime
-from .models import MachineLog
+from .models import MachineLog, MachineLogDailyRollup
+from .report_engine import ReportColumns, compute_line_report
 
-def process_line_data(logs, line_number):
-    """Helper function to process data for a single line"""
-    # Calculate total ideal hours (sum of all Mode 2 durations)
-    ideal_hours_data = logs.filter(MODE=2).aggregate(
-        total_ideal=Sum('duration_hours')
-    )
-    total_ideal_hours = ideal_hours_data['total_ideal'] or 0
-
-    # Get machine counts per day
-    daily_machine_counts = logs.values('DATE').annotate(
-        machine_count=Count('MACHINE_ID', distinct=True)
-    ).order_by('DATE')
-
-    # Calculate total working days and average machines per day
-    total_working_days = len(daily_machine_counts)
-    average_machines = sum(item['machine_count'] for item in daily_machine_counts) / total_working_days if total_working_days > 0 else 0
-
-    # Create a dictionary of date to machine count
-    date_machine_counts = {item['DATE']: item['machine_count'] for item in daily_machine_counts}
-
-    # Get aggregated data by date
-    daily_data = logs.values('DATE').annotate(
-        sewing_hours=Sum(Case(
-            When(MODE=1, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        no_feeding_hours=Sum(Case(
-            When(MODE=3, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        meeting_hours=Sum(Case(
-            When(MODE=4, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        maintenance_hours=Sum(Case(
-            When(MODE=5, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        idle_hours=Sum(Case(
-            When(MODE=2, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        total_stitch_count=Sum('STITCH_COUNT'),
-        sewing_speed=Avg(Case(
-            When(reserve_numeric__gt=0, then=F('reserve_numeric')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        needle_runtime=Sum('NEEDLE_RUNTIME')
-    ).order_by('DATE')
-
-    # Calculate totals
-    total_sewing_hours = 0
-    total_no_feeding_hours = 0
-    total_meeting_hours = 0
-    total_maintenance_hours = 0
-    total_idle_hours = 0
-    total_stitch_count = 0
-    total_needle_runtime = 0
-    total_hours = 0  # Sum of all actual hours (PT + NPT)
-
-    formatted_table_data = []
-    for data in daily_data:
-        date = data['DATE']
-        machine_count = date_machine_counts.get(date, 1)
-        
-        sewing_hours = data['sewing_hours'] or 0
-        no_feeding_hours = data['no_feeding_hours'] or 0
-        meeting_hours = data['meeting_hours'] or 0
-        maintenance_hours = data['maintenance_hours'] or 0
-        idle_hours = data['idle_hours'] or 0
-        
-        # Calculate PT and NPT
-        productive_time = sewing_hours
-        non_productive_time = no_feeding_hours + meeting_hours + maintenance_hours + idle_hours
-        daily_total_hours = productive_time + non_productive_time
-        
-        # Accumulate to total hours
-        total_hours += daily_total_hours
-        
-        # Calculate percentages
-        productive_time_percentage = (productive_time / daily_total_hours * 100) if daily_total_hours > 0 else 0
-        non_productive_time_percentage = (non_productive_time / daily_total_hours * 100) if daily_total_hours > 0 else 0
-        
-        formatted_table_data.append({
-            'Date': str(date),
-            'Sewing Hours (PT)': round(sewing_hours, 2),
-            'No Feeding Hours': round(no_feeding_hours, 2),
-            'Meeting Hours': round(meeting_hours, 2),
-            'Maintenance Hours': round(maintenance_hours, 2),
-            'Idle Hours': round(idle_hours, 2),
-            'Total Hours': round(daily_total_hours, 2),
-            'Productive Time (PT) %': round(productive_time_percentage, 2),
-            'Non-Productive Time (NPT) %': round(non_productive_time_percentage, 2),
-            'Sewing Speed': round(data['sewing_speed'], 2),
-            'Stitch Count': data['total_stitch_count'],
-            'Needle Runtime': data['needle_runtime'],
-            'Machine Count': machine_count
-        })
-
-        # Accumulate totals
-        total_sewing_hours += sewing_hours
-        total_no_feeding_hours += no_feeding_hours
-        total_meeting_hours += meeting_hours
-        total_maintenance_hours += maintenance_hours
-        total_idle_hours += idle_hours
-        total_stitch_count += data['total_stitch_count'] or 0
-        total_needle_runtime += data['needle_runtime'] or 0
-
-    # Calculate overall PT and NPT
-    total_productive_time = total_sewing_hours
-    total_non_productive_time = (
-        total_no_feeding_hours + 
-        total_meeting_hours + 
-        total_maintenance_hours + 
-        total_idle_hours
-    )
-    
-    # Calculate overall percentages
-    total_productive_percentage = (total_productive_time / total_hours * 100) if total_hours > 0 else 0
-    total_non_productive_percentage = (total_non_productive_time / total_hours * 100) if total_hours > 0 else 0
-    utilization_percentage = (total_hours / total_ideal_hours * 100) if total_ideal_hours > 0 else 0
-
-    # Calculate average sewing speed
-    valid_speed_logs = logs.filter(reserve_numeric__gt=0)
-    average_sewing_speed = valid_speed_logs.aggregate(
-        avg_speed=Avg('reserve_numeric')
-    )['avg_speed'] or 0
-
-    # Calculate needle runtime percentage
-    sewing_logs = logs.filter(MODE=1)
-    needle_runtime_instances = sewing_logs.count()
-    average_needle_runtime = total_needle_runtime / needle_runtime_instances if needle_runtime_instances > 0 else 0
-    total_needle_runtime_hours = total_needle_runtime / 3600
-    needle_runtime_percentage = (total_needle_runtime_hours / total_productive_time * 100) if total_productive_time > 0 else 0
-
-    return {
-        "lineNumber": line_number,
-        "totalIdealHours": round(total_ideal_hours, 2),
-        "utilizationPercentage": round(utilization_percentage, 2),
-        "totalWorkingDays": total_working_days,
-        "averageMachines": round(average_machines, 2),
-        "totalHours": round(total_hours, 2),
-        "totalProductiveTime": {
-            "hours": round(total_productive_time, 2),
-            "percentage": round(total_productive_percentage, 2)
-        },
-        "totalNonProductiveTime": {
-            "hours": round(total_non_productive_time, 2),
-            "percentage": round(total_non_productive_percentage, 2),
-            "breakdown": {
-                "noFeedingHours": round(total_no_feeding_hours, 2),
-                "meetingHours": round(total_meeting_hours, 2),
-                "maintenanceHours": round(total_maintenance_hours, 2),
-                "idleHours": round(total_idle_hours, 2)
-            }
-        },
-        "totalStitchCount": total_stitch_count,
-        "averageSewingSpeed": round(average_sewing_speed, 2),
-        "totalNeedleRuntime": round(average_needle_runtime, 2),
-        "needleRuntimePercentage": round(needle_runtime_percentage, 2),
-        "tableData": formatted_table_data
-    }
+def process_line_data(rollups, line_number):
+    """Helper function to process data for a single line from its daily rollups"""
+    return compute_line_report(ReportColumns.from_rollups(rollups), line_number)
 
 @api_view(['GET'])
 def line_reports(request, line_number):
     try:
-        # Get valid operator IDs from Operator model
-        valid_operators = Operator.objects.values_list('rfid_card_no', flat=True)
+        # Get valid operator IDs from the operator directory
+        valid_operators = operator_directory.valid_rfids()
         
         # Handle "all" case - convert line_number to string first
         line_number_str = str(line_number)
-        if line_number_str.lower() == 'all':
-            logs = MachineLog.objects.filter(OPERATOR_ID__in=valid_operators)
-            all_lines = True
-        else:
+        all_lines = line_number_str.lower() == 'all'
+        if not all_lines:
             # Convert back to integer if it's a numeric line number
             line_number = int(line_number_str)
-            logs = MachineLog.objects.filter(LINE_NUMB=line_number, OPERATOR_ID__in=valid_operators)
-            all_lines = False
     except MachineLog.DoesNotExist:
         return Response({"error": "Data not found"}, status=404)
     except ValueError:
@@ -869,52 +643,25 @@ def line_reports(request, line_number):
     to_date_str = request.GET.get('to_date', '')
 
     # Apply date filtering if dates are provided
+    from_date = to_date = None
     if from_date_str:
         from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date()
-        logs = logs.filter(DATE__gte=from_date)
 
     if to_date_str:
         to_date = datetime.strptime(to_date_str, '%Y-%m-%d').date()
-        logs = logs.filter(DATE__lte=to_date)
-
-    # Calculate duration in hours for each log entry
-    logs = logs.annotate(
-        start_seconds=ExpressionWrapper(
-            ExtractHour('START_TIME') * 3600 + 
-            ExtractMinute('START_TIME') * 60 + 
-            ExtractSecond('START_TIME'),
-            output_field=FloatField()
-        ),
-        end_seconds=ExpressionWrapper(
-            ExtractHour('END_TIME') * 3600 + 
-            ExtractMinute('END_TIME') * 60 + 
-            ExtractSecond('END_TIME'),
-            output_field=FloatField()
-        ),
-        duration_hours=ExpressionWrapper(
-            (F('end_seconds') - F('start_seconds')) / 3600,
-            output_field=FloatField()
-        ),
-        reserve_numeric=Cast('RESERVE', output_field=IntegerField())
-    )
 
-    # Filter for working hours (8:25 AM to 7:35 PM)
-    logs = logs.filter(
-        start_seconds__gte=30300,  # 8:25 AM (8.416667 * 3600)
-        end_seconds__lte=70500     # 7:35 PM (19.583333 * 3600)
-    )
+    logs = daily_rollups(from_date, to_date, valid_operators, line_number=None if all_lines else line_number)
 
-    # Exclude specific break periods (entirely within these ranges)
-    logs = logs.exclude(
-        Q(start_seconds__gte=37800, end_seconds__lte=38400) |  # 10:30-10:40
-        Q(start_seconds__gte=48000, end_seconds__lte=50400) |  # 13:20-14:00
-        Q(start_seconds__gte=58800, end_seconds__lte=59400)    # 16:20-16:30
-    )
+    # Rollups only hold the working time of each log (shift hours without
+    # breaks, see working_time.py and rollups.py)
 
     # For "all" case, we'll group by line number
     if all_lines:
-        # Get distinct line numbers
-        line_numbers = logs.order_by('LINE_NUMB').values_list('LINE_NUMB', flat=True).distinct()
+        # Fetch the rollup rows of every line with one query and split them
+        # by line in memory, instead of running one set of queries per line
+        columns_by_line = cached_report_columns(
+            'line_reports', ('all', valid_operators), logs, from_date, to_date
+        ).partition('LINE_NUMB')
         
         all_line_reports = []
         summary_data = {
@@ -933,11 +680,9 @@ def line_reports(request, line_number):
         speed_count = 0
         needle_runtime_count = 0
         
-        for line_num in line_numbers:
-            line_logs = logs.filter(LINE_NUMB=line_num)
-            
+        for line_num, line_columns in columns_by_line:
             # Process data for this line (similar to single line processing)
-            line_report = process_line_data(line_logs, str(line_num))
+            line_report = compute_line_report(line_columns, str(line_num))
             all_line_reports.append(line_report)
             
             # Accumulate summary data
@@ -988,7 +733,10 @@ def line_reports(request, line_number):
         })
     else:
         # Process single line data
-        line_report = process_line_data(logs, str(line_number))
+        columns = cached_report_columns(
+            'line_reports', (str(line_number), valid_operators), logs, from_date, to_date
+        )
+        line_report = compute_line_report(columns, str(line_number))
         return Response(line_report)
 
 from django.db.models import Sum, Case, When, Value, FloatField, F, ExpressionWrapper, Q, IntegerField, Avg, Count
@@ -996,164 +744,38 @@ from django.db.models.functions import ExtractHour, ExtractMinute, ExtractSecond
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from datetime import datetime
-from .models import MachineLog
+from .models import MachineLog, MachineLogDailyRollup, MachineLogHourlyRollup
+from .report_engine import ReportColumns, compute_machine_report
+from .shift_calendar import shift_calendar, shift_hours
 
-def process_machine_data(logs, machine_id):
-    """Helper function to process data for a single machine"""
-    # Calculate total working days and available hours (11 hours per day)
-    distinct_dates = logs.dates('DATE', 'day')
-    total_working_days = distinct_dates.count()
-    total_available_hours = total_working_days * 11
-
-    # Get aggregated data by date
-    daily_data = logs.values('DATE').annotate(
-        sewing_hours=Sum(Case(
-            When(MODE=1, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        no_feeding_hours=Sum(Case(
-            When(MODE=3, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        meeting_hours=Sum(Case(
-            When(MODE=4, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        maintenance_hours=Sum(Case(
-            When(MODE=5, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        idle_hours=Sum(Case(
-            When(MODE=2, then=F('duration_hours')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        total_stitch_count=Sum('STITCH_COUNT'),
-        sewing_speed=Avg(Case(
-            When(reserve_numeric__gt=0, then=F('reserve_numeric')),
-            default=Value(0),
-            output_field=FloatField()
-        )),
-        needle_runtime=Sum('NEEDLE_RUNTIME')
-    ).order_by('DATE')
+def process_machine_data(rollups, machine_id):
+    """Helper function to process data for a single machine from its daily rollups"""
+    return compute_machine_report(ReportColumns.from_rollups(rollups), machine_id)
 
-    # Calculate totals
-    total_sewing_hours = 0
-    total_no_feeding_hours = 0
-    total_meeting_hours = 0
-    total_maintenance_hours = 0
-    total_idle_hours = 0
-    total_stitch_count = 0
-    total_needle_runtime = 0
-    total_hours = 0
-
-    formatted_table_data = []
-    for data in daily_data:
-        sewing_hours = data['sewing_hours'] or 0
-        no_feeding_hours = data['no_feeding_hours'] or 0
-        meeting_hours = data['meeting_hours'] or 0
-        maintenance_hours = data['maintenance_hours'] or 0
-        idle_hours = data['idle_hours'] or 0
-        
-        # Calculate PT and NPT
-        productive_time = sewing_hours
-        non_productive_time = no_feeding_hours + meeting_hours + maintenance_hours + idle_hours
-        daily_total_hours = productive_time + non_productive_time
-        
-        # Accumulate to total hours
-        total_hours += daily_total_hours
-        
-        # Calculate percentages
-        productive_time_percentage = (productive_time / daily_total_hours * 100) if daily_total_hours > 0 else 0
-        non_productive_time_percentage = (non_productive_time / daily_total_hours * 100) if daily_total_hours > 0 else 0
-        
-        formatted_table_data.append({
-            'Date': str(data['DATE']),
-            'Sewing Hours (PT)': round(sewing_hours, 2),
-            'No Feeding Hours': round(no_feeding_hours, 2),
-            'Meeting Hours': round(meeting_hours, 2),
-            'Maintenance Hours': round(maintenance_hours, 2),
-            'Idle Hours': round(idle_hours, 2),
-            'Total Hours': round(daily_total_hours, 2),
-            'Productive Time (PT) %': round(productive_time_percentage, 2),
-            'Non-Productive Time (NPT) %': round(non_productive_time_percentage, 2),
-            'Sewing Speed': round(data['sewing_speed'], 2),
-            'Stitch Count': data['total_stitch_count'],
-            'Needle Runtime': data['needle_runtime'],
-            'Machine ID': machine_id
-        })
+def all_machine_reports_from(columns):
+    """
+    Reports of every machine in the rollup columns, ordered by machine ID.
 
-        # Accumulate totals
-        total_sewing_hours += sewing_hours
-        total_no_feeding_hours += no_feeding_hours
-        total_meeting_hours += meeting_hours
-        total_maintenance_hours += maintenance_hours
-        total_idle_hours += idle_hours
-        total_stitch_count += data['total_stitch_count'] or 0
-        total_needle_runtime += data['needle_runtime'] or 0
-
-    # Calculate overall PT and NPT
-    total_productive_time = total_sewing_hours
-    total_non_productive_time = (
-        total_no_feeding_hours + 
-        total_meeting_hours + 
-        total_maintenance_hours + 
-        total_idle_hours
-    )
-    
-    # Calculate overall percentages
-    total_productive_percentage = (total_productive_time / total_hours * 100) if total_hours > 0 else 0
-    total_non_productive_percentage = (total_non_productive_time / total_hours * 100) if total_hours > 0 else 0
-
-    # Calculate average sewing speed
-    valid_speed_logs = logs.filter(reserve_numeric__gt=0)
-    average_sewing_speed = valid_speed_logs.aggregate(
-        avg_speed=Avg('reserve_numeric')
-    )['avg_speed'] or 0
-
-    return {
-        "machineId": machine_id,
-        "totalAvailableHours": total_available_hours,
-        "totalWorkingDays": total_working_days,
-        "totalHours": round(total_hours, 2),
-        "totalProductiveTime": {
-            "hours": round(total_productive_time, 2),
-            "percentage": round(total_productive_percentage, 2)
-        },
-        "totalNonProductiveTime": {
-            "hours": round(total_non_productive_time, 2),
-            "percentage": round(total_non_productive_percentage, 2),
-            "breakdown": {
-                "noFeedingHours": round(total_no_feeding_hours, 2),
-                "meetingHours": round(total_meeting_hours, 2),
-                "maintenanceHours": round(total_maintenance_hours, 2),
-                "idleHours": round(total_idle_hours, 2)
-            }
-        },
-        "totalStitchCount": total_stitch_count,
-        "averageSewingSpeed": round(average_sewing_speed, 2),
-        "totalNeedleRuntime": round(total_needle_runtime, 2),
-        "tableData": formatted_table_data
-    }
+    The rollup rows are fetched once and split by machine in memory,
+    instead of running one set of queries per machine.
+    """
+    reports = []
+    for machine_id, machine_columns in columns.partition('MACHINE_ID'):
+        try:
+            reports.append(compute_machine_report(machine_columns, machine_id))
+        except Exception as e:
+            print(f"Error processing machine {machine_id}: {str(e)}")
+    return reports
 
 @api_view(['GET'])
 def machine_reports(request, machine_id):
     try:
-        # Get valid operator IDs from Operator model
-        valid_operators = Operator.objects.values_list('rfid_card_no', flat=True)
+        # Get valid operator IDs from the operator directory
+        valid_operators = operator_directory.valid_rfids()
         
         # Handle "all" case - convert machine_id to string first
         machine_id_str = str(machine_id)
-        if machine_id_str.lower() == 'all':
-            logs = MachineLog.objects.filter(OPERATOR_ID__in=valid_operators)
-            all_machines = True
-        else:
-            logs = MachineLog.objects.filter(MACHINE_ID=machine_id, OPERATOR_ID__in=valid_operators)
-            all_machines = False
+        all_machines = machine_id_str.lower() == 'all'
     except MachineLog.DoesNotExist:
         return Response({"error": "Data not found"}, status=404)
     except ValueError:
@@ -1164,61 +786,23 @@ def machine_reports(request, machine_id):
     to_date_str = request.GET.get('to_date', '')
 
     # Apply date filtering if dates are provided
+    from_date = to_date = None
     if from_date_str:
         from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date()
-        logs = logs.filter(DATE__gte=from_date)
 
     if to_date_str:
         to_date = datetime.strptime(to_date_str, '%Y-%m-%d').date()
-        logs = logs.filter(DATE__lte=to_date)
-
-    # Calculate duration in hours for each log entry
-    logs = logs.annotate(
-        start_seconds=ExpressionWrapper(
-            ExtractHour('START_TIME') * 3600 + 
-            ExtractMinute('START_TIME') * 60 + 
-            ExtractSecond('START_TIME'),
-            output_field=FloatField()
-        ),
-        end_seconds=ExpressionWrapper(
-            ExtractHour('END_TIME') * 3600 + 
-            ExtractMinute('END_TIME') * 60 + 
-            ExtractSecond('END_TIME'),
-            output_field=FloatField()
-        ),
-        duration_hours=ExpressionWrapper(
-            (F('end_seconds') - F('start_seconds')) / 3600,
-            output_field=FloatField()
-        ),
-        reserve_numeric=Cast('RESERVE', output_field=IntegerField())
-    )
 
-    # Filter for working hours (8:25 AM to 7:35 PM)
-    logs = logs.filter(
-        start_seconds__gte=30300,  # 8:25 AM (8.416667 * 3600)
-        end_seconds__lte=70500     # 7:35 PM (19.583333 * 3600)
-    )
+    logs = daily_rollups(from_date, to_date, valid_operators, machine_id=None if all_machines else machine_id)
 
-    # Exclude specific break periods (entirely within these ranges)
-    logs = logs.exclude(
-        Q(start_seconds__gte=37800, end_seconds__lte=38400) |  # 10:30-10:40
-        Q(start_seconds__gte=48000, end_seconds__lte=50400) |  # 13:20-14:00
-        Q(start_seconds__gte=58800, end_seconds__lte=59400)    # 16:20-16:30
-    )
+    # Rollups only hold the working time of each log (shift hours without
+    # breaks, see working_time.py and rollups.py)
 
     # For "all" case, we'll group by machine ID
     if all_machines:
-        # Get distinct machine IDs
-        machine_ids = logs.order_by('MACHINE_ID').values_list('MACHINE_ID', flat=True).distinct()
-        
-        all_machine_reports = []
-        
-        for machine_id in machine_ids:
-            machine_logs = logs.filter(MACHINE_ID=machine_id)
-            
-            # Process data for this machine
-            machine_report = process_machine_data(machine_logs, machine_id)
-            all_machine_reports.append(machine_report)
+        all_machine_reports = all_machine_reports_from(
+            cached_report_columns('machine_reports', ('all', valid_operators), logs, from_date, to_date)
+        )
         
         return Response({
             "allMachinesReport": all_machine_reports,
@@ -1226,16 +810,18 @@ def machine_reports(request, machine_id):
         })
     else:
         # Process single machine data
-        machine_report = process_machine_data(logs, machine_id)
+        columns = cached_report_columns(
+            'machine_reports', (machine_id_str, valid_operators), logs, from_date, to_date
+        )
+        machine_report = compute_machine_report(columns, machine_id)
         return Response(machine_report)
 
 
 @api_view(['GET'])
 def all_machines_report(request):
     try:
-        # Get valid operator IDs from Operator model
-        valid_operators = Operator.objects.values_list('rfid_card_no', flat=True)
-        logs = MachineLog.objects.filter(OPERATOR_ID__in=valid_operators)
+        # Get valid operator IDs from the operator directory
+        valid_operators = operator_directory.valid_rfids()
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
@@ -1244,63 +830,27 @@ def all_machines_report(request):
     to_date_str = request.GET.get('to_date', '')
 
     # Apply date filtering if dates are provided
+    from_date = to_date = None
     if from_date_str:
         try:
             from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date()
-            logs = logs.filter(DATE__gte=from_date)
         except ValueError:
             return Response({"error": "Invalid from_date format. Use YYYY-MM-DD"}, status=400)
 
     if to_date_str:
         try:
             to_date = datetime.strptime(to_date_str, '%Y-%m-%d').date()
-            logs = logs.filter(DATE__lte=to_date)
         except ValueError:
             return Response({"error": "Invalid to_date format. Use YYYY-MM-DD"}, status=400)
 
-    # Calculate duration in hours for each log entry
-    logs = logs.annotate(
-        start_seconds=ExpressionWrapper(
-            ExtractHour('START_TIME') * 3600 + 
-            ExtractMinute('START_TIME') * 60 + 
-            ExtractSecond('START_TIME'),
-            output_field=FloatField()
-        ),
-        end_seconds=ExpressionWrapper(
-            ExtractHour('END_TIME') * 3600 + 
-            ExtractMinute('END_TIME') * 60 + 
-            ExtractSecond('END_TIME'),
-            output_field=FloatField()
-        ),
-        duration_hours=ExpressionWrapper(
-            (F('end_seconds') - F('start_seconds')) / 3600,
-            output_field=FloatField()
-        ),
-        reserve_numeric=Cast('RESERVE', output_field=IntegerField())
-    ).filter(
-        start_seconds__gte=30300,  # 8:25 AM (8.416667 * 3600)
-        end_seconds__lte=70500     # 7:35 PM (19.583333 * 3600)
-    ).exclude(
-        Q(start_seconds__gte=37800, end_seconds__lte=38400) |  # 10:30-10:40
-        Q(start_seconds__gte=48000, end_seconds__lte=50400) |  # 13:20-14:00
-        Q(start_seconds__gte=58800, end_seconds__lte=59400)    # 16:20-16:30
-    )
+    logs = daily_rollups(from_date, to_date, valid_operators)
 
-    # Get distinct machine IDs
-    machine_ids = logs.order_by('MACHINE_ID').values_list('MACHINE_ID', flat=True).distinct()
-    
-    all_machine_reports = []
-    
-    for machine_id in machine_ids:
-        machine_logs = logs.filter(MACHINE_ID=machine_id)
-        
-        # Process data for this machine
-        try:
-            machine_report = process_machine_data(machine_logs, machine_id)
-            all_machine_reports.append(machine_report)
-        except Exception as e:
-            print(f"Error processing machine {machine_id}: {str(e)}")
-            continue
+    # Rollups only hold the working time of each log (shift hours without
+    # breaks, see working_time.py and rollups.py)
+
+    all_machine_reports = all_machine_reports_from(
+        cached_report_columns('machine_reports', ('all', valid_operators), logs, from_date, to_date)
+    )
     
     return Response({
         "allMachinesReport": all_machine_reports,
@@ -1308,6 +858,95 @@ def all_machines_report(request):
         "from_date": from_date_str,
         "to_date": to_date_str
     })
+
+
+@api_view(['GET'])
+def intraday_utilization(request):
+    """
+    Hour-by-hour sewing and non-productive hours for one day.
+
+    Query parameters:
+        - date: Day to report (YYYY-MM-DD), defaults to today
+        - group_by: 'line' (default) or 'machine'
+        - line_number / machine_id: Optional filter on a single line or machine
+
+    Returns a line x hour or machine x hour matrix read from the hourly
+    rollups, covering the hours of the reported lines' shifts that day.
+    """
+    date_str = request.GET.get('date', '')
+    try:
+        report_date = datetime.strptime(date_str, '%Y-%m-%d').date() if date_str else datetime.now().date()
+    except ValueError:
+        return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
+
+    group_by = request.GET.get('group_by', 'line')
+    if group_by not in ('line', 'machine'):
+        return Response({"error": "group_by must be 'line' or 'machine'"}, status=400)
+    group_field, key_name = ('LINE_NUMB', 'lineNumber') if group_by == 'line' else ('MACHINE_ID', 'machineId')
+
+    # Get valid operator IDs from the operator directory
+    valid_operators = operator_directory.valid_rfids()
+    line_number = request.GET.get('line_number', '')
+    machine_id = request.GET.get('machine_id', '')
+    logs = hourly_rollups(report_date, valid_operators, line_number or None, machine_id or None)
+
+    hourly_data = hourly_totals(logs, group_field)
+
+    # Hours of the day covered by the shift pattern of any reported line
+    lines = set(logs.values_list('LINE_NUMB', flat=True).order_by().distinct()) or {line_number or None}
+    hours = sorted(set().union(*(
+        shift_hours(shift_calendar.pattern_for(report_date, line)) for line in lines
+    )))
+
+    matrix = {}
+    for data in hourly_data:
+        cells = matrix.setdefault(data[group_field], {})
+
+        sewing_hours = (data['sewing_seconds'] or 0) / 3600
+        no_feeding_hours = (data['no_feeding_seconds'] or 0) / 3600
+        meeting_hours = (data['meeting_seconds'] or 0) / 3600
+        maintenance_hours = (data['maintenance_seconds'] or 0) / 3600
+        idle_hours = (data['idle_seconds'] or 0) / 3600
+        total_hours = sewing_hours + no_feeding_hours + meeting_hours + maintenance_hours + idle_hours
+
+        cells[data['HOUR']] = {
+            'Sewing Hours (PT)': round(sewing_hours, 2),
+            'No Feeding Hours': round(no_feeding_hours, 2),
+            'Meeting Hours': round(meeting_hours, 2),
+            'Maintenance Hours': round(maintenance_hours, 2),
+            'Idle Hours': round(idle_hours, 2),
+            'Total Hours': round(total_hours, 2),
+            'Productive Time (PT) %': round(sewing_hours / total_hours * 100, 2) if total_hours > 0 else 0,
+            'Machine Count': data['machine_count']
+        }
+
+    empty_cell = {
+        'Sewing Hours (PT)': 0,
+        'No Feeding Hours': 0,
+        'Meeting Hours': 0,
+        'Maintenance Hours': 0,
+        'Idle Hours': 0,
+        'Total Hours': 0,
+        'Productive Time (PT) %': 0,
+        'Machine Count': 0
+    }
+    rows = [
+        {
+            key_name: key,
+            'hours': [
+                {'hour': f"{hour:02d}:00", **cells.get(hour, empty_cell)}
+                for hour in hours
+            ]
+        }
+        for key, cells in matrix.items()
+    ]
+
+    return Response({
+        "date": str(report_date),
+        "groupBy": group_by,
+        "hours": [f"{hour:02d}:00" for hour in hours],
+        "rows": rows
+    })
 @api_view(['GET'])
 def operator_reports_all(request):
     """
@@ -1323,92 +962,47 @@ def operator_reports_all(request):
         - Production vs non-production hours
         - Efficiency percentages
     """
-    operators = Operator.objects.all()
+    operators = operator_directory.names_by_rfid()
     from_date_str = request.GET.get('from_date', '')
     to_date_str = request.GET.get('to_date', '')
 
-    all_operators_data = []
+    # Apply date filtering if dates are provided
+    from_date = to_date = None
+    if from_date_str:
+        from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date()
 
-    for operator in operators:
-        logs = MachineLog.objects.filter(OPERATOR_ID=operator.rfid_card_no)
+    if to_date_str:
+        to_date = datetime.strptime(to_date_str, '%Y-%m-%d').date()
 
-        # Apply date filtering if dates are provided
-        if from_date_str:
-            from_date = datetime.strptime(from_date_str, '%Y-%m-%d').date()
-            logs = logs.filter(DATE__gte=from_date)
+    # One grouped query over the rollups of every registered operator, fetched
+    # together instead of per operator: sewing seconds per operator and working day
+    daily_seconds = operator_daily_seconds(operators.keys(), from_date, to_date)
 
-        if to_date_str:
-            to_date = datetime.strptime(to_date_str, '%Y-%m-%d').date()
-            logs = logs.filter(DATE__lte=to_date)
-
-        # Exclude records where OPERATOR_ID is 0 AND MODE is 2
-        logs = logs.exclude(Q(OPERATOR_ID=0) & Q(MODE=2))
-
-        # Calculate duration in hours
-        logs = logs.annotate(
-            start_seconds=ExpressionWrapper(
-                ExtractHour('START_TIME') * 3600 +
-                ExtractMinute('START_TIME') * 60 +
-                ExtractSecond('START_TIME'),
-                output_field=FloatField()
-            ),
-            end_seconds=ExpressionWrapper(
-                ExtractHour('END_TIME') * 3600 +
-                ExtractMinute('END_TIME') * 60 +
-                ExtractSecond('END_TIME'),
-                output_field=FloatField()
-            ),
-            adjusted_start_seconds=Case(
-                When(start_seconds__lt=8.5 * 3600, then=Value(8.5 * 3600)),
-                When(start_seconds__gt=19.5 * 3600, then=Value(19.5 * 3600)),
-                default=F('start_seconds'),
-                output_field=FloatField()
-            ),
-            adjusted_end_seconds=Case(
-                When(end_seconds__lt=8.5 * 3600, then=Value(8.5 * 3600)),
-                When(end_seconds__gt=19.5 * 3600, then=Value(19.5 * 3600)),
-                default=F('end_seconds'),
-                output_field=FloatField()
-            ),
-            duration_hours=Case(
-                When(
-                    Q(end_seconds__lte=8.5 * 3600) | Q(start_seconds__gte=19.5 * 3600),
-                    then=Value(0)
-                ),
-                default=ExpressionWrapper(
-                    (F('adjusted_end_seconds') - F('adjusted_start_seconds')) / 3600,
-                    output_field=FloatField()
-                ),
-                output_field=FloatField()
-            )
-        ).filter(duration_hours__gt=0)
-
-        # Filter out break times
-        logs = logs.exclude(
-            Q(start_seconds__gte=10.5 * 3600, end_seconds__lte=10.6667 * 3600) |
-            Q(start_seconds__gte=13.3333 * 3600, end_seconds__lte=14 * 3600) |
-            Q(start_seconds__gte=16.3333 * 3600, end_seconds__lte=16.5 * 3600)
-        )
+    working_dates = defaultdict(list)
+    production_hours = defaultdict(float)
+    for row in daily_seconds:
+        working_dates[row['OPERATOR_ID']].append(row['DATE'])
+        production_hours[row['OPERATOR_ID']] += (row['production_seconds'] or 0) / 3600
 
-        # Calculate metrics
-        total_working_days = logs.values('DATE').distinct().count()
-        total_available_hours = total_working_days * 10
+    # Available hours of every date in the range from the shift calendar
+    all_dates = sorted({log_date for dates in working_dates.values() for log_date in dates})
+    available_hours = dict(zip(all_dates, shift_calendar.available_hours(all_dates).tolist()))
 
-        mode_hours = logs.values('MODE').annotate(
-            total_hours=Sum('duration_hours')
-        )
+    # Operators without logs in the range are reported with zero hours
+    all_operators_data = []
+    for rfid_card_no, operator_name in operators.items():
+        # Calculate metrics
+        total_available_hours = sum(available_hours[log_date] for log_date in working_dates.get(rfid_card_no, ()))
 
-        total_production_hours = sum(
-            mode['total_hours'] for mode in mode_hours if mode['MODE'] == 1
-        )
+        total_production_hours = production_hours.get(rfid_card_no, 0)
         total_non_production_hours = total_available_hours - total_production_hours
 
         production_percentage = (total_production_hours / total_available_hours * 100) if total_available_hours > 0 else 0
         npt_percentage = 100 - production_percentage
 
         all_operators_data.append({
-            "operatorId": operator.rfid_card_no,
-            "operatorName": operator.operator_name,
+            "operatorId": rfid_card_no,
+            "operatorName": operator_name,
             "totalProductionHours": round(total_production_hours, 2),
             "totalNonProductionHours": round(total_non_production_hours, 2),
             "productionPercentage": round(production_percentage, 2),
@@ -1435,35 +1029,46 @@ def filter_logs(request):
     from_date = request.GET.get('from_date')
     to_date = request.GET.get('to_date')
     
-    queryset = MachineLog.objects.all()
-    
+    archive_filters = {}
     if line_number and line_number.lower() != 'all':
-        queryset = queryset.filter(LINE_NUMB=line_number)
-    
-    if from_date:
-        queryset = queryset.filter(DATE__gte=from_date)
+        archive_filters['LINE_NUMB'] = line_number
     
-    if to_date:
-        queryset = queryset.filter(DATE__lte=to_date)
+    queryset = machine_logs(from_date, to_date, line_number=archive_filters.get('LINE_NUMB'))
     
-    # Prefetch operator data to optimize queries
-    logs = list(queryset)
-    operator_ids = set(log.OPERATOR_ID for log in logs if log.OPERATOR_ID != "0")
-    operators = Operator.objects.filter(rfid_card_no__in=operator_ids)
-    operator_map = {op.rfid_card_no: op.operator_name for op in operators}
+    operator_map = operator_directory.names_by_rfid()
     
-    data = []
-    for log in logs:
-        log_data = {
+    def log_data(log):
+        data = {
             **log.__dict__,
             'mode_description': MODES.get(log.MODE, 'Unknown mode'),
             'operator_name': operator_map.get(log.OPERATOR_ID, "") if log.OPERATOR_ID != "0" else ""
         }
         # Remove Django internal fields
-        log_data.pop('_state', None)
-        data.append(log_data)
+        data.pop('_state', None)
+        return data
     
-    return Response(data)
+    # One page of logs, the archive continues after the hot logs
+    if 'limit' in request.GET:
+        archive = dict(from_date=from_date, to_date=to_date, **archive_filters)
+        try:
+            page = page_logs(queryset, parse_limit(request.GET['limit']), request.GET.get('cursor'), archive)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        results = [log for chunk in log_dict_rows(page.hot_logs, MODES, operator_map) for log in chunk]
+        results.extend(map(log_data, page.archived_logs))
+        for index, log in enumerate(results, start=page.first_index):
+            log['index'] = index
+        return Response({"results": results, "next": page.next_cursor})
+    
+    # Dates older than the hot window come from the Parquet archive
+    chunks = chain(
+        chunked(map(log_data, iter_archived_logs(from_date, to_date, **archive_filters))),
+        log_dict_rows(queryset, MODES, operator_map)
+    )
+    if wants_stream(request):
+        return streaming_json_response(request, json_array(chunks))
+    
+    return Response([log for chunk in chunks for log in chunk])
 
 
 @api_view(['GET'])
@@ -1472,35 +1077,46 @@ def filter_logs_by_machine_id(request):
     from_date = request.GET.get('from_date')
     to_date = request.GET.get('to_date')
     
-    queryset = MachineLog.objects.all()
-    
+    archive_filters = {}
     if machine_id and machine_id.lower() != 'all':
-        queryset = queryset.filter(MACHINE_ID=machine_id)
+        archive_filters['MACHINE_ID'] = machine_id
     
-    if from_date:
-        queryset = queryset.filter(DATE__gte=from_date)
+    queryset = machine_logs(from_date, to_date, machine_id=archive_filters.get('MACHINE_ID'))
     
-    if to_date:
-        queryset = queryset.filter(DATE__lte=to_date)
+    operator_map = operator_directory.names_by_rfid()
     
-    # Prefetch operator data to optimize queries
-    logs = list(queryset)
-    operator_ids = set(log.OPERATOR_ID for log in logs if log.OPERATOR_ID != "0")
-    operators = Operator.objects.filter(rfid_card_no__in=operator_ids)
-    operator_map = {op.rfid_card_no: op.operator_name for op in operators}
-    
-    data = []
-    for log in logs:
-        log_data = {
+    def log_data(log):
+        data = {
             **log.__dict__,
             'mode_description': MODES.get(log.MODE, 'Unknown mode'),
             'operator_name': operator_map.get(log.OPERATOR_ID, "") if log.OPERATOR_ID != "0" else ""
         }
         # Remove Django internal fields
-        log_data.pop('_state', None)
-        data.append(log_data)
+        data.pop('_state', None)
+        return data
+    
+    # One page of logs, the archive continues after the hot logs
+    if 'limit' in request.GET:
+        archive = dict(from_date=from_date, to_date=to_date, **archive_filters)
+        try:
+            page = page_logs(queryset, parse_limit(request.GET['limit']), request.GET.get('cursor'), archive)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        results = [log for chunk in log_dict_rows(page.hot_logs, MODES, operator_map) for log in chunk]
+        results.extend(map(log_data, page.archived_logs))
+        for index, log in enumerate(results, start=page.first_index):
+            log['index'] = index
+        return Response({"results": results, "next": page.next_cursor})
+    
+    # Dates older than the hot window come from the Parquet archive
+    chunks = chain(
+        chunked(map(log_data, iter_archived_logs(from_date, to_date, **archive_filters))),
+        log_dict_rows(queryset, MODES, operator_map)
+    )
+    if wants_stream(request):
+        return streaming_json_response(request, json_array(chunks))
     
-    return Response(data)
+    return Response([log for chunk in chunks for log in chunk])
 
 @api_view(['GET'])
 def get_line_numbers(request):
@@ -1543,7 +1159,7 @@ def get_machine_ids(request):
 # views.py
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from django.db.models import Sum, Count, Avg
+from django.db.models import Sum, Count, Avg, Q
 from datetime import timedelta
 
 
@@ -1576,68 +1192,38 @@ def operator_report(request, operator_id):
     from_date = request.GET.get('from_date')
     to_date = request.GET.get('to_date')
     
-    queryset = MachineLog.objects.filter(OPERATOR_ID=operator_id)
-    
-    if from_date:
-        queryset = queryset.filter(DATE__gte=from_date)
-    if to_date:
-        queryset = queryset.filter(DATE__lte=to_date)
+    queryset = operator_logs(operator_id, from_date, to_date)
     
     # Get operator name
-    operator_name = ""
-    try:
-        operator = Operator.objects.get(rfid_card_no=operator_id)
-        operator_name = operator.operator_name
-    except Operator.DoesNotExist:
-        pass
+    operator_name = operator_directory.name_of(operator_id, "")
+    
+    totals_only = request.GET.get('totals_only', '').lower() in ('1', 'true', 'yes')
+    if totals_only:
+        # Lightweight mode: one aggregate over the whole range, no daily table
+        daily_data = []
+        totals = queryset.aggregate(**OPERATOR_MODE_TOTALS)
+    else:
+        # Prepare daily data, the totals are summed from the daily rows
+        daily_data = list(operator_daily_totals(queryset))
+        totals = {
+            key: sum(day[key] or 0 for day in daily_data)
+            for key in OPERATOR_MODE_TOTALS
+        }
     
     # Calculate totals
-    total_hours = queryset.aggregate(
-        total_hours=Sum('NEEDLE_RUNTIME')
-    )['total_hours'] or 0
-    
-    productive_hours = queryset.filter(MODE=1).aggregate(
-        total=Sum('NEEDLE_RUNTIME')
-    )['total'] or 0
-    
-    no_feeding_hours = queryset.filter(MODE=3).aggregate(
-        total=Sum('NEEDLE_RUNTIME')
-    )['total'] or 0
-    
-    meeting_hours = queryset.filter(MODE=4).aggregate(
-        total=Sum('NEEDLE_RUNTIME')
-    )['total'] or 0
-    
-    maintenance_hours = queryset.filter(MODE=5).aggregate(
-        total=Sum('NEEDLE_RUNTIME')
-    )['total'] or 0
-    
-    idle_hours = queryset.filter(MODE=2).aggregate(
-        total=Sum('NEEDLE_RUNTIME')
-    )['total'] or 0
-    
-    total_stitch_count = queryset.aggregate(
-        total=Sum('STITCH_COUNT')
-    )['total'] or 0
-    
-    # Prepare daily data
-    daily_data = queryset.values('DATE').annotate(
-        sewing_hours=Sum('NEEDLE_RUNTIME', filter=operator.Q(MODE=1)),
-        no_feeding_hours=Sum('NEEDLE_RUNTIME', filter=operator.Q(MODE=3)),
-        meeting_hours=Sum('NEEDLE_RUNTIME', filter=operator.Q(MODE=4)),
-        maintenance_hours=Sum('NEEDLE_RUNTIME', filter=operator.Q(MODE=5)),
-        idle_hours=Sum('NEEDLE_RUNTIME', filter=operator.Q(MODE=2)),
-        total_hours=Sum('NEEDLE_RUNTIME'),
-        stitch_count=Sum('STITCH_COUNT'),
-        machine_count=Count('MACHINE_ID', distinct=True),
-        avg_sewing_speed=Avg('RESERVE')
-    ).order_by('DATE')
+    total_hours = totals['total_hours'] or 0
+    productive_hours = totals['sewing_hours'] or 0
+    no_feeding_hours = totals['no_feeding_hours'] or 0
+    meeting_hours = totals['meeting_hours'] or 0
+    maintenance_hours = totals['maintenance_hours'] or 0
+    idle_hours = totals['idle_hours'] or 0
+    total_stitch_count = totals['stitch_count'] or 0
     
     # Format daily data for table
     table_data = []
     for day in daily_data:
         day_total = day['total_hours'] or 0
-        pt_percentage = (day['sewing_hours'] / day_total * 100) if day_total > 0 else 0
+        pt_percentage = ((day['sewing_hours'] or 0) / day_total * 100) if day_total > 0 else 0
         npt_percentage = 100 - pt_percentage
         
         table_data.append({
@@ -1677,13 +1263,20 @@ def operator_report(request, operator_id):
                 "idle_hours": round(idle_hours, 2)
             }
         },
-        "total_stitch_count": total_stitch_count,
-        "table_data": table_data,
-        "all_table_data": table_data  # For filtering
+        "total_stitch_count": total_stitch_count
     }
+    if not totals_only:
+        response_data["table_data"] = table_data
+        response_data["all_table_data"] = table_data  # For filtering
     
     return Response(response_data)
 
+# Fields all_operators_report can be sorted by
+ALL_OPERATORS_SORT_FIELDS = (
+    "operator_id", "operator_name", "total_hours", "productive_hours",
+    "productive_percentage", "stitch_count", "machine_count",
+)
+
 @api_view(['GET'])
 def all_operators_report(request):
     from_date = request.GET.get('from_date')
@@ -1692,53 +1285,50 @@ def all_operators_report(request):
     if not from_date or not to_date:
         return Response({"error": "Both from_date and to_date are required"}, status=400)
     
-    # Get all operator data
-    operators = MachineLog.objects.filter(
-        DATE__gte=from_date,
-        DATE__lte=to_date
-    ).exclude(OPERATOR_ID="0").values('OPERATOR_ID').distinct()
+    # Optional server-side sorting and limiting, e.g. the top / bottom N
+    sort_by = request.GET.get('sort_by', '')
+    if sort_by and sort_by not in ALL_OPERATORS_SORT_FIELDS:
+        return Response({"error": f"sort_by must be one of: {', '.join(ALL_OPERATORS_SORT_FIELDS)}"}, status=400)
+    descending = request.GET.get('order', 'desc').lower() != 'asc'
+    limit = request.GET.get('limit', '')
+    if limit:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=400)
+        if limit < 0:
+            return Response({"error": "limit must not be negative"}, status=400)
+    
+    # Get all operator data with one grouped query
+    operators = list(operator_totals(from_date, to_date))
     
     all_operators_report = []
+    operator_names = operator_directory.names_by_rfid()
     
     for operator in operators:
         operator_id = operator['OPERATOR_ID']
-        operator_data = MachineLog.objects.filter(
-            OPERATOR_ID=operator_id,
-            DATE__gte=from_date,
-            DATE__lte=to_date
-        )
-        
-        # Get operator name
-        operator_name = ""
-        try:
-            operator_obj = Operator.objects.get(rfid_card_no=operator_id)
-            operator_name = operator_obj.operator_name
-        except Operator.DoesNotExist:
-            pass
         
         # Calculate totals
-        total_hours = operator_data.aggregate(
-            total_hours=Sum('NEEDLE_RUNTIME')
-        )['total_hours'] or 0
-        
-        productive_hours = operator_data.filter(MODE=1).aggregate(
-            total=Sum('NEEDLE_RUNTIME')
-        )['total'] or 0
+        total_hours = operator['total_hours'] or 0
+        productive_hours = operator['productive_hours'] or 0
         
         pt_percentage = (productive_hours / total_hours * 100) if total_hours > 0 else 0
         
         all_operators_report.append({
             "operator_id": operator_id,
-            "operator_name": operator_name,
+            "operator_name": operator_names.get(operator_id, ""),
             "total_hours": round(total_hours, 2),
             "productive_hours": round(productive_hours, 2),
             "productive_percentage": round(pt_percentage, 2),
-            "stitch_count": operator_data.aggregate(
-                total=Sum('STITCH_COUNT')
-            )['total'] or 0,
-            "machine_count": operator_data.values('MACHINE_ID').distinct().count()
+            "stitch_count": operator['stitch_count'] or 0,
+            "machine_count": operator['machine_count']
         })
     
+    if sort_by:
+        all_operators_report.sort(key=lambda report: report[sort_by], reverse=descending)
+    if limit != '':
+        all_operators_report = all_operators_report[:limit]
+    
     return Response({"allOperatorsReport": all_operators_report})
 
 
@@ -1758,105 +1348,138 @@ MODES = {
     5: "Maintenance"
 }
 
-@api_view(['GET'])
-def get_consolidated_logs(request):
+def add_archived_summary(summaries, log):
+    """Add one archived log to get_consolidated_logs day summaries ({date: summary})."""
+    summary = summaries.setdefault(log.DATE, dict.fromkeys((
+        'total_logs', 'sewing_hours', 'idle_hours', 'meeting_hours', 'no_feeding_hours',
+        'maintenance_hours', 'total_hours', 'total_stitch_count', 'total_needle_runtime',
+        'sewing_logs', 'sewing_stitch_count', 'sewing_needle_runtime'
+    ), 0))
+    mode_field = {1: 'sewing_hours', 2: 'idle_hours', 3: 'meeting_hours',
+                  4: 'no_feeding_hours', 5: 'maintenance_hours'}.get(log.MODE)
+    summary['total_logs'] += 1
+    summary['total_hours'] += log.duration_hours
+    summary['total_stitch_count'] += log.STITCH_COUNT or 0
+    summary['total_needle_runtime'] += log.NEEDLE_RUNTIME or 0
+    if mode_field:
+        summary[mode_field] += log.duration_hours
+    if log.MODE == 1:
+        summary['sewing_logs'] += 1
+        summary['sewing_stitch_count'] += log.STITCH_COUNT or 0
+        summary['sewing_needle_runtime'] += log.NEEDLE_RUNTIME or 0
+
+
+def archived_daily_summaries(logs, dates):
+    """get_consolidated_logs day summaries of archived logs, for the given dates."""
+    dates = set(dates)
+    summaries = {}
+    for log in logs:
+        if log.DATE in dates:
+            add_archived_summary(summaries, log)
+    return summaries
+
+
+def consolidated_log_query(query_params):
     """
-    View to retrieve machine logs with summary calculations.
-    Handles multiple filter values for machine_id, line_number, and operator_name.
+    Filtered logs of get_consolidated_logs and export_consolidated_logs.
+
+    Returns:
+        (logs, archived, first_date, last_date, operator_ids): the hot
+        queryset annotated with duration_hours, and a generator function
+        archived(from_day, to_day) of the matching archived logs
+    Raises:
+        ValueError for a malformed from_date / to_date
     """
-    from_date = request.query_params.get('from_date')
-    to_date = request.query_params.get('to_date')
+    from_date = query_params.get('from_date')
+    to_date = query_params.get('to_date')
     
     # Get all filter values
-    machine_ids = request.query_params.getlist('machine_id', [])
-    line_numbers = request.query_params.getlist('line_number', [])
-    operator_names = request.query_params.getlist('operator_name', [])
+    machine_ids = query_params.getlist('machine_id', [])
+    line_numbers = query_params.getlist('line_number', [])
+    operator_names = query_params.getlist('operator_name', [])
 
-    logs = MachineLog.objects.all()
-    
     # Apply date filters
-    if from_date:
-        logs = logs.filter(DATE__gte=from_date)
-    if to_date:
-        logs = logs.filter(DATE__lte=to_date)
+    first_date = datetime.strptime(from_date, '%Y-%m-%d').date() if from_date else None
+    last_date = datetime.strptime(to_date, '%Y-%m-%d').date() if to_date else None
     
     # Apply machine ID filters
+    archive_filters = {'working_seconds__gt': 0}
     if machine_ids:
-        logs = logs.filter(MACHINE_ID__in=machine_ids)
+        archive_filters['MACHINE_ID__in'] = machine_ids
     
     # Apply line number filters
     if line_numbers:
-        logs = logs.filter(LINE_NUMB__in=line_numbers)
+        archive_filters['LINE_NUMB__in'] = line_numbers
     
     # Apply operator filters
+    operator_ids = frozenset()
     if operator_names:
-        operators = Operator.objects.filter(
-            Q(operator_name__in=operator_names) | 
-            Q(rfid_card_no__in=operator_names)
-        ).distinct()
-        operator_ids = operators.values_list('rfid_card_no', flat=True)
-        logs = logs.filter(OPERATOR_ID__in=operator_ids)
-    
-    # Calculate duration in hours for each log entry
-    logs = logs.annotate(
-        start_seconds=ExpressionWrapper(
-            ExtractHour('START_TIME') * 3600 + 
-            ExtractMinute('START_TIME') * 60 + 
-            ExtractSecond('START_TIME'),
-            output_field=FloatField()
-        ),
-        end_seconds=ExpressionWrapper(
-            ExtractHour('END_TIME') * 3600 + 
-            ExtractMinute('END_TIME') * 60 + 
-            ExtractSecond('END_TIME'),
-            output_field=FloatField()
-        ),
-        duration_hours=ExpressionWrapper(
-            (F('end_seconds') - F('start_seconds')) / 3600,
-            output_field=FloatField()
-        )
-    )
-    
-    # Filter for working hours (8:25 AM to 7:30 PM)
-    logs = logs.filter(
-        start_seconds__gte=30300,  # 8:25 AM (8.416667 * 3600)
-        end_seconds__lte=70500     # 7:30 PM (19.5 * 3600)
-    )
+        valid_rfids = operator_directory.valid_rfids()
+        operator_ids = frozenset({
+            rfid
+            for name in operator_names
+            for rfid in operator_directory.rfids_of(name) + ((name,) if name in valid_rfids else ())
+        })
+        archive_filters['OPERATOR_ID__in'] = operator_ids
     
-    # Exclude specific break periods
-    logs = logs.exclude(
-        Q(start_seconds__gte=37800, end_seconds__lte=38400) |  # 10:30-10:40
-        Q(start_seconds__gte=48000, end_seconds__lte=50400) |  # 13:20-14:00
-        Q(start_seconds__gte=58800, end_seconds__lte=59400)    # 16:20-16:30
+    # Logs with working time, annotated with their working hours
+    logs = consolidated_logs(
+        first_date, last_date, machine_ids, line_numbers, operator_ids if operator_names else None
     )
     
-    # Calculate summary data
+    # Dates older than the hot window come from the Parquet archive
+    def archived(from_day=first_date, to_day=last_date):
+        for log in iter_archived_logs(from_day, to_day, **archive_filters):
+            log.duration_hours = log.working_seconds / 3600.0
+            yield log
+
+    return logs, archived, first_date, last_date, operator_ids
+
+
+def consolidated_summary(logs, first_date, last_date, cache_filters, archived_summaries):
+    """
+    Summary of get_consolidated_logs from per-day partials, closed days come
+    from the report cache.
+
+    Args:
+        cache_filters: hashable filters of the report cache entries
+        archived_summaries: callable(dates) returning {date: summary} of the
+            archived logs of those dates, see archived_daily_summaries
+    """
+    def daily_summaries(dates):
+        rows = consolidated_day_totals(logs, dates)
+        summaries = {row.pop('DATE'): row for row in rows}
+        for log_date, summary in archived_summaries(dates).items():
+            if log_date in summaries:
+                for key, value in summary.items():
+                    summaries[log_date][key] = (summaries[log_date][key] or 0) + value
+            else:
+                summaries[log_date] = summary
+        return summaries
+
+    partials = [
+        partial for partial in report_cache.days(
+            'get_consolidated_logs',
+            cache_filters,
+            sorted(set(report_dates(logs, first_date, last_date)) | set(archived_dates(first_date, last_date))),
+            daily_summaries
+        )
+        if partial is not None
+    ]
+
+    def total(field):
+        return sum(partial[field] or 0 for partial in partials)
+
     summary = {
-        'total_logs': logs.count(),
-        'sewing_hours': logs.filter(MODE=1).aggregate(
-            total=Sum('duration_hours')
-        )['total'] or 0,
-        'idle_hours': logs.filter(MODE=2).aggregate(
-            total=Sum('duration_hours')
-        )['total'] or 0,
-        'meeting_hours': logs.filter(MODE=3).aggregate(
-            total=Sum('duration_hours')
-        )['total'] or 0,
-        'no_feeding_hours': logs.filter(MODE=4).aggregate(
-            total=Sum('duration_hours')
-        )['total'] or 0,
-        'maintenance_hours': logs.filter(MODE=5).aggregate(
-            total=Sum('duration_hours')
-        )['total'] or 0,
-        'total_hours': logs.aggregate(
-            total=Sum('duration_hours')
-        )['total'] or 0,
-        'total_stitch_count': logs.aggregate(
-            total=Sum('STITCH_COUNT')
-        )['total'] or 0,
-        'total_needle_runtime': logs.aggregate(
-            total=Sum('NEEDLE_RUNTIME')
-        )['total'] or 0,
+        'total_logs': total('total_logs'),
+        'sewing_hours': total('sewing_hours'),
+        'idle_hours': total('idle_hours'),
+        'meeting_hours': total('meeting_hours'),
+        'no_feeding_hours': total('no_feeding_hours'),
+        'maintenance_hours': total('maintenance_hours'),
+        'total_hours': total('total_hours'),
+        'total_stitch_count': total('total_stitch_count'),
+        'total_needle_runtime': total('total_needle_runtime'),
     }
     
     # Calculate percentages
@@ -1874,29 +1497,169 @@ def get_consolidated_logs(request):
         summary['npt_percent'] = 0
     
     # Calculate average sewing speed if there are sewing logs
-    sewing_logs = logs.filter(MODE=1)
-    if sewing_logs.exists():
-        summary['sewing_speed'] = round(
-            sewing_logs.aggregate(
-                avg=Sum('STITCH_COUNT') / Sum('NEEDLE_RUNTIME')
-            )['avg'] or 0, 2
-        )
+    sewing_needle_runtime = total('sewing_needle_runtime')
+    if total('sewing_logs') > 0 and sewing_needle_runtime:
+        summary['sewing_speed'] = round(total('sewing_stitch_count') / sewing_needle_runtime, 2)
     else:
         summary['sewing_speed'] = 0
-    
+
+    return summary
+
+
+@api_view(['GET'])
+def get_consolidated_logs(request):
+    """
+    View to retrieve machine logs with summary calculations.
+    Handles multiple filter values for machine_id, line_number, and operator_name.
+    """
+    from_date = request.query_params.get('from_date')
+    to_date = request.query_params.get('to_date')
+    machine_ids = request.query_params.getlist('machine_id', [])
+    line_numbers = request.query_params.getlist('line_number', [])
+    operator_names = request.query_params.getlist('operator_name', [])
+
+    try:
+        logs, archived, first_date, last_date, operator_ids = consolidated_log_query(request.query_params)
+    except ValueError:
+        return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
+    
+    filters = {
+        'from_date': from_date,
+        'to_date': to_date,
+        'machine_ids': machine_ids,
+        'line_numbers': line_numbers,
+        'operator_names': operator_names
+    }
+    cache_filters = (tuple(machine_ids), tuple(line_numbers), operator_ids)
+    
+    if wants_stream(request):
+        # The archive is read once: the day summaries of archived dates are
+        # gathered while their logs are streamed, so the summary follows the logs
+        archived_summaries = {}
+
+        def archived_chunks():
+            for chunk in chunked(archived()):
+                for log in chunk:
+                    add_archived_summary(archived_summaries, log)
+                yield machine_log_projection.instance_rows(chunk)
+
+        def summary_json():
+            yield encode(consolidated_summary(
+                logs, first_date, last_date, cache_filters,
+                lambda dates: {
+                    log_date: archived_summaries[log_date]
+                    for log_date in dates if log_date in archived_summaries
+                }
+            ))
+
+        return streaming_json_response(request, json_object([
+            ('logs', json_array(chain(archived_chunks(), machine_log_projection.rows(logs)))),
+            ('summary', summary_json()),
+            ('filters', filters),
+        ]))
+    
+    # The archive is read once, for both the summary and the logs
+    archived_logs = list(archived())
+    summary = consolidated_summary(
+        logs, first_date, last_date, cache_filters,
+        lambda dates: archived_daily_summaries(archived_logs, dates)
+    )
+
     # Serialize logs
-    serialized_logs = MachineLogSerializer(logs, many=True).data
+    serialized_logs = machine_log_projection.instance_rows(archived_logs)
+    for chunk in machine_log_projection.rows(logs):
+        serialized_logs.extend(chunk)
     
     response_data = {
         'summary': summary,
         'logs': serialized_logs,
-        'filters': {
-            'from_date': from_date,
-            'to_date': to_date,
-            'machine_ids': machine_ids,
-            'line_numbers': line_numbers,
-            'operator_names': operator_names
-        }
+        'filters': filters
     }
 
-    return Response(response_data)
\ No newline at end of file
+    return Response(response_data)
+
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from .exports import export_filename, export_format, export_response
+
+def report_table_rows(report):
+    """
+    tableData rows of a report response. The tables of an all-lines or
+    all-machines report are concatenated, prefixed with the line number
+    (machine rows already carry their Machine ID).
+    """
+    if "allLinesReport" in report:
+        return (
+            {'Line Number': line_report["lineNumber"], **row}
+            for line_report in report["allLinesReport"]
+            for row in line_report["tableData"]
+        )
+    if "allMachinesReport" in report:
+        return (row for machine_report in report["allMachinesReport"] for row in machine_report["tableData"])
+    return report["tableData"]
+
+
+def export_report(request, report_view, key, sheet_name):
+    """
+    Export of the tableData of a report view, as CSV or XLSX (?file_format=).
+
+    The report is computed by the view itself, with the same parameters and
+    report cache; its error responses are returned as they are.
+    """
+    try:
+        file_format = export_format(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    response = report_view(request._request, key)
+    if response.status_code != 200:
+        return response
+
+    filename = export_filename(
+        sheet_name.lower().replace(' ', '_'), key,
+        request.GET.get('from_date'), request.GET.get('to_date')
+    )
+    return export_response(report_table_rows(response.data), filename, file_format, sheet_name)
+
+
+@api_view(['GET'])
+def export_operator_report(request, operator_name):
+    """Daily table of operator_reports_by_name as a CSV or XLSX download."""
+    return export_report(request, operator_reports_by_name, operator_name, "Operator Report")
+
+
+@api_view(['GET'])
+def export_line_report(request, line_number):
+    """Daily table of line_reports (of every line for "all") as a CSV or XLSX download."""
+    return export_report(request, line_reports, line_number, "Line Report")
+
+
+@api_view(['GET'])
+def export_machine_report(request, machine_id):
+    """Daily table of machine_reports (of every machine for "all") as a CSV or XLSX download."""
+    return export_report(request, machine_reports, machine_id, "Machine Report")
+
+
+@api_view(['GET'])
+def export_consolidated_logs(request):
+    """
+    Logs of get_consolidated_logs, with the same filters, as a CSV or XLSX
+    download. The rows are read in chunks from the archive and the hot
+    table and written as they come, so memory does not grow with the range.
+    """
+    try:
+        file_format = export_format(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    try:
+        logs, archived, first_date, last_date, _ = consolidated_log_query(request.query_params)
+    except ValueError:
+        return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=400)
+
+    chunks = chain(
+        (machine_log_projection.instance_rows(chunk) for chunk in chunked(archived())),
+        machine_log_projection.rows(logs.order_by('DATE', 'id'))
+    )
+    rows = (row for chunk in chunks for row in chunk)
+    filename = export_filename("machine_logs", first_date, last_date)
+    return export_response(rows, filename, file_format, "Logs")
@@ -0,0 +1,174 @@
+"""
+Process-local index of stored machine log keys.
+
+Answers "is this retransmitted log definitely new?" without a lookup query.
+A bounded LRU holds the most recent keys and a Bloom filter per DATE holds
+every key stored for that day. A miss in both means the key was never
+stored, so the lookup can be skipped. Any hit is only a "maybe" and the
+caller still confirms it with SQL.
+
+Each day's filter remembers the highest row id it has loaded (a server-side
+high-water mark, independent of device clocks). sync() tops it up with the
+rows stored since, by any worker. Its answers are only exact while nothing
+else can store logs of that date, so it is called under the exclusive
+rollup generation lock of the dates (see ingest._insert_locked), which
+serializes every insert of a date and so keeps ids in commit order. On
+databases with INSERT ... RETURNING the insert itself reports duplicates and
+no lookup is made at all, so the index is not used there.
+
+Filters are built lazily by the first sync() of a date, and only for the
+max_days most recent days by server date: a late retransmit for an older
+day is checked with SQL instead of loading a whole day of keys.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from math import ceil, log
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over a blake2b digest."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(int(capacity), 1)
+        self.size = max(int(ceil(-capacity * log(error_rate) / (log(2) ** 2))), 8)
+        self.hash_count = max(int(round(self.size / capacity * log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class RecentKeys:
+    """Bounded set of keys with least-recently-used eviction."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._keys = OrderedDict()
+
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        if len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+
+    def __contains__(self, key):
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class DayFilter:
+    """Bloom filter of one date and the highest row id loaded into it."""
+
+    def __init__(self, bloom):
+        self.bloom = bloom
+        self.last_id = 0
+
+
+class DedupIndex:
+    """
+    LRU plus per-day Bloom filters in front of the duplicate log queries.
+
+    Args:
+        load_keys: callable(date, after_id) returning (row id, key) pairs of
+            the keys stored for that date in rows with a higher id
+        date_of: callable(key) returning the DATE part of a key
+        lru_size: number of recent keys kept exactly
+        bloom_capacity: expected keys per day, grown to fit what is loaded
+        error_rate: target false positive rate of each day's filter
+        max_days: number of most recent days, by server date, that get a
+            day filter
+        today: callable returning the server's current date
+    """
+
+    def __init__(self, load_keys, date_of, lru_size=50000, bloom_capacity=200000,
+                 error_rate=0.01, max_days=7, today=date.today):
+        self.load_keys = load_keys
+        self.date_of = date_of
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self.max_days = max_days
+        self.today = today
+        self._recent = RecentKeys(lru_size)
+        self._days = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.stats = {"lru_hits": 0, "bloom_hits": 0, "unindexed": 0, "definitely_new": 0}
+
+    def _indexed(self, log_date):
+        return self.today() - timedelta(days=self.max_days) < log_date
+
+    def sync(self, dates):
+        """
+        Load the rows stored since the last sync into the filters of dates.
+
+        Call it while no other worker can store logs of these dates; the
+        might_exist() answers for them are exact until that lock is released.
+        """
+        with self._load_lock:
+            for log_date in sorted(set(dates)):
+                if not self._indexed(log_date):
+                    continue
+                with self._lock:
+                    day = self._days.get(log_date)
+                rows = list(self.load_keys(log_date, day.last_id if day is not None else 0))
+                if day is None:
+                    # Grown past its capacity by later loads, the filter only
+                    # gets more false positives, i.e. more SQL checks
+                    day = DayFilter(BloomFilter(max(self.bloom_capacity, len(rows) * 2), self.error_rate))
+                with self._lock:
+                    for row_id, key in rows:
+                        day.bloom.add(key)
+                        day.last_id = max(day.last_id, row_id)
+                    self._days[log_date] = day
+                    for old_date in [d for d in self._days if not self._indexed(d)]:
+                        del self._days[old_date]
+
+    def might_exist(self, key):
+        """
+        Return False only if the key is definitely not stored yet.
+
+        True means the key was seen recently, the day filter matched, or
+        its date has no filter. The caller must confirm with the database.
+        Only exact for dates synced under the caller's lock, see sync().
+        """
+        with self._lock:
+            if key in self._recent:
+                self.stats["lru_hits"] += 1
+                return True
+            day = self._days.get(self.date_of(key))
+            if day is None:
+                self.stats["unindexed"] += 1
+                return True
+            if key in day.bloom:
+                self.stats["bloom_hits"] += 1
+                return True
+            self.stats["definitely_new"] += 1
+            return False
+
+    def add(self, key):
+        """Record a key that has just been stored."""
+        with self._lock:
+            day = self._days.get(self.date_of(key))
+            if day is not None:
+                day.bloom.add(key)
+            self._recent.add(key)
@@ -0,0 +1,123 @@
+"""
+Spreadsheet exports of the report tables and raw logs.
+
+Rows are written as they are produced, so memory stays bounded by one chunk
+of rows:
+
+- CSV is streamed: every row is sent as soon as it is written, and the
+  download starts with the first chunk.
+- XLSX is written by xlsxwriter in constant_memory mode, which flushes each
+  row to disk, into an anonymous temporary file that is then streamed. An
+  XLSX file is a zip archive that is only complete once the workbook is
+  closed, so its download starts when the last row is written. Sheets are
+  continued on a new worksheet after XLSX_MAX_ROWS rows.
+
+Requires xlsxwriter for XLSX; without it only CSV is available.
+"""
+import csv
+import re
+import tempfile
+from itertools import chain
+
+from django.http import FileResponse, StreamingHttpResponse
+
+try:
+    import xlsxwriter
+except ImportError:  # pragma: no cover - optional dependency
+    xlsxwriter = None
+
+EXPORT_FORMATS = ("csv", "xlsx")
+# Rows per worksheet, Excel's limit minus the header row
+XLSX_MAX_ROWS = 1048575
+
+
+class _Echo:
+    """File-like object whose write() returns the written text, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_format(request):
+    """
+    Requested file format (?file_format=csv|xlsx, csv by default).
+
+    The parameter is not named `format`, which DRF reserves for choosing the
+    renderer. Raises ValueError with a client message for an unknown or
+    unavailable format.
+    """
+    file_format = request.GET.get('file_format', 'csv').lower()
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"file_format must be one of {', '.join(EXPORT_FORMATS)}")
+    if file_format == "xlsx" and xlsxwriter is None:
+        raise ValueError("XLSX export requires xlsxwriter")
+    return file_format
+
+
+def export_filename(*parts):
+    """File name from its parts, reduced to characters that are safe in a header."""
+    name = "_".join(str(part) for part in parts if part not in (None, ""))
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", name)
+
+
+def _with_header(rows):
+    """(header, rows) of an iterable of dicts, the header from the first row's keys."""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return [], iter(())
+    return list(first), chain([first], rows)
+
+
+def _cell(value):
+    return "" if value is None else value
+
+
+def csv_response(rows, filename):
+    """StreamingHttpResponse of a CSV file with one line per dict in rows."""
+    def lines():
+        header, body = _with_header(rows)
+        writer = csv.writer(_Echo())
+        # The byte order mark makes Excel read the file as UTF-8
+        yield "\ufeff" + writer.writerow(header)
+        for row in body:
+            yield writer.writerow([_cell(row.get(key)) for key in header])
+
+    response = StreamingHttpResponse(lines(), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def xlsx_response(rows, filename, sheet_name="Export"):
+    """FileResponse of an XLSX workbook with one row per dict in rows."""
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True, "strings_to_numbers": False})
+    header, body = _with_header(rows)
+
+    worksheet, row_number, sheet_count = None, XLSX_MAX_ROWS, 0
+    for row in body:
+        if row_number >= XLSX_MAX_ROWS:
+            sheet_count += 1
+            worksheet = workbook.add_worksheet(sheet_name if sheet_count == 1 else f"{sheet_name} {sheet_count}")
+            worksheet.write_row(0, 0, header)
+            row_number = 0
+        row_number += 1
+        worksheet.write_row(row_number, 0, [_cell(row.get(key)) for key in header])
+    if worksheet is None:
+        workbook.add_worksheet(sheet_name).write_row(0, 0, header)
+    workbook.close()
+
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"{filename}.xlsx",
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
+def export_response(rows, filename, file_format, sheet_name="Export"):
+    """Export of an iterable of dicts in the requested format."""
+    if file_format == "xlsx":
+        return xlsx_response(rows, filename, sheet_name)
+    return csv_response(rows, filename)
@@ -0,0 +1,543 @@
+"""
+Helpers shared by the machine log ingestion views.
+
+The device firmware retransmits a log with its Tx_LOGID / Str_LOGID offset by
+1000. A retransmitted record is only saved if no log with the adjusted ID
+exists for the same MACHINE_ID, DATE, START_TIME and END_TIME.
+
+The unique Log ID constraints on MachineLog enforce this in the database.
+They apply to every stored log, so unlike the original exists() check they
+also skip a first transmission (Log ID <= 1000) that repeats the Log ID,
+machine, date and time window of a stored log.
+"""
+import logging
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import InterfaceError, OperationalError, close_old_connections, connection, transaction
+from django.db.models import Q
+
+from .archive import archived_rows, is_archived
+from .dedup_index import DedupIndex
+from .models import MachineLog
+from .report_cache import report_cache
+from .rollups import ensure_generations, record_rollups, rollup_generations
+from .spool import DatabaseHealth, LogSpool, SpoolReplayer, load_bisected
+from .working_time import working_seconds
+from .write_buffer import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning the database is unreachable or failing as a whole, as
+# opposed to errors caused by the records (IntegrityError, DataError)
+OUTAGE_ERRORS = (OperationalError, InterfaceError)
+
+# Log IDs above this value are retransmissions of an earlier log
+LOGID_RETRANSMIT_OFFSET = 1000
+
+# Log ID fields that follow the retransmit rule
+LOGID_FIELDS = ("Tx_LOGID", "Str_LOGID")
+
+# Most rows per INSERT statement when bulk creating logs, lowered to what the
+# database accepts in one statement (connection.ops.bulk_batch_size)
+BULK_CREATE_BATCH_SIZE = 500
+
+# Columns identifying an inserted row, returned by INSERT ... RETURNING
+INSERTED_KEY_FIELDS = ("MACHINE_ID", "DATE", "START_TIME", "END_TIME", "Tx_LOGID", "Str_LOGID")
+
+# Clause that makes an INSERT skip rows violating the unique Log ID
+# constraints, per database vendor. Other databases (MySQL, where Django does
+# not create the conditional constraints) insert under the exclusive
+# generation lock after leaving out stored Log IDs, see _insert_locked.
+CONFLICT_IGNORING_CLAUSES = {
+    "postgresql": "ON CONFLICT DO NOTHING",
+    "sqlite": "ON CONFLICT DO NOTHING",
+}
+
+
+def normalize_log_ids(validated_data):
+    """
+    Apply the retransmit rule to the Tx_LOGID and Str_LOGID of a record.
+
+    Adjusted IDs are written back into validated_data.
+
+    Returns:
+        List of (field, adjusted_id) pairs that need a duplicate check
+
+    Raises:
+        ValueError: with the offending field name when an ID is not an integer
+    """
+    checks = []
+    for field in LOGID_FIELDS:
+        log_id = validated_data.get(field)
+        if log_id is None:
+            continue
+        try:
+            log_id = int(log_id)
+        except (TypeError, ValueError):
+            raise ValueError(field)
+
+        if log_id > LOGID_RETRANSMIT_OFFSET:
+            adjusted_log_id = log_id - LOGID_RETRANSMIT_OFFSET
+            validated_data[field] = adjusted_log_id
+            checks.append((field, adjusted_log_id))
+    return checks
+
+
+def dedup_key(field, log_id, data):
+    """Key identifying a log for duplicate detection."""
+    return (
+        field,
+        int(log_id),
+        data["MACHINE_ID"],
+        data["DATE"],
+        data["START_TIME"],
+        data["END_TIME"],
+    )
+
+
+def seconds_of_day(value):
+    """Convert a time to seconds since midnight."""
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def with_time_columns(logs):
+    """
+    Return validated log data with the derived time columns filled in.
+
+    start_seconds / end_seconds are START_TIME / END_TIME as seconds of day,
+    duration_seconds their difference, working_seconds the exact part of the
+    log inside the working time of its shift (see working_time.py) and
+    reserve_numeric the RESERVE sewing speed as an integer (None if it is
+    not numeric).
+    """
+    rows = []
+    for data in logs:
+        start_seconds = seconds_of_day(data["START_TIME"])
+        end_seconds = seconds_of_day(data["END_TIME"])
+        try:
+            reserve_numeric = int(data.get("RESERVE"))
+        except (TypeError, ValueError):
+            reserve_numeric = None
+        rows.append({
+            **data,
+            "start_seconds": start_seconds,
+            "end_seconds": end_seconds,
+            "duration_seconds": end_seconds - start_seconds,
+            "reserve_numeric": reserve_numeric,
+        })
+
+    clipped = working_seconds(
+        [row["DATE"] for row in rows],
+        [row.get("LINE_NUMB") for row in rows],
+        [row["start_seconds"] for row in rows],
+        [row["end_seconds"] for row in rows],
+    )
+    for row, seconds in zip(rows, clipped.tolist()):
+        row["working_seconds"] = seconds
+    return rows
+
+
+def _inserted_key(values):
+    """Comparable INSERTED_KEY_FIELDS of a row, from validated data or database values."""
+    return tuple(
+        MachineLog._meta.get_field(name).to_python(value) if value is not None else None
+        for name, value in zip(INSERTED_KEY_FIELDS, values)
+    )
+
+
+def _insert_fields():
+    return [field for field in MachineLog._meta.concrete_fields if not field.primary_key]
+
+
+def _chunks(rows):
+    """Split rows into chunks small enough for one INSERT statement."""
+    batch_size = max(min(BULK_CREATE_BATCH_SIZE, connection.ops.bulk_batch_size(_insert_fields(), rows)), 1)
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def _insert_sql(chunk, suffix=""):
+    """Multi-row INSERT of log rows with the vendor's conflict-ignoring clause."""
+    on_conflict = CONFLICT_IGNORING_CLAUSES.get(connection.vendor, "")
+    qn = connection.ops.quote_name
+    fields = _insert_fields()
+    row_placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    params = [
+        field.get_db_prep_save(field.pre_save(obj, True), connection)
+        for obj in [MachineLog(**row) for row in chunk]
+        for field in fields
+    ]
+    sql = (
+        f"INSERT INTO {qn(MachineLog._meta.db_table)} ({', '.join(qn(field.column) for field in fields)}) "
+        f"VALUES {', '.join([row_placeholder] * len(chunk))} {on_conflict}{suffix}"
+    )
+    return sql, params
+
+
+def _insert_returning(rows):
+    """
+    Insert rows with ON CONFLICT DO NOTHING RETURNING, which reports exactly
+    the rows that were inserted. Returns inserted flags aligned with rows.
+    """
+    qn = connection.ops.quote_name
+    returning = " RETURNING " + ", ".join(
+        qn(MachineLog._meta.get_field(name).column) for name in INSERTED_KEY_FIELDS
+    )
+    flags = []
+    with connection.cursor() as cursor:
+        for chunk in _chunks(rows):
+            cursor.execute(*_insert_sql(chunk, returning))
+            returned = Counter(_inserted_key(row) for row in cursor.fetchall())
+            for row in chunk:
+                key = _inserted_key([row.get(name) for name in INSERTED_KEY_FIELDS])
+                flags.append(returned[key] > 0)
+                returned[key] -= 1
+    return flags
+
+
+def _insert_locked(rows):
+    """
+    Insert rows on databases without INSERT ... RETURNING. The caller holds
+    the dates' generation rows exclusively, so no other worker inserts logs
+    of these dates meanwhile and rows whose Log IDs are already stored can
+    be left out up front. The dedup index is synced under that lock, which
+    makes its "definitely new" answers exact. Returns inserted flags aligned
+    with rows.
+    """
+    if DEDUP_INDEX_ENABLED:
+        dedup_index.sync({row["DATE"] for row in rows})
+    existing = find_existing_keys(
+        [(row, [(field, row[field]) for field in LOGID_FIELDS if row.get(field) is not None]) for row in rows],
+        use_index=DEDUP_INDEX_ENABLED,
+    )
+    flags = []
+    new_rows = []
+    for row in rows:
+        keys = stored_log_keys(row)
+        is_new = not any(key in existing for key in keys)
+        if is_new:
+            existing.update(keys)
+            new_rows.append(row)
+        flags.append(is_new)
+
+    with connection.cursor() as cursor:
+        for chunk in _chunks(new_rows):
+            cursor.execute(*_insert_sql(chunk))
+    return flags
+
+
+def _archived_duplicates(logs):
+    """
+    Flags aligned with logs, True where the log's Log IDs are stored in the
+    archive. The logs of archived dates are gone from the table, so the
+    unique Log ID constraints cannot catch a late retransmit of them.
+    """
+    flags = [False] * len(logs)
+    for log_date in {data["DATE"] for data in logs}:
+        if not is_archived(log_date):
+            continue
+        indexes = [index for index, data in enumerate(logs) if data["DATE"] == log_date]
+        stored = set()
+        for row in archived_rows(
+            log_date, ["MACHINE_ID", "START_TIME", "END_TIME", *LOGID_FIELDS],
+            MACHINE_ID__in={logs[index]["MACHINE_ID"] for index in indexes},
+        ):
+            stored.update(stored_log_keys(row))
+        for index in indexes:
+            flags[index] = any(key in stored for key in stored_log_keys(logs[index]))
+    return flags
+
+
+def insert_logs(logs):
+    """
+    Insert logs, skipping rows that conflict with the unique Log ID
+    constraints or with archived logs. The derived time columns are filled
+    in here so every ingest path stores them, and exactly the inserted rows
+    are added to the rollups.
+
+    Args:
+        logs: list of validated_data dicts
+
+    Returns:
+        List of booleans aligned with logs, False where the row was skipped
+    """
+    archived = _archived_duplicates(logs)
+    if any(archived):
+        inserted = iter(insert_logs([data for data, is_archived_log in zip(logs, archived) if not is_archived_log]))
+        return [False if is_archived_log else next(inserted) for is_archived_log in archived]
+    if not logs:
+        return []
+
+    rows = with_time_columns(logs)
+    dates = {row["DATE"] for row in rows}
+    ensure_generations(dates)
+    with transaction.atomic():
+        if connection.vendor in ("postgresql", "sqlite") and connection.features.can_return_rows_from_bulk_insert:
+            flags = _insert_returning(rows)
+            # After the insert: a rebuild that started meanwhile did not see
+            # these rows, and is waited for so the new generation is read
+            generations = rollup_generations(dates)
+        else:
+            generations = rollup_generations(dates, exclusive=True)
+            flags = _insert_locked(rows)
+
+    inserted = [row for row, is_inserted in zip(rows, flags) if is_inserted]
+    record_rollups(inserted, generations)
+    if inserted:
+        # Late logs change the cached reports of their (closed) dates
+        report_cache.invalidate_dates({row["DATE"] for row in inserted})
+    return flags
+
+
+def insert_logs_ignore_conflicts(logs):
+    """insert_logs, returning the number of rows actually inserted."""
+    return sum(insert_logs(logs))
+
+
+def stored_log_keys(data):
+    """Dedup keys under which a stored log can be matched by a retransmit."""
+    return [
+        dedup_key(field, data[field], data)
+        for field in LOGID_FIELDS
+        if data.get(field) is not None
+    ]
+
+
+def _load_keys_for_date(log_date, after_id):
+    rows = MachineLog.objects.filter(DATE=log_date, id__gt=after_id).filter(
+        Q(Tx_LOGID__isnull=False) | Q(Str_LOGID__isnull=False)
+    ).values("id", "Tx_LOGID", "Str_LOGID", "MACHINE_ID", "DATE", "START_TIME", "END_TIME")
+    for row in rows.iterator(chunk_size=5000):
+        for key in stored_log_keys(row):
+            yield row["id"], key
+
+
+# Process-local "definitely new" index, see dedup_index.py. Day filters are
+# loaded lazily by the first locked insert of their date.
+dedup_index = DedupIndex(
+    load_keys=_load_keys_for_date,
+    date_of=lambda key: key[3],
+    lru_size=getattr(settings, "MACHINE_LOG_DEDUP_LRU_SIZE", 50000),
+    bloom_capacity=getattr(settings, "MACHINE_LOG_DEDUP_BLOOM_CAPACITY", 200000),
+    max_days=getattr(settings, "MACHINE_LOG_DEDUP_DAYS", 7),
+)
+DEDUP_INDEX_ENABLED = getattr(settings, "MACHINE_LOG_DEDUP_INDEX", True)
+
+
+def might_be_duplicate(key):
+    """
+    False when the dedup index proves the key is new, so SQL can be skipped.
+    Only exact for dates synced under their generation lock.
+    """
+    return not DEDUP_INDEX_ENABLED or dedup_index.might_exist(key)
+
+
+def remember_logs(logs):
+    """Add stored logs (dicts of validated data) to the dedup index."""
+    if not DEDUP_INDEX_ENABLED:
+        return
+    for data in logs:
+        for key in stored_log_keys(data):
+            dedup_index.add(key)
+
+
+def find_existing_keys(records, use_index=False):
+    """
+    Look up which dedup keys of the given records already exist in MachineLog.
+
+    Runs one query per (MACHINE_ID, DATE) group, matching every adjusted
+    Tx_LOGID / Str_LOGID of the group at once. With use_index, IDs the dedup
+    index proves new are left out, and groups with none left are not
+    queried at all.
+
+    Args:
+        records: list of (validated_data, checks) pairs
+        use_index: True to consult the dedup index, only while the dates
+            are synced under their generation lock (see _insert_locked)
+
+    Returns:
+        Set of dedup keys found in the database
+    """
+    groups = defaultdict(lambda: {field: set() for field in LOGID_FIELDS})
+    for data, checks in records:
+        for field, log_id in checks:
+            if not use_index or might_be_duplicate(dedup_key(field, log_id, data)):
+                groups[(data["MACHINE_ID"], data["DATE"])][field].add(log_id)
+
+    existing = set()
+    for (machine_id, log_date), ids in groups.items():
+        condition = Q()
+        for field, values in ids.items():
+            if values:
+                condition |= Q(**{f"{field}__in": values})
+
+        rows = MachineLog.objects.filter(
+            condition, MACHINE_ID=machine_id, DATE=log_date
+        ).values_list("Tx_LOGID", "Str_LOGID", "START_TIME", "END_TIME")
+
+        for tx_log_id, str_log_id, start_time, end_time in rows:
+            row = {
+                "MACHINE_ID": machine_id,
+                "DATE": log_date,
+                "START_TIME": start_time,
+                "END_TIME": end_time,
+            }
+            if tx_log_id is not None:
+                existing.add(dedup_key("Tx_LOGID", tx_log_id, row))
+            if str_log_id is not None:
+                existing.add(dedup_key("Str_LOGID", str_log_id, row))
+    return existing
+
+
+def save_logs_deduplicated(records):
+    """
+    Save a batch of validated logs, skipping retransmitted duplicates.
+
+    There is no lookup before the insert: insert_logs reports per row
+    whether it was stored, from INSERT ... RETURNING or from the lookup it
+    makes under the dates' generation lock. A copy stored earlier, by
+    another worker meanwhile or earlier in the same batch is reported as a
+    duplicate.
+
+    Args:
+        records: list of (validated_data, checks) pairs from normalize_log_ids
+
+    Returns:
+        (statuses, inserted): "created" / "duplicate" statuses aligned with
+        records, and the number of rows actually inserted
+    """
+    logs = [data for data, checks in records]
+    flags = insert_logs(logs)
+    remember_logs([data for data, is_inserted in zip(logs, flags) if is_inserted])
+    statuses = ["created" if is_inserted else "duplicate" for is_inserted in flags]
+    return statuses, statuses.count("created")
+
+
+def _probe_database():
+    close_old_connections()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def _decode_spooled(record):
+    return {
+        name: MachineLog._meta.get_field(name).to_python(value)
+        for name, value in record.items()
+    }
+
+
+def _replay_spooled_logs(records):
+    # Spooled logs already carry adjusted IDs. Every present ID is checked so
+    # replaying a file again after a partial failure cannot double-insert.
+    close_old_connections()
+    logs = [_decode_spooled(record) for record in records]
+    save_logs_deduplicated([
+        (data, [(field, data[field]) for field in LOGID_FIELDS if data.get(field) is not None])
+        for data in logs
+    ])
+
+
+# Optional spool for outages: when MACHINE_LOG_SPOOL_DIR is set, logs accepted
+# while the database is failing go to disk and are replayed on recovery,
+# see spool.py. Call spool_replayer.start() from AppConfig.ready() to also
+# replay files left behind by a previous run.
+SPOOL_DIR = getattr(settings, "MACHINE_LOG_SPOOL_DIR", None)
+db_health = DatabaseHealth(
+    probe=_probe_database,
+    retry_after=getattr(settings, "MACHINE_LOG_DB_RETRY_SECONDS", 5.0),
+)
+log_spool = None
+spool_replayer = None
+if SPOOL_DIR:
+    log_spool = LogSpool(
+        SPOOL_DIR,
+        fsync_every=getattr(settings, "MACHINE_LOG_SPOOL_FSYNC_EVERY", 100),
+        fsync_interval_ms=getattr(settings, "MACHINE_LOG_SPOOL_FSYNC_MS", 200),
+    )
+    spool_replayer = SpoolReplayer(
+        log_spool, db_health, _replay_spooled_logs, outage_errors=OUTAGE_ERRORS
+    )
+
+
+def database_available():
+    """False while the database is known to be failing and the spool can take logs."""
+    return log_spool is None or db_health.healthy
+
+
+def spool_logs(records):
+    """
+    Write (validated_data, checks) records to the outage spool.
+
+    Returns:
+        False if no spool is configured, so the caller must handle the records
+    """
+    if log_spool is None:
+        return False
+    log_spool.append([data for data, checks in records])
+    spool_replayer.start()
+    return True
+
+
+def save_or_spool(records):
+    """
+    save_logs_deduplicated, falling back to the spool when the database fails.
+
+    Only OUTAGE_ERRORS count as a failing database. Errors caused by the
+    records themselves propagate, they would fail again on replay.
+
+    Returns:
+        (statuses, inserted) as from save_logs_deduplicated, with "spooled"
+        for records written to disk
+    """
+    if not database_available() and spool_logs(records):
+        return ["spooled"] * len(records), 0
+    try:
+        return save_logs_deduplicated(records)
+    except OUTAGE_ERRORS:
+        db_health.mark_failure()
+        if not spool_logs(records):
+            raise
+        return ["spooled"] * len(records), 0
+
+
+def _reject_buffered_log(record, exc):
+    # The record was acknowledged but can never be stored; retrying it would
+    # hold up the buffer for good
+    logger.error("Dropping buffered log %r that cannot be stored: %s", record[0], exc)
+
+
+def _flush_buffered_logs(records):
+    # Runs on the flusher thread, which has its own database connection.
+    # Outages propagate so the write buffer retries the batch.
+    close_old_connections()
+    try:
+        load_bisected(save_or_spool, records, OUTAGE_ERRORS, _reject_buffered_log)
+    finally:
+        close_old_connections()
+
+
+# Optional write-behind mode: log_machine_data acknowledges as soon as the
+# record is queued and the flusher thread bulk-writes it, see write_buffer.py
+WRITE_BEHIND_ENABLED = getattr(settings, "MACHINE_LOG_WRITE_BEHIND", False)
+write_buffer = WriteBehindBuffer(
+    write_batch=_flush_buffered_logs,
+    batch_size=getattr(settings, "MACHINE_LOG_WRITE_BEHIND_BATCH_SIZE", 500),
+    flush_interval_ms=getattr(settings, "MACHINE_LOG_WRITE_BEHIND_FLUSH_MS", 200),
+    max_queue_size=getattr(settings, "MACHINE_LOG_WRITE_BEHIND_QUEUE_SIZE", 20000),
+    retry_ms=getattr(settings, "MACHINE_LOG_WRITE_BEHIND_RETRY_MS", 500),
+)
+
+
+def enqueue_logs(records):
+    """
+    Hand validated (validated_data, checks) records to the write-behind buffer.
+
+    Returns:
+        List of booleans aligned with records, False where the record was not
+        queued (write-behind disabled or queue full) and the caller must save
+        it synchronously
+    """
+    if not WRITE_BEHIND_ENABLED:
+        return [False] * len(records)
+    return [write_buffer.submit(record) for record in records]
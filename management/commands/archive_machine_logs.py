@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...archive import HOT_DAYS, archive_closed_months, archive_enabled
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the raw logs of closed months older than the hot window to "
+        "compressed Parquet files in MACHINE_LOG_ARCHIVE_DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hot-days", type=int, default=HOT_DAYS,
+            help="Days of raw logs kept in the database",
+        )
+
+    def handle(self, *args, **options):
+        if not archive_enabled():
+            raise CommandError("Archiving needs pyarrow and the MACHINE_LOG_ARCHIVE_DIR setting")
+
+        archived = archive_closed_months(hot_days=options["hot_days"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {sum(archived.values())} logs of {len(archived)} dates"
+        ))
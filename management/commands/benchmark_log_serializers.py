@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from ...models import MachineLog
+from ...operator_directory import operator_directory
+from ...projection import log_dict_rows, machine_log_projection
+from ...serializers import MachineLogSerializer
+from ...streaming import encode
+
+# Mode descriptions used by both filter_logs paths of the benchmark
+BENCHMARK_MODES = {1: "Sewing", 2: "Idle", 3: "No feeding", 4: "Meeting", 5: "Maintenance"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows/sec of the DRF serializer and the values_list projection "
+        "for the raw log endpoints, and check both produce the same bytes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000, help="Newest logs to serialize")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per path, the fastest counts")
+
+    def handle(self, *args, **options):
+        logs = MachineLog.objects.order_by("-created_at", "-id")[:options["rows"]]
+        operator_names = operator_directory.names_by_rfid()
+
+        def serializer_before():
+            return JSONRenderer().render(MachineLogSerializer(list(logs), many=True).data)
+
+        def serializer_after():
+            return encode([row for chunk in machine_log_projection.rows(logs) for row in chunk])
+
+        def filter_logs_before():
+            rows = []
+            for log in logs:
+                data = {
+                    **log.__dict__,
+                    'mode_description': BENCHMARK_MODES.get(log.MODE, 'Unknown mode'),
+                    'operator_name': operator_names.get(log.OPERATOR_ID, "") if log.OPERATOR_ID != "0" else ""
+                }
+                data.pop('_state', None)
+                rows.append(data)
+            return JSONRenderer().render(rows)
+
+        def filter_logs_after():
+            chunks = log_dict_rows(logs, BENCHMARK_MODES, operator_names)
+            return encode([row for chunk in chunks for row in chunk])
+
+        row_count = logs.count()
+        if not row_count:
+            raise CommandError("MachineLog is empty, seed the database first")
+
+        mismatches = []
+        for name, before, after in (
+            ("MachineLogSerializer", serializer_before, serializer_after),
+            ("filter_logs rows", filter_logs_before, filter_logs_after),
+        ):
+            before_seconds, before_body = self._best_of(before, options["repeat"])
+            after_seconds, after_body = self._best_of(after, options["repeat"])
+            self.stdout.write(
+                f"{name}: {row_count / before_seconds:,.0f} rows/s before, "
+                f"{row_count / after_seconds:,.0f} rows/s after "
+                f"({before_seconds / after_seconds:.1f}x)"
+            )
+            if before_body != after_body:
+                mismatches.append(name)
+                self.stdout.write(self.style.ERROR(f"{name}: output differs"))
+
+        if mismatches:
+            raise CommandError(f"Projection output differs for: {', '.join(mismatches)}")
+        self.stdout.write(self.style.SUCCESS("Projection output is byte-identical"))
+
+    @staticmethod
+    def _best_of(run, repeat):
+        best = None
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            body = run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, body
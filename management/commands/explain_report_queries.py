@@ -0,0 +1,105 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ...models import MachineLog
+from ...operator_directory import operator_directory
+from ...pagination import KEYSET_ORDERING
+from ...report_queries import (
+    consolidated_day_totals, consolidated_logs, daily_rollups, hourly_rollups, hourly_totals, machine_logs,
+    operator_daily_seconds, operator_daily_totals, operator_logs, operator_rollups, operator_totals
+)
+
+# Plan lines that read a whole table, per database vendor
+SEQUENTIAL_SCAN_PATTERNS = {
+    "postgresql": re.compile(r"Seq Scan on (\S+)"),
+    "sqlite": re.compile(r"\bSCAN (?:TABLE )?(\S+)(?!.*\bUSING\b)"),
+}
+
+
+def sample_report_queries(sample):
+    """
+    The main queries of the report views, built by the same report_queries
+    functions the views call, for one sample date range, machine, line and
+    operator.
+
+    Returns:
+        list of (view name, queryset) pairs
+    """
+    from_date, to_date = sample["from_date"], sample["to_date"]
+    valid_operators = operator_directory.valid_rfids()
+    operator_sample = operator_logs(sample["operator"], from_date, to_date)
+    consolidated_sample = consolidated_logs(from_date, to_date, machine_ids=[sample["machine"]])
+    dates = [from_date + timedelta(days=offset) for offset in range((to_date - from_date).days + 1)]
+
+    return [
+        # The keyset query of page_logs, see pagination.py
+        ("get_machine_logs", machine_logs(from_date, to_date).order_by(*KEYSET_ORDERING).values_list(
+            "created_at", "id"
+        )[:100]),
+        ("filter_logs", machine_logs(from_date, to_date, line_number=sample["line"])),
+        ("filter_logs_by_machine_id", machine_logs(from_date, to_date, machine_id=sample["machine"])),
+        ("operator_report", operator_daily_totals(operator_sample)),
+        ("all_operators_report", operator_totals(from_date, to_date)),
+        ("get_consolidated_logs", consolidated_sample),
+        ("get_consolidated_logs summary", consolidated_day_totals(consolidated_sample, dates)),
+        ("line_reports", daily_rollups(from_date, to_date, valid_operators, line_number=sample["line"])),
+        ("machine_reports", daily_rollups(from_date, to_date, valid_operators, machine_id=sample["machine"])),
+        ("operator_reports_by_name", operator_rollups([sample["operator"]], from_date, to_date)),
+        ("operator_reports_all", operator_daily_seconds(valid_operators, from_date, to_date)),
+        ("intraday_utilization", hourly_totals(
+            hourly_rollups(to_date, valid_operators, line_number=sample["line"]), "LINE_NUMB"
+        )),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the queries of the report views and flag sequential "
+        "scans. Run it against a database seeded with production-sized data, "
+        "on small tables the planner may prefer a scan anyway."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Length of the sample date range")
+        parser.add_argument("--analyze", action="store_true", help="Use EXPLAIN ANALYZE (runs the queries)")
+        parser.add_argument("--verbose-plans", action="store_true", help="Print every plan, not only flagged ones")
+
+    def handle(self, *args, **options):
+        connection = connections[MachineLog.objects.db]
+        pattern = SEQUENTIAL_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            self.stderr.write(f"No sequential scan check for {connection.vendor}, printing the plans only")
+
+        # Sample filter values from the most recent log
+        latest = MachineLog.objects.order_by("-DATE", "-id").values(
+            "DATE", "MACHINE_ID", "LINE_NUMB", "OPERATOR_ID"
+        ).first()
+        if latest is None:
+            raise CommandError("MachineLog is empty, seed the database first")
+        sample = {
+            "from_date": latest["DATE"] - timedelta(days=options["days"] - 1),
+            "to_date": latest["DATE"],
+            "machine": latest["MACHINE_ID"],
+            "line": latest["LINE_NUMB"],
+            "operator": latest["OPERATOR_ID"],
+        }
+
+        explain_options = {"analyze": True} if options["analyze"] else {}
+        flagged = []
+        for name, queryset in sample_report_queries(sample):
+            plan = queryset.explain(**explain_options)
+            scanned = sorted(set(pattern.findall(plan))) if pattern else []
+            if scanned:
+                flagged.append(name)
+                self.stdout.write(self.style.WARNING(f"{name}: sequential scan on {', '.join(scanned)}"))
+            else:
+                self.stdout.write(f"{name}: ok")
+            if scanned or options["verbose_plans"] or pattern is None:
+                self.stdout.write(plan + "\n")
+
+        if flagged:
+            raise CommandError(f"Sequential scans in {len(flagged)} report queries: {', '.join(flagged)}")
+        self.stdout.write(self.style.SUCCESS("No sequential scans in the report queries"))
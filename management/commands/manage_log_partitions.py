@@ -0,0 +1,46 @@
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...partitions import (
+    PARTITION_MONTHS_AHEAD, add_months, detach_partitions, ensure_partitions, is_partitioned,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the upcoming monthly MachineLog partitions and detach the ones "
+        "older than the retention window. Run it monthly, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead", type=int, default=PARTITION_MONTHS_AHEAD,
+            help="Months to create ahead of the current one",
+        )
+        parser.add_argument("--keep-months", type=int, help="Detach partitions older than this many months")
+        parser.add_argument("--detach-before", help="Detach partitions of months before this one (YYYY-MM)")
+        parser.add_argument("--drop", action="store_true", help="Drop detached partitions instead of keeping them")
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("MachineLog is not partitioned (PostgreSQL with PARTITION_OPERATIONS applied)")
+
+        created = ensure_partitions(add_months(month_start(date.today()), options["ahead"]))
+        self.stdout.write(f"Created {len(created)} partitions: {', '.join(created) or '-'}")
+
+        before_month = None
+        if options["detach_before"]:
+            try:
+                before_month = datetime.strptime(options["detach_before"], "%Y-%m").date()
+            except ValueError:
+                raise CommandError("--detach-before must use the YYYY-MM format")
+        elif options["keep_months"]:
+            before_month = add_months(month_start(date.today()), -options["keep_months"])
+        if before_month is not None:
+            affected = detach_partitions(before_month, drop=options["drop"])
+            action = "Dropped" if options["drop"] else "Detached"
+            self.stdout.write(f"{action} {len(affected)} partitions: {', '.join(affected) or '-'}")
+
+        self.stdout.write(self.style.SUCCESS("Partitions are up to date"))
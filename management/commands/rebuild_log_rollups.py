@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import MachineLog
+from ...rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily and hourly machine log rollups from the raw logs. "
+        "Run it with --days 2 periodically (e.g. hourly) to repair the deltas lost "
+        "by killed workers; it is safe while ingestion is running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from-date", help="First date to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--to-date", help="Last date to rebuild (YYYY-MM-DD)")
+        parser.add_argument("--days", type=int, help="Rebuild the last N days up to today")
+        parser.add_argument("--all", action="store_true", help="Rebuild every logged date")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            dates = list(MachineLog.objects.dates("DATE", "day"))
+        elif options["days"]:
+            today = datetime.now().date()
+            dates = [today - timedelta(days=offset) for offset in range(options["days"])]
+        elif options["from_date"] and options["to_date"]:
+            try:
+                from_date = datetime.strptime(options["from_date"], "%Y-%m-%d").date()
+                to_date = datetime.strptime(options["to_date"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("Dates must use the YYYY-MM-DD format")
+            dates = [
+                from_date + timedelta(days=offset)
+                for offset in range((to_date - from_date).days + 1)
+            ]
+        else:
+            raise CommandError("Pass --all, --days N or --from-date and --to-date")
+
+        rebuild_rollups(dates)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {len(dates)} dates"))
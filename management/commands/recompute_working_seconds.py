@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import MachineLog
+from ...rollups import rebuild_rollups
+from ...working_time import recompute_working_seconds
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the working time of stored logs from the shift calendar "
+        "and rebuild the rollups of the changed dates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from-date", help="First date to recompute (YYYY-MM-DD)")
+        parser.add_argument("--to-date", help="Last date to recompute (YYYY-MM-DD)")
+        parser.add_argument("--days", type=int, help="Recompute the last N days up to today")
+        parser.add_argument("--all", action="store_true", help="Recompute every logged date")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            dates = list(MachineLog.objects.dates("DATE", "day"))
+        elif options["days"]:
+            today = datetime.now().date()
+            dates = [today - timedelta(days=offset) for offset in range(options["days"])]
+        elif options["from_date"] and options["to_date"]:
+            try:
+                from_date = datetime.strptime(options["from_date"], "%Y-%m-%d").date()
+                to_date = datetime.strptime(options["to_date"], "%Y-%m-%d").date()
+            except ValueError:
+                raise CommandError("Dates must use the YYYY-MM-DD format")
+            dates = [
+                from_date + timedelta(days=offset)
+                for offset in range((to_date - from_date).days + 1)
+            ]
+        else:
+            raise CommandError("Pass --all, --days N or --from-date and --to-date")
+
+        changed_dates = [log_date for log_date in dates if recompute_working_seconds([log_date])]
+        rebuild_rollups(changed_dates)
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {len(dates)} dates, rebuilt rollups for {len(changed_dates)}"
+        ))
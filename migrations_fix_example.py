@@ -0,0 +1,314 @@
+# Migration operations for the changes in models_fix_example.py.
+#
+# Create an empty migration for the app (manage.py makemigrations <app> --empty)
+# and use the operation list of each change as its operations.
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, Max, Min, Q, Value
+from django.db.models.functions import (
+    Cast, ExtractHour, ExtractMinute, ExtractSecond, Greatest, Least
+)
+
+# Label of the app that owns MachineLog. A literal, so the migrations do not
+# depend on the current models; historical models come from apps.get_model().
+APP_LABEL = "api"
+
+
+def remove_duplicate_machine_logs(apps, schema_editor):
+    """
+    Delete duplicate logs before the unique constraints are added.
+
+    For every (MACHINE_ID, DATE, START_TIME, END_TIME, Log ID) group the row
+    with the lowest id is kept. The constraints cover first transmissions
+    too, so this also deletes first transmissions (Log ID <= 1000) that
+    repeated a stored log, which the old exists() check had let in. The
+    number of deleted rows is printed per Log ID field.
+    """
+    MachineLog = apps.get_model(APP_LABEL, "MachineLog")
+    for log_id_field in ("Tx_LOGID", "Str_LOGID"):
+        deleted = 0
+        key_fields = ["MACHINE_ID", "DATE", "START_TIME", "END_TIME", log_id_field]
+        duplicate_groups = (
+            MachineLog.objects.filter(**{f"{log_id_field}__isnull": False})
+            .values(*key_fields)
+            .annotate(row_count=Count("id"), keep_id=Min("id"))
+            .filter(row_count__gt=1)
+        )
+        for group in duplicate_groups.iterator():
+            deleted += MachineLog.objects.filter(
+                **{field: group[field] for field in key_fields}
+            ).exclude(id=group["keep_id"]).delete()[0]
+        print(f"Deleted {deleted} machine logs with a duplicate {log_id_field}")
+
+
+# Unique Log ID constraints (conflict-ignoring inserts)
+UNIQUE_LOG_ID_OPERATIONS = [
+    migrations.RunPython(remove_duplicate_machine_logs, migrations.RunPython.noop),
+    migrations.AddConstraint(
+        model_name="machinelog",
+        constraint=models.UniqueConstraint(
+            fields=["MACHINE_ID", "DATE", "START_TIME", "END_TIME", "Tx_LOGID"],
+            condition=Q(Tx_LOGID__isnull=False),
+            name="unique_machine_log_tx_logid",
+        ),
+    ),
+    migrations.AddConstraint(
+        model_name="machinelog",
+        constraint=models.UniqueConstraint(
+            fields=["MACHINE_ID", "DATE", "START_TIME", "END_TIME", "Str_LOGID"],
+            condition=Q(Str_LOGID__isnull=False),
+            name="unique_machine_log_str_logid",
+        ),
+    ),
+]
+
+
+# Rows updated per statement when backfilling derived columns
+BACKFILL_BATCH_SIZE = 50000
+
+# Working hours at the time of the migration: 8:25 AM to 7:35 PM
+WORKDAY_START_SECONDS = 30300
+WORKDAY_END_SECONDS = 70500
+
+
+def backfill_machine_log_time_columns(apps, schema_editor):
+    """
+    Fill start_seconds, end_seconds, duration_seconds, working_seconds and
+    reserve_numeric for existing rows, one id range at a time.
+    """
+    MachineLog = apps.get_model(APP_LABEL, "MachineLog")
+    bounds = MachineLog.objects.aggregate(low=Min("id"), high=Max("id"))
+    if bounds["low"] is None:
+        return
+
+    for first_id in range(bounds["low"], bounds["high"] + 1, BACKFILL_BATCH_SIZE):
+        batch = MachineLog.objects.filter(id__gte=first_id, id__lt=first_id + BACKFILL_BATCH_SIZE)
+        batch.update(
+            start_seconds=(
+                ExtractHour("START_TIME") * 3600 + ExtractMinute("START_TIME") * 60 + ExtractSecond("START_TIME")
+            ),
+            end_seconds=(
+                ExtractHour("END_TIME") * 3600 + ExtractMinute("END_TIME") * 60 + ExtractSecond("END_TIME")
+            ),
+        )
+        batch.update(
+            duration_seconds=F("end_seconds") - F("start_seconds"),
+            working_seconds=Greatest(
+                Least(F("end_seconds"), Value(WORKDAY_END_SECONDS))
+                - Greatest(F("start_seconds"), Value(WORKDAY_START_SECONDS)),
+                Value(0),
+            ),
+        )
+        batch.filter(RESERVE__regex=r"^\s*-?[0-9]+\s*$").update(
+            reserve_numeric=Cast("RESERVE", output_field=IntegerField())
+        )
+
+
+# Precomputed time columns. The backfill clips working_seconds to the working
+# hours only; REPORT_BACKFILL_OPERATIONS removes the breaks once the shift
+# calendar exists.
+TIME_COLUMN_OPERATIONS = [
+    migrations.AddField(model_name="machinelog", name="start_seconds", field=models.IntegerField(null=True, blank=True)),
+    migrations.AddField(model_name="machinelog", name="end_seconds", field=models.IntegerField(null=True, blank=True)),
+    migrations.AddField(model_name="machinelog", name="duration_seconds", field=models.IntegerField(null=True, blank=True)),
+    migrations.AddField(model_name="machinelog", name="working_seconds", field=models.IntegerField(null=True, blank=True)),
+    migrations.AddField(model_name="machinelog", name="reserve_numeric", field=models.IntegerField(null=True, blank=True)),
+    migrations.RunPython(backfill_machine_log_time_columns, migrations.RunPython.noop),
+]
+
+
+# Daily rollup table, filled by REPORT_BACKFILL_OPERATIONS
+DAILY_ROLLUP_OPERATIONS = [
+    migrations.CreateModel(
+        name="MachineLogDailyRollup",
+        fields=[
+            ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+            ("DATE", models.DateField()),
+            ("LINE_NUMB", models.CharField(max_length=50)),
+            ("MACHINE_ID", models.CharField(max_length=50)),
+            ("OPERATOR_ID", models.CharField(max_length=50)),
+            ("MODE", models.IntegerField()),
+            ("duration_seconds", models.BigIntegerField(default=0)),
+            ("stitch_count", models.BigIntegerField(default=0)),
+            ("needle_runtime", models.FloatField(default=0)),
+            ("needle_stoptime", models.FloatField(default=0)),
+            ("speed_sum", models.BigIntegerField(default=0)),
+            ("speed_count", models.IntegerField(default=0)),
+            ("log_count", models.IntegerField(default=0)),
+        ],
+        options={
+            "constraints": [
+                models.UniqueConstraint(
+                    fields=["DATE", "LINE_NUMB", "MACHINE_ID", "OPERATOR_ID", "MODE"],
+                    name="unique_machine_log_daily_rollup",
+                ),
+            ],
+            "indexes": [
+                models.Index(fields=["DATE", "LINE_NUMB"], name="rollup_date_line_idx"),
+                models.Index(fields=["DATE", "MACHINE_ID"], name="rollup_date_machine_idx"),
+                models.Index(fields=["DATE", "OPERATOR_ID"], name="rollup_date_operator_idx"),
+            ],
+        },
+    ),
+]
+
+
+# Hourly rollup table, filled by REPORT_BACKFILL_OPERATIONS
+HOURLY_ROLLUP_OPERATIONS = [
+    migrations.CreateModel(
+        name="MachineLogHourlyRollup",
+        fields=[
+            ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+            ("DATE", models.DateField()),
+            ("HOUR", models.SmallIntegerField()),
+            ("LINE_NUMB", models.CharField(max_length=50)),
+            ("MACHINE_ID", models.CharField(max_length=50)),
+            ("OPERATOR_ID", models.CharField(max_length=50)),
+            ("MODE", models.IntegerField()),
+            ("duration_seconds", models.IntegerField(default=0)),
+            ("log_count", models.IntegerField(default=0)),
+        ],
+        options={
+            "constraints": [
+                models.UniqueConstraint(
+                    fields=["DATE", "HOUR", "LINE_NUMB", "MACHINE_ID", "OPERATOR_ID", "MODE"],
+                    name="unique_machine_log_hourly_rollup",
+                ),
+            ],
+            "indexes": [
+                models.Index(fields=["DATE", "LINE_NUMB", "HOUR"], name="hourly_date_line_idx"),
+                models.Index(fields=["DATE", "MACHINE_ID", "HOUR"], name="hourly_date_machine_idx"),
+            ],
+        },
+    ),
+]
+
+
+# Rollup generations, so rebuilds and the ingest deltas never count a log twice
+ROLLUP_GENERATION_OPERATIONS = [
+    migrations.CreateModel(
+        name="MachineLogRollupGeneration",
+        fields=[
+            ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+            ("DATE", models.DateField(unique=True)),
+            ("generation", models.BigIntegerField(default=0)),
+        ],
+    ),
+]
+
+
+# Shift calendar. Without rows every day uses the default shift of shift_calendar.py.
+SHIFT_CALENDAR_OPERATIONS = [
+    migrations.CreateModel(
+        name="ShiftPattern",
+        fields=[
+            ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+            ("LINE_NUMB", models.CharField(blank=True, default="", max_length=50)),
+            ("WEEKDAY", models.SmallIntegerField(blank=True, null=True)),
+            ("start_seconds", models.IntegerField(default=30300)),
+            ("end_seconds", models.IntegerField(default=70500)),
+            ("breaks", models.JSONField(blank=True, default=list)),
+        ],
+        options={
+            "constraints": [
+                models.UniqueConstraint(fields=["LINE_NUMB", "WEEKDAY"], name="unique_shift_pattern"),
+                # NULLs are distinct in the constraint above, so one "every day" row per line
+                models.UniqueConstraint(
+                    fields=["LINE_NUMB"], condition=Q(WEEKDAY__isnull=True), name="unique_shift_pattern_every_day"
+                ),
+            ],
+        },
+    ),
+    migrations.CreateModel(
+        name="Holiday",
+        fields=[
+            ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+            ("DATE", models.DateField()),
+            ("LINE_NUMB", models.CharField(blank=True, default="", max_length=50)),
+            ("description", models.CharField(blank=True, default="", max_length=100)),
+        ],
+        options={
+            "constraints": [
+                models.UniqueConstraint(fields=["DATE", "LINE_NUMB"], name="unique_holiday"),
+            ],
+        },
+    ),
+]
+
+
+# Composite indexes for the report access patterns. On PostgreSQL with a large
+# table, use django.contrib.postgres.operations.AddIndexConcurrently instead of
+# AddIndex (and atomic = False on the migration) to avoid locking out ingestion.
+# Check the plans afterwards with: manage.py explain_report_queries
+REPORT_INDEX_OPERATIONS = [
+    migrations.AddIndex(
+        model_name="machinelog",
+        index=models.Index(fields=["DATE", "MACHINE_ID"], name="machinelog_date_machine_idx"),
+    ),
+    migrations.AddIndex(
+        model_name="machinelog",
+        index=models.Index(fields=["DATE", "LINE_NUMB"], name="machinelog_date_line_idx"),
+    ),
+    migrations.AddIndex(
+        model_name="machinelog",
+        index=models.Index(fields=["DATE", "OPERATOR_ID"], name="machinelog_date_operator_idx"),
+    ),
+    migrations.AddIndex(
+        model_name="machinelog",
+        index=models.Index(fields=["DATE", "OPERATOR_ID"], condition=Q(MODE=1), name="machinelog_sewing_date_idx"),
+    ),
+    migrations.AddIndex(
+        model_name="machinelog",
+        index=models.Index(fields=["-created_at", "-id"], name="machinelog_created_at_idx"),
+    ),
+]
+
+
+def backfill_working_time_and_rollups(apps, schema_editor):
+    """
+    Recompute working_seconds of every logged date from the shift calendar,
+    which removes the breaks, then build the daily and hourly rollups.
+    """
+    MachineLog = apps.get_model(APP_LABEL, "MachineLog")
+    dates = list(MachineLog.objects.dates("DATE", "day"))
+    if not dates:
+        return
+    # The app's current code, as for the partitions below: the shift calendar
+    # and the rollup rebuild work on the current models
+    recompute_working_seconds = import_module(f"{APP_LABEL}.working_time").recompute_working_seconds
+    rebuild_rollups = import_module(f"{APP_LABEL}.rollups").rebuild_rollups
+
+    recompute_working_seconds(dates)
+    rebuild_rollups(dates)
+
+
+# Working time and rollups of the existing logs, so reports over historical
+# dates are right as soon as the migrations are applied. Uses the current
+# models, so put it after every operation list above, in a migration of its
+# own. On a large table, set atomic = False on that migration so every date
+# is committed on its own, and configure the shift calendar first.
+REPORT_BACKFILL_OPERATIONS = [
+    migrations.RunPython(backfill_working_time_and_rollups, migrations.RunPython.noop),
+]
+
+
+def partition_machine_logs(apps, schema_editor):
+    """Convert MachineLog to monthly partitions on PostgreSQL, other backends are left as they are."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    # Imported here so loading the migrations does not import the app's models.
+    # By its absolute name: pasted into the app's migrations package, a
+    # relative import would look for migrations/partitions.py.
+    convert_to_partitioned = import_module(f"{APP_LABEL}.partitions").convert_to_partitioned
+
+    convert_to_partitioned(schema_editor, apps.get_model(APP_LABEL, "MachineLog"))
+
+
+# Monthly partitions of MachineLog (PostgreSQL). The rows are copied in the
+# migration's transaction, so pause ingestion while it runs. Afterwards run
+# manage.py manage_log_partitions monthly (e.g. from cron) to create the
+# upcoming months.
+PARTITION_OPERATIONS = [
+    migrations.RunPython(partition_machine_logs, migrations.RunPython.noop),
+]
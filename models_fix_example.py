@@ -0,0 +1,155 @@
+# models.py
+from django.db import models
+from django.db.models import Q
+
+
+class MachineLog(models.Model):
+    # ... existing fields unchanged: MACHINE_ID, LINE_NUMB, OPERATOR_ID, DATE,
+    # START_TIME, END_TIME, MODE, STITCH_COUNT, NEEDLE_RUNTIME, NEEDLE_STOPTIME,
+    # RESERVE, Tx_LOGID, Str_LOGID, DEVICE_ID, created_at ...
+
+    # Derived at ingest so the reports can filter and sum plain columns
+    # instead of extracting hour / minute / second on every row
+    start_seconds = models.IntegerField(null=True, blank=True)  # START_TIME as seconds of day
+    end_seconds = models.IntegerField(null=True, blank=True)  # END_TIME as seconds of day
+    duration_seconds = models.IntegerField(null=True, blank=True)  # end_seconds - start_seconds
+    working_seconds = models.IntegerField(null=True, blank=True)  # duration within the shift, without breaks
+    reserve_numeric = models.IntegerField(null=True, blank=True)  # RESERVE (sewing speed) as integer
+
+    class Meta:
+        indexes = [
+            # Date range plus one machine, line or operator (filter_logs,
+            # operator_report, get_consolidated_logs, rollup rebuilds)
+            models.Index(fields=["DATE", "MACHINE_ID"], name="machinelog_date_machine_idx"),
+            models.Index(fields=["DATE", "LINE_NUMB"], name="machinelog_date_line_idx"),
+            models.Index(fields=["DATE", "OPERATOR_ID"], name="machinelog_date_operator_idx"),
+            # Sewing logs only, a small fraction of the table
+            models.Index(
+                fields=["DATE", "OPERATOR_ID"], condition=Q(MODE=1), name="machinelog_sewing_date_idx"
+            ),
+            # Newest-first listing of get_machine_logs
+            models.Index(fields=["-created_at", "-id"], name="machinelog_created_at_idx"),
+        ]
+        constraints = [
+            # A retransmitted log (adjusted Log ID) may only be stored once per
+            # machine, date and time window. NULL IDs are left out so logs that
+            # only carry the other ID are not affected. This also applies to
+            # first transmissions: a log repeating the Log ID and time window
+            # of a stored one is skipped.
+            models.UniqueConstraint(
+                fields=["MACHINE_ID", "DATE", "START_TIME", "END_TIME", "Tx_LOGID"],
+                condition=Q(Tx_LOGID__isnull=False),
+                name="unique_machine_log_tx_logid",
+            ),
+            models.UniqueConstraint(
+                fields=["MACHINE_ID", "DATE", "START_TIME", "END_TIME", "Str_LOGID"],
+                condition=Q(Str_LOGID__isnull=False),
+                name="unique_machine_log_str_logid",
+            ),
+        ]
+
+
+class MachineLogDailyRollup(models.Model):
+    """
+    Per-day sums of the logs that count towards the reports, one row per
+    date, line, machine, operator and mode. Maintained by rollups.py.
+    """
+    DATE = models.DateField()
+    LINE_NUMB = models.CharField(max_length=50)
+    MACHINE_ID = models.CharField(max_length=50)
+    OPERATOR_ID = models.CharField(max_length=50)
+    MODE = models.IntegerField()
+
+    duration_seconds = models.BigIntegerField(default=0)  # Sum of the logs' working_seconds
+    stitch_count = models.BigIntegerField(default=0)
+    needle_runtime = models.FloatField(default=0)
+    needle_stoptime = models.FloatField(default=0)
+    speed_sum = models.BigIntegerField(default=0)  # Sum of positive sewing speeds
+    speed_count = models.IntegerField(default=0)  # Logs with a positive sewing speed
+    log_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["DATE", "LINE_NUMB", "MACHINE_ID", "OPERATOR_ID", "MODE"],
+                name="unique_machine_log_daily_rollup",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["DATE", "LINE_NUMB"], name="rollup_date_line_idx"),
+            models.Index(fields=["DATE", "MACHINE_ID"], name="rollup_date_machine_idx"),
+            models.Index(fields=["DATE", "OPERATOR_ID"], name="rollup_date_operator_idx"),
+        ]
+
+
+class MachineLogHourlyRollup(models.Model):
+    """
+    Per-hour sums of the logs that count towards the reports. A log crossing
+    an hour boundary is split between the hours it covers. Maintained by
+    rollups.py.
+    """
+    DATE = models.DateField()
+    HOUR = models.SmallIntegerField()  # Hour of day, 0-23
+    LINE_NUMB = models.CharField(max_length=50)
+    MACHINE_ID = models.CharField(max_length=50)
+    OPERATOR_ID = models.CharField(max_length=50)
+    MODE = models.IntegerField()
+
+    duration_seconds = models.IntegerField(default=0)  # Working seconds of the logs within this hour
+    log_count = models.IntegerField(default=0)  # Logs overlapping this hour
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["DATE", "HOUR", "LINE_NUMB", "MACHINE_ID", "OPERATOR_ID", "MODE"],
+                name="unique_machine_log_hourly_rollup",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["DATE", "LINE_NUMB", "HOUR"], name="hourly_date_line_idx"),
+            models.Index(fields=["DATE", "MACHINE_ID", "HOUR"], name="hourly_date_machine_idx"),
+        ]
+
+
+class MachineLogRollupGeneration(models.Model):
+    """
+    Generation of a date's rollups, bumped by every rebuild of the date.
+    Ingest tags its pending rollup deltas with the generation it saw and the
+    flush drops deltas of an older generation, whose logs the rebuild has
+    already counted. See rollups.py.
+    """
+    DATE = models.DateField(unique=True)
+    generation = models.BigIntegerField(default=0)
+
+
+class ShiftPattern(models.Model):
+    """
+    Working hours of a line on a weekday, in seconds of day. Blank LINE_NUMB
+    applies to all lines, a null WEEKDAY to every day. See shift_calendar.py.
+    """
+    LINE_NUMB = models.CharField(max_length=50, blank=True, default="")
+    WEEKDAY = models.SmallIntegerField(null=True, blank=True)  # Monday = 0 ... Sunday = 6
+    start_seconds = models.IntegerField(default=30300)  # 8:25 AM
+    end_seconds = models.IntegerField(default=70500)  # 7:35 PM
+    breaks = models.JSONField(default=list, blank=True)  # [[start_seconds, end_seconds], ...]
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["LINE_NUMB", "WEEKDAY"], name="unique_shift_pattern"),
+            # NULLs are distinct in the constraint above, so one "every day" row per line
+            models.UniqueConstraint(
+                fields=["LINE_NUMB"], condition=Q(WEEKDAY__isnull=True), name="unique_shift_pattern_every_day"
+            ),
+        ]
+
+
+class Holiday(models.Model):
+    """A date without working time. Blank LINE_NUMB applies to all lines."""
+    DATE = models.DateField()
+    LINE_NUMB = models.CharField(max_length=50, blank=True, default="")
+    description = models.CharField(max_length=100, blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["DATE", "LINE_NUMB"], name="unique_holiday"),
+        ]
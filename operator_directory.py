@@ -0,0 +1,127 @@
+"""
+Process-wide cache of the Operator table for the report views.
+
+The directory maps RFID card numbers to operator names and back, and holds
+the set of registered RFIDs. It is loaded once per process on first use.
+Saving or deleting an Operator drops the local copy and bumps a version
+stamp in the Django cache, so other processes sharing that cache reload
+once they see it. The stamp is read at most every
+MACHINE_LOG_OPERATOR_DIRECTORY_CHECK_SECONDS, not on every lookup, so a
+shared cache backend costs no round trip per report row. With a per-process
+cache backend, other processes reload after
+MACHINE_LOG_OPERATOR_DIRECTORY_TTL seconds at the latest.
+
+Views resolving many rows take one snapshot (names_by_rfid()) before their
+loop.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Operator
+
+logger = logging.getLogger(__name__)
+
+# Cache key of the version stamp shared by all processes
+VERSION_CACHE_KEY = "machine_log:operator_directory:version"
+
+
+class OperatorDirectory:
+    """
+    Cached RFID <-> name lookups.
+
+    Args:
+        load: callable returning (rfid_card_no, operator_name) pairs
+        ttl: seconds after which the directory is reloaded even without an
+            invalidation, None to keep it until invalidated
+        check_seconds: seconds between reads of the shared version stamp
+    """
+
+    def __init__(self, load, ttl=None, check_seconds=1.0):
+        self._load = load
+        self.ttl = ttl
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def _current_version(self):
+        try:
+            return cache.get(VERSION_CACHE_KEY, 0)
+        except Exception:
+            logger.exception("Could not read operator directory version")
+            return self._version
+
+    def _get(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        expired = self.ttl is not None and now - self._loaded_at > self.ttl
+        if snapshot is not None and not expired and now - self._checked_at < self.check_seconds:
+            return snapshot
+
+        version = self._current_version()
+        self._checked_at = now
+        if snapshot is not None and version == self._version and not expired:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is snapshot:
+                names_by_rfid = {}
+                rfids_by_name = {}
+                for rfid, name in self._load():
+                    names_by_rfid[rfid] = name
+                    rfids_by_name.setdefault(name, []).append(rfid)
+                self._snapshot = (
+                    names_by_rfid,
+                    {name: tuple(rfids) for name, rfids in rfids_by_name.items()},
+                    frozenset(names_by_rfid),
+                )
+                self._version = version
+                self._loaded_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self):
+        """Drop the local copy and make other processes reload theirs."""
+        with self._lock:
+            self._snapshot = None
+        try:
+            cache.add(VERSION_CACHE_KEY, 0, timeout=None)
+            cache.incr(VERSION_CACHE_KEY)
+        except Exception:
+            logger.exception("Could not bump operator directory version")
+
+    def name_of(self, rfid, default=None):
+        """Name of the operator with this RFID card number."""
+        return self._get()[0].get(rfid, default)
+
+    def rfids_of(self, name):
+        """RFID card numbers registered under this operator name (may be empty)."""
+        return self._get()[1].get(name, ())
+
+    def names_by_rfid(self):
+        """Dict of RFID card number to operator name, in Operator id order."""
+        return self._get()[0]
+
+    def valid_rfids(self):
+        """Set of the RFID card numbers of all registered operators."""
+        return self._get()[2]
+
+
+operator_directory = OperatorDirectory(
+    load=lambda: Operator.objects.order_by("pk").values_list("rfid_card_no", "operator_name"),
+    ttl=getattr(settings, "MACHINE_LOG_OPERATOR_DIRECTORY_TTL", 300),
+    check_seconds=getattr(settings, "MACHINE_LOG_OPERATOR_DIRECTORY_CHECK_SECONDS", 1.0),
+)
+
+
+@receiver(post_save, sender=Operator)
+@receiver(post_delete, sender=Operator)
+def invalidate_operator_directory(sender, **kwargs):
+    operator_directory.invalidate()
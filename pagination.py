@@ -0,0 +1,134 @@
+"""
+Keyset (cursor) pagination of the raw log endpoints.
+
+Pages are ordered newest first by (created_at, id) and continue strictly
+after the last log of the previous page:
+
+    WHERE created_at < c OR (created_at = c AND id < i)
+    ORDER BY created_at DESC, id DESC LIMIT n
+
+which the (-created_at, -id) index of MachineLog answers directly, so a
+deep page costs the same as the first one (no OFFSET scan). Only the keys
+are read by that query; the page's rows are returned as a queryset on their
+ids, so the views serialize them with their values_list projections (see
+projection.py) instead of model instances. The position is
+handed to the client as an opaque `next` token. It also carries the number
+of logs already returned, for the running row index.
+
+Endpoints that read the Parquet archive page through the hot table first
+and then continue into the archived logs, newest first by (DATE, id) there
+so the position is a filter on the archive's own sort keys (see
+archive.archived_page).
+"""
+import base64
+import json
+from collections import namedtuple
+from datetime import date, datetime
+
+from django.conf import settings
+from django.db.models import Q
+
+from .archive import archived_page
+
+# Largest page size a client may request
+PAGE_MAX_LIMIT = getattr(settings, "MACHINE_LOG_PAGE_MAX_LIMIT", 1000)
+KEYSET_ORDERING = ("-created_at", "-id")
+
+# Hot logs of the page (a queryset in page order), archived logs of the page
+# (unsaved MachineLog instances, after the hot ones), token of the next page
+# (None on the last page) and the running index of the first log
+Page = namedtuple("Page", ["hot_logs", "archived_logs", "next_cursor", "first_index"])
+
+
+def parse_limit(value):
+    """Page size from the limit query parameter. Raises ValueError with a client message."""
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= PAGE_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {PAGE_MAX_LIMIT}")
+    return limit
+
+
+def encode_cursor(position):
+    payload = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Position stored in a cursor token. Raises ValueError for a malformed token."""
+    try:
+        payload = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        position = json.loads(payload)
+        int(position["index"])
+        if "created_at" in position:
+            position["created_at"] = datetime.fromisoformat(position["created_at"])
+            int(position["id"])
+        if "date" in position:
+            position["date"] = date.fromisoformat(position["date"])
+            int(position["id"])
+    except (TypeError, KeyError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if position.get("source") not in ("db", "archive"):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+def _next_cursor(source, key, index):
+    """
+    Token continuing after the log with this sort key, (created_at, id) or
+    (DATE, id), or at the start of the source when key is None.
+    """
+    position = {"source": source, "index": index}
+    if key is not None and source == "db":
+        position.update(created_at=key[0].isoformat(), id=key[1])
+    elif key is not None:
+        position.update(date=key[0].isoformat(), id=key[1])
+    return encode_cursor(position)
+
+
+def page_logs(queryset, limit, cursor=None, archive=None):
+    """
+    One page of logs, newest first.
+
+    Args:
+        queryset: filtered MachineLog queryset
+        limit: page size
+        cursor: `next` token of the previous page, None for the first page
+        archive: dict of archive.archived_page() arguments (dates and
+            filters) to continue into the archived logs, None for hot logs only
+    """
+    position = decode_cursor(cursor) if cursor else {"source": "db", "index": 0}
+    offset = position["index"]
+    before = None
+    if position["source"] == "db" and "created_at" in position:
+        before = (position["created_at"], position["id"])
+    elif position["source"] == "archive" and "date" in position:
+        before = (position["date"], position["id"])
+
+    keys = []
+    if position["source"] == "db":
+        page = queryset.order_by(*KEYSET_ORDERING)
+        if before is not None:
+            created_at, log_id = before
+            page = page.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=log_id))
+        keys = list(page.values_list("created_at", "id")[:limit + 1])
+        hot_logs = queryset.filter(id__in=[log_id for _, log_id in keys[:limit]]).order_by(*KEYSET_ORDERING)
+        if len(keys) > limit:
+            return Page(hot_logs, [], _next_cursor("db", keys[limit - 1], offset + limit), offset + 1)
+        # Hot logs exhausted, the rest of the page starts the archive
+        before = None
+    else:
+        hot_logs = queryset.none()
+
+    if archive is None:
+        return Page(hot_logs, [], None, offset + 1)
+
+    remaining = limit - len(keys)
+    archived = archived_page(limit=remaining + 1, before=before, **archive)
+    if len(archived) > remaining:
+        last_archived = archived[remaining - 1] if remaining else None
+        last_key = (last_archived.DATE, last_archived.id) if last_archived is not None else None
+        return Page(hot_logs, archived[:remaining], _next_cursor("archive", last_key, offset + limit), offset + 1)
+    return Page(hot_logs, archived, None, offset + 1)
@@ -0,0 +1,280 @@
+"""
+Monthly range partitioning of the MachineLog table (PostgreSQL).
+
+The table is partitioned by RANGE ("DATE") with one partition per calendar
+month, named <table>_yYYYYmMM, plus a default partition that catches logs
+outside the created months (e.g. a device with a wrong clock). Every report
+query filters on DATE, so the planner prunes the partitions outside the
+requested range and vacuum / index maintenance run per month instead of on
+one giant table.
+
+manage.py manage_log_partitions creates the upcoming months ahead of ingest
+and detaches (or drops) months that left the retention window. A detached
+month stays a plain table, e.g. to archive it before dropping.
+
+Other database backends are not partitioned; their date-filtered queries use
+the (DATE, ...) indexes of MachineLog instead.
+"""
+import re
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import MachineLog
+
+# Months created ahead of the current one
+PARTITION_MONTHS_AHEAD = getattr(settings, "MACHINE_LOG_PARTITION_MONTHS_AHEAD", 3)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, count):
+    """First day of the month count months after (or before) month."""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def next_month(month):
+    return add_months(month, 1)
+
+
+def partition_name(month, table=None):
+    table = table or MachineLog._meta.db_table
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def default_partition_name(table=None):
+    return f"{table or MachineLog._meta.db_table}_default"
+
+
+def supports_partitioning(conn=connection):
+    return conn.vendor == "postgresql"
+
+
+def is_partitioned(conn=connection):
+    """Whether the MachineLog table is a partitioned table."""
+    if not supports_partitioning(conn):
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [MachineLog._meta.db_table],
+        )
+        return cursor.fetchone() is not None
+
+
+def attached_partitions(conn=connection):
+    """Dict of month (first day) to partition name of the attached monthly partitions."""
+    table = MachineLog._meta.db_table
+    pattern = re.compile(rf"^{re.escape(table)}_y(\d{{4}})m(\d{{2}})$")
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+            [table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_partition(month, conn=connection):
+    """
+    Create the partition of one month. Rows of that month that were already
+    caught by the default partition are moved into it.
+    """
+    qn = conn.ops.quote_name
+    table = MachineLog._meta.db_table
+    name = partition_name(month, table)
+    bounds = [month, next_month(month)]
+    with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+        cursor.execute(
+            f'SELECT 1 FROM {qn(default_partition_name(table))} '
+            f'WHERE "DATE" >= %s AND "DATE" < %s LIMIT 1',
+            bounds,
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {qn(name)} PARTITION OF {qn(table)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                bounds,
+            )
+            return
+
+        # Attaching a month that overlaps rows of the default partition
+        # fails, so move them into the new table first
+        cursor.execute(f"CREATE TABLE {qn(name)} (LIKE {qn(table)} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {qn(default_partition_name(table))} '
+            f'WHERE "DATE" >= %s AND "DATE" < %s RETURNING *) '
+            f"INSERT INTO {qn(name)} SELECT * FROM moved",
+            bounds,
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)",
+            bounds,
+        )
+
+
+def ensure_partitions(through_month, from_month=None, conn=connection):
+    """
+    Create the missing monthly partitions up to through_month (inclusive),
+    starting at from_month or the current month. Returns the created names.
+    """
+    existing = attached_partitions(conn)
+    month = month_start(from_month or date.today())
+    created = []
+    while month <= through_month:
+        if month not in existing:
+            create_partition(month, conn)
+            created.append(partition_name(month))
+        month = next_month(month)
+    return created
+
+
+def detach_partitions(before_month, drop=False, conn=connection):
+    """
+    Detach the monthly partitions older than before_month. Detached months
+    stay plain tables unless drop is set. Returns the affected names.
+    """
+    qn = conn.ops.quote_name
+    table = MachineLog._meta.db_table
+    affected = []
+    for month, name in sorted(attached_partitions(conn).items()):
+        if month >= before_month:
+            continue
+        with conn.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(name)}")
+            if drop:
+                cursor.execute(f"DROP TABLE {qn(name)}")
+        affected.append(name)
+    return affected
+
+
+def _dependent_definitions(cursor, table):
+    """
+    (index definitions, [(name, constraint definition)]) of a table, read
+    from the catalog: every index except the primary key and the ones
+    backing a constraint, and its unique, exclusion and foreign key
+    constraints. CHECK constraints are copied by CREATE TABLE ... LIKE.
+    """
+    cursor.execute(
+        "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "JOIN pg_class c ON c.oid = i.indrelid "
+        "WHERE c.relname = %s AND pg_table_is_visible(c.oid) AND NOT i.indisprimary "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint k "
+        "WHERE k.conrelid = i.indrelid AND k.conindid = i.indexrelid)",
+        [table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT k.conname, pg_get_constraintdef(k.oid) FROM pg_constraint k "
+        "JOIN pg_class c ON c.oid = k.conrelid "
+        "WHERE c.relname = %s AND pg_table_is_visible(c.oid) AND k.contype IN ('u', 'x', 'f')",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _referencing_foreign_keys(cursor, table):
+    """Names of the foreign keys, in this table or others, that reference the table."""
+    cursor.execute(
+        "SELECT k.conrelid::regclass::text || '.' || k.conname FROM pg_constraint k "
+        "JOIN pg_class c ON c.oid = k.confrelid "
+        "WHERE c.relname = %s AND pg_table_is_visible(c.oid) AND k.contype = 'f'",
+        [table],
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def convert_to_partitioned(schema_editor, model):
+    """
+    Replace the plain MachineLog table by a partitioned one holding the same
+    rows (migration helper, PostgreSQL only).
+
+    Args:
+        schema_editor: schema editor of the migration
+        model: the historical MachineLog model of the migration
+
+    The new table gets a sequence of its own continuing the ids, and a
+    primary key of (id, DATE), since unique keys of a partitioned table must
+    contain the partition column. Nothing can reference id alone afterwards,
+    so the conversion refuses to run while foreign keys point at the table.
+    Defaults, CHECK constraints, storage and statistics settings are copied
+    with LIKE ... INCLUDING ALL. The indexes (db_index fields, Meta.indexes
+    and any created by hand) and the unique and foreign key constraints are
+    recreated from the catalog. Pause ingestion while it runs; the ingest
+    spool keeps the logs.
+    """
+    conn = schema_editor.connection
+    qn = conn.ops.quote_name
+    table = model._meta.db_table
+    staging = f"{table}_partitioned"
+    sequence = f"{table}_partitioned_id_seq"
+
+    with conn.cursor() as cursor:
+        referencing = _referencing_foreign_keys(cursor, table)
+        if referencing:
+            raise RuntimeError(
+                f"Cannot partition {table}: its primary key becomes (id, DATE), so these "
+                f"foreign keys to it cannot be kept: {', '.join(referencing)}. "
+                f"Drop them or make them reference (id, DATE) first."
+            )
+        indexes, constraints = _dependent_definitions(cursor, table)
+
+        cursor.execute(f'SELECT MIN("DATE"), MAX("DATE"), MAX(id) FROM {qn(table)}')
+        first_date, last_date, max_id = cursor.fetchone()
+
+        # Indexes are recreated below once the old ones are dropped with the
+        # old table, the id gets its own sequence instead of an identity
+        cursor.execute(
+            f"CREATE TABLE {qn(staging)} (LIKE {qn(table)} INCLUDING ALL EXCLUDING INDEXES "
+            f'EXCLUDING IDENTITY) PARTITION BY RANGE ("DATE")'
+        )
+        cursor.execute(f"CREATE SEQUENCE {qn(sequence)} OWNED BY {qn(staging)}.id")
+        cursor.execute("SELECT setval(%s, %s)", [sequence, max(max_id or 0, 1)])
+        cursor.execute(f"ALTER TABLE {qn(staging)} ALTER COLUMN id SET DEFAULT nextval(%s)", [sequence])
+        cursor.execute(
+            f"CREATE TABLE {qn(default_partition_name(table))} PARTITION OF {qn(staging)} DEFAULT"
+        )
+
+        # One partition per month with logs, copied month by month
+        month = month_start(first_date or date.today())
+        last_month = month_start(max(last_date or date.today(), date.today()))
+        while month <= last_month:
+            bounds = [month, next_month(month)]
+            cursor.execute(
+                f"CREATE TABLE {qn(partition_name(month, table))} PARTITION OF {qn(staging)} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                bounds,
+            )
+            cursor.execute(
+                f'INSERT INTO {qn(staging)} SELECT * FROM {qn(table)} WHERE "DATE" >= %s AND "DATE" < %s',
+                bounds,
+            )
+            month = next_month(month)
+        # Logs without a DATE land in the default partition and make the
+        # primary key below fail, which rolls the conversion back
+        cursor.execute(f'INSERT INTO {qn(staging)} SELECT * FROM {qn(table)} WHERE "DATE" IS NULL')
+
+        cursor.execute(f"DROP TABLE {qn(table)}")
+        cursor.execute(f"ALTER TABLE {qn(staging)} RENAME TO {qn(table)}")
+        cursor.execute(f"ALTER SEQUENCE {qn(sequence)} RENAME TO {qn(table + '_id_seq')}")
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, "DATE")')
+
+        # The definitions name the table, which is now the partitioned one.
+        # Created on the parent, PostgreSQL adds them to every partition.
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}")
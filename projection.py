@@ -0,0 +1,137 @@
+"""
+Fast row serialization of MachineLog querysets for the raw log endpoints.
+
+Serializing logs through model instances and MachineLogSerializer costs a
+model instance, a bound serializer and an attribute lookup chain per row.
+Here only the needed columns are fetched with values_list and every row is
+built as a plain dict from precompiled converters:
+
+- machine_log_projection.rows() yields the rows MachineLogSerializer would
+  produce. The projection is derived from the serializer's own fields and
+  uses their to_representation, so the output is the same. Serializers with
+  fields that need the instance (method fields, nested or dotted sources)
+  fall back to the serializer.
+- log_dict_rows() yields the filter_logs rows (the model fields plus
+  mode_description and operator_name), with the mode descriptions and
+  operator names joined from the maps passed in.
+
+The dicts are encoded with streaming.encode, i.e. the JSONRenderer settings
+through the C-accelerated json encoder. manage.py benchmark_log_serializers
+compares both paths and checks the bytes are identical.
+"""
+from rest_framework import serializers
+from rest_framework.fields import HiddenField
+
+from .models import MachineLog
+from .serializers import MachineLogSerializer
+from .streaming import STREAM_CHUNK_SIZE, chunked
+
+
+def _identity(value):
+    return value
+
+
+def _column(field):
+    """(source column, converter) of one serializer field, or None if it needs the instance."""
+    if field.source == "*" or len(field.source_attrs) != 1:
+        return None
+    if isinstance(field, (serializers.SerializerMethodField, serializers.BaseSerializer, HiddenField)):
+        return None
+    if isinstance(field, serializers.PrimaryKeyRelatedField):
+        # The serializer reads the foreign key column, not the related row
+        attname = MachineLog._meta.get_field(field.source).attname
+        return attname, field.pk_field.to_representation if field.pk_field else _identity
+    if isinstance(field, (serializers.RelatedField, serializers.ManyRelatedField)):
+        return None
+    return field.source, field.to_representation
+
+
+class SerializerProjection:
+    """
+    values_list projection of a MachineLog ModelSerializer.
+
+    Args:
+        serializer_class: the serializer whose output is reproduced
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._columns = None
+
+    @property
+    def columns(self):
+        """(output key, source, converter) per readable field, or None when unsupported."""
+        if self._columns is None:
+            columns = []
+            for field in self.serializer_class().fields.values():
+                if field.write_only:
+                    continue
+                column = _column(field)
+                if column is None:
+                    columns = False
+                    break
+                columns.append((field.field_name,) + column)
+            self._columns = columns
+        return self._columns or None
+
+    def _supports(self, queryset):
+        if self.columns is None:
+            return False
+        model_columns = {field.attname for field in MachineLog._meta.concrete_fields}
+        model_columns.update(field.name for field in MachineLog._meta.concrete_fields)
+        return all(
+            source in model_columns or source in queryset.query.annotations
+            for _, source, _ in self.columns
+        )
+
+    def rows(self, queryset, chunk_size=STREAM_CHUNK_SIZE):
+        """Yield the serialized rows of a queryset, one list per chunk."""
+        if not self._supports(queryset):
+            for chunk in chunked(queryset.iterator(chunk_size=chunk_size), chunk_size):
+                yield self.serializer_class(chunk, many=True).data
+            return
+
+        values = queryset.values_list(*[source for _, source, _ in self.columns])
+        for chunk in chunked(values.iterator(chunk_size=chunk_size), chunk_size):
+            yield [self._row(row) for row in chunk]
+
+    def _row(self, values):
+        return {
+            key: None if value is None else convert(value)
+            for (key, _, convert), value in zip(self.columns, values)
+        }
+
+    def instance_rows(self, instances):
+        """Serialized rows of model instances, e.g. archived logs."""
+        if self.columns is None:
+            return self.serializer_class(instances, many=True).data
+        return [
+            self._row([getattr(instance, source) for _, source, _ in self.columns])
+            for instance in instances
+        ]
+
+
+machine_log_projection = SerializerProjection(MachineLogSerializer)
+
+
+def log_dict_rows(queryset, modes, operator_names, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield the filter_logs rows of a queryset, one list per chunk: every
+    model field, then mode_description and operator_name.
+
+    Args:
+        modes: dict of MODE to its description
+        operator_names: dict of RFID to operator name
+    """
+    keys = [field.attname for field in MachineLog._meta.concrete_fields]
+    mode_index = keys.index("MODE")
+    operator_index = keys.index("OPERATOR_ID")
+    for chunk in chunked(queryset.values_list(*keys).iterator(chunk_size=chunk_size), chunk_size):
+        rows = []
+        for row in chunk:
+            data = dict(zip(keys, row))
+            operator_id = row[operator_index]
+            data['mode_description'] = modes.get(row[mode_index], 'Unknown mode')
+            data['operator_name'] = operator_names.get(operator_id, "") if operator_id != "0" else ""
+            rows.append(data)
+        yield rows
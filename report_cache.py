@@ -0,0 +1,175 @@
+"""
+Result cache of the report views, split into per-day partials.
+
+A report over a date range is assembled from one partial per day, cached
+under (endpoint, filters, date). Logs of a closed day normally never change,
+so partials of dates before today are kept until they are evicted (LRU,
+MACHINE_LOG_REPORT_CACHE_SIZE entries) or invalidated. Today is always
+recomputed.
+
+A late log for a past date makes the ingest path and the rollup flush call
+invalidate_dates(). This drops the local partials of that date and bumps a
+per-date generation in the Django cache, so other processes sharing that
+cache drop theirs on the next read. With a per-process cache backend (the
+default LocMemCache) other processes never see the bump, so every partial
+is also recomputed after MACHINE_LOG_REPORT_CACHE_TTL seconds at the latest.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+from .report_engine import ReportColumns
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the per-date generation keys in the Django cache
+GENERATION_KEY_PREFIX = "machine_log:report_cache:generation:"
+
+
+def _generation_key(log_date):
+    return f"{GENERATION_KEY_PREFIX}{log_date.isoformat()}"
+
+
+def report_dates(queryset, from_date=None, to_date=None):
+    """
+    Every date between from_date and to_date (inclusive). A missing bound is
+    taken from the first / last DATE in the queryset.
+    """
+    if from_date is None or to_date is None:
+        bounds = queryset.aggregate(first=Min("DATE"), last=Max("DATE"))
+        from_date = from_date or bounds["first"]
+        to_date = to_date or bounds["last"]
+    if from_date is None or to_date is None or from_date > to_date:
+        return []
+    return [from_date + timedelta(days=offset) for offset in range((to_date - from_date).days + 1)]
+
+
+class ReportCache:
+    """
+    Size-bounded LRU of per-day report partials.
+
+    Args:
+        max_entries: partials kept before the least recently used is evicted
+        ttl: seconds after which a partial is recomputed even without an
+            invalidation, None to keep it until evicted or invalidated
+    """
+
+    def __init__(self, max_entries=20000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (endpoint, filters, date) -> (generation, time.monotonic() when cached, partial)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _generations(self, dates):
+        keys = {_generation_key(log_date): log_date for log_date in dates}
+        try:
+            found = cache.get_many(list(keys))
+        except Exception:
+            logger.exception("Could not read report cache generations")
+            return None
+        return {log_date: found.get(key, 0) for key, log_date in keys.items()}
+
+    def days(self, endpoint, filters, dates, compute):
+        """
+        Partials of the given dates, in date order.
+
+        Args:
+            endpoint: name of the report
+            filters: hashable tuple of everything else the partials depend on
+            dates: dates of the report
+            compute: callable(dates) returning {date: partial} for the dates
+                that are not cached; dates missing from the result get None
+        """
+        today = datetime.now().date()
+        closed = [log_date for log_date in dates if log_date < today]
+        generations = self._generations(closed) if closed else {}
+        if generations is None:
+            # Without the shared generations a cached partial might be stale
+            closed, generations = [], {}
+
+        partials = {}
+        now = time.monotonic()
+        with self._lock:
+            for log_date in closed:
+                key = (endpoint, filters, log_date)
+                entry = self._entries.get(key)
+                if entry is None or entry[0] != generations[log_date]:
+                    continue
+                if self.ttl is not None and now - entry[1] > self.ttl:
+                    continue
+                self._entries.move_to_end(key)
+                partials[log_date] = entry[2]
+            self.stats["hits"] += len(partials)
+            self.stats["misses"] += len(dates) - len(partials)
+
+        missing = [log_date for log_date in dates if log_date not in partials]
+        if missing:
+            computed = compute(missing)
+            cached_at = time.monotonic()
+            with self._lock:
+                for log_date in missing:
+                    partial = computed.get(log_date)
+                    partials[log_date] = partial
+                    if log_date in generations:
+                        key = (endpoint, filters, log_date)
+                        self._entries[key] = (generations[log_date], cached_at, partial)
+                        self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.stats["evictions"] += 1
+
+        return [partials[log_date] for log_date in dates]
+
+    def invalidate_dates(self, dates):
+        """Drop the partials of past dates that received new logs."""
+        today = datetime.now().date()
+        dates = {log_date for log_date in dates if log_date < today}
+        if not dates:
+            return
+        with self._lock:
+            stale_keys = [key for key in self._entries if key[2] in dates]
+            for key in stale_keys:
+                del self._entries[key]
+            self.stats["invalidations"] += len(stale_keys)
+        for log_date in dates:
+            try:
+                cache.add(_generation_key(log_date), 0, timeout=None)
+                cache.incr(_generation_key(log_date))
+            except Exception:
+                logger.exception("Could not bump report cache generation")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {"entries": len(self._entries), "maxEntries": self.max_entries, "ttl": self.ttl, **self.stats}
+
+
+report_cache = ReportCache(
+    max_entries=getattr(settings, "MACHINE_LOG_REPORT_CACHE_SIZE", 20000),
+    ttl=getattr(settings, "MACHINE_LOG_REPORT_CACHE_TTL", 300),
+)
+
+
+def cached_report_columns(endpoint, filters, rollups, from_date=None, to_date=None):
+    """
+    ReportColumns of a MachineLogDailyRollup queryset over a date range,
+    assembled from cached per-day partials. The dates that are not cached
+    are fetched with one query.
+    """
+    def compute(dates):
+        columns = ReportColumns.from_rollups(rollups.filter(DATE__in=dates))
+        return dict(columns.partition("DATE"))
+
+    dates = report_dates(rollups, from_date, to_date)
+    return ReportColumns.concat(report_cache.days(endpoint, filters, dates, compute))
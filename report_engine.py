@@ -0,0 +1,304 @@
+"""
+Columnar report engine shared by the line, machine and operator reports.
+
+The rollup rows of a report are fetched with a single values_list query into
+NumPy column arrays. Every total and daily table is then computed from those
+arrays with vectorized group-bys, instead of one aggregate query per metric.
+"""
+import numpy as np
+
+from .shift_calendar import shift_calendar
+
+# Modes the reports break time down by
+SEWING_MODE = 1
+IDLE_MODE = 2
+REPORT_MODES = (1, 2, 3, 4, 5)
+
+# MachineLogDailyRollup columns fetched for a report, with their array dtypes
+ROLLUP_COLUMNS = (
+    ("DATE", "datetime64[D]"),
+    ("LINE_NUMB", str),
+    ("MACHINE_ID", str),
+    ("OPERATOR_ID", str),
+    ("MODE", np.int64),
+    ("duration_seconds", np.int64),
+    ("stitch_count", np.int64),
+    ("needle_runtime", np.float64),
+    ("speed_sum", np.int64),
+    ("speed_count", np.int64),
+    ("log_count", np.int64),
+)
+
+
+def percentage(part, whole):
+    """part / whole * 100, or 0 where whole is 0. Works on scalars and arrays."""
+    part = np.asarray(part, dtype=np.float64)
+    whole = np.asarray(whole, dtype=np.float64)
+    result = np.divide(part * 100, whole, out=np.zeros(np.broadcast(part, whole).shape), where=whole > 0)
+    return result if result.ndim else float(result)
+
+
+def ratio(numerator, denominator):
+    """numerator / denominator, or 0 where denominator is 0."""
+    return percentage(numerator, denominator) / 100
+
+
+class ReportColumns:
+    """
+    Rollup rows of one report as column arrays.
+
+    Args:
+        columns: dict of column name to NumPy array, all of the same length
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_rollups(cls, rollups):
+        """Fetch a MachineLogDailyRollup queryset with one query."""
+        names = [name for name, _ in ROLLUP_COLUMNS]
+        rows = list(rollups.order_by().values_list(*names))
+        values = list(zip(*rows)) if rows else [()] * len(names)
+        return cls({
+            name: np.array(column, dtype=dtype)
+            for (name, dtype), column in zip(ROLLUP_COLUMNS, values)
+        })
+
+    @classmethod
+    def empty(cls):
+        return cls({name: np.array([], dtype=dtype) for name, dtype in ROLLUP_COLUMNS})
+
+    @classmethod
+    def concat(cls, parts):
+        """Join column sets, e.g. per-day partials. None parts are skipped."""
+        parts = [part for part in parts if part is not None]
+        if not parts:
+            return cls.empty()
+        return cls({
+            name: np.concatenate([part.columns[name] for part in parts])
+            for name in parts[0].columns
+        })
+
+    def __len__(self):
+        return len(self.columns["MODE"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def take(self, index):
+        """Subset of the rows selected by an index or boolean mask."""
+        return ReportColumns({name: column[index] for name, column in self.columns.items()})
+
+    def group(self, *fields):
+        """
+        Group the rows by one or more columns.
+
+        Returns:
+            (keys, inverse): the sorted list of distinct key tuples, and for
+            every row the position of its key in that list
+        """
+        codes = np.zeros(len(self), dtype=np.int64)
+        distinct_values = []
+        for field in fields:
+            values, inverse = np.unique(self.columns[field], return_inverse=True)
+            codes = codes * len(values) + inverse.reshape(-1)
+            distinct_values.append(values)
+
+        group_codes, inverse = np.unique(codes, return_inverse=True)
+        positions = []
+        for values in reversed(distinct_values):
+            group_codes, position = np.divmod(group_codes, len(values))
+            positions.append(values[position].tolist())
+        keys = list(zip(*reversed(positions))) if fields else [()]
+        return keys, inverse.reshape(-1)
+
+    def partition(self, field):
+        """Split the rows by one column into a list of (value, ReportColumns)."""
+        keys, inverse = self.group(field)
+        order = np.argsort(inverse, kind="stable")
+        boundaries = np.searchsorted(inverse[order], np.arange(1, len(keys)))
+        return [
+            (key[0], self.take(rows))
+            for key, rows in zip(keys, np.split(order, boundaries))
+        ]
+
+    def aggregate(self, *fields):
+        """
+        Sums of the rollup columns per group of fields, or over all rows when
+        no fields are given.
+
+        Returns:
+            (keys, totals): the group keys (see group()) and a dict of metric
+            name to an array with one value per key
+        """
+        if fields:
+            keys, inverse = self.group(*fields)
+        else:
+            keys, inverse = [()], np.zeros(len(self), dtype=np.int64)
+        group_count = len(keys)
+        mode = self.columns["MODE"]
+
+        def total(column, mask=None):
+            values = self.columns[column]
+            if mask is not None:
+                values = np.where(mask, values, 0)
+            return np.bincount(inverse, weights=values, minlength=group_count)
+
+        def distinct_count(column):
+            values, value_inverse = np.unique(self.columns[column], return_inverse=True)
+            width = max(len(values), 1)
+            pairs = np.unique(inverse * width + value_inverse.reshape(-1))
+            return np.bincount(pairs // width, minlength=group_count)
+
+        totals = {
+            f"mode_{mode_number}_seconds": total("duration_seconds", mode == mode_number)
+            for mode_number in REPORT_MODES
+        }
+        totals.update(
+            stitch_count=total("stitch_count"),
+            needle_runtime=total("needle_runtime"),
+            sewing_needle_runtime=total("needle_runtime", mode == SEWING_MODE),
+            speed_sum=total("speed_sum"),
+            speed_count=total("speed_count"),
+            log_count=total("log_count"),
+            sewing_log_count=total("log_count", mode == SEWING_MODE),
+            machine_count=distinct_count("MACHINE_ID"),
+            day_count=distinct_count("DATE"),
+        )
+        return keys, totals
+
+
+def mode_hours(totals):
+    """Hours per mode from aggregate() totals, keyed like the report fields."""
+    return {
+        "sewing": totals["mode_1_seconds"] / 3600,
+        "idle": totals["mode_2_seconds"] / 3600,
+        "no_feeding": totals["mode_3_seconds"] / 3600,
+        "meeting": totals["mode_4_seconds"] / 3600,
+        "maintenance": totals["mode_5_seconds"] / 3600,
+    }
+
+
+def daily_breakdown(columns):
+    """
+    Daily PT / NPT table shared by the line and machine reports.
+
+    Returns:
+        (dates, rows, totals): the report dates, one table row per date and
+        the per-date aggregate() totals
+    """
+    dates, totals = columns.aggregate("DATE")
+    hours = mode_hours(totals)
+    productive_time = hours["sewing"]
+    non_productive_time = hours["no_feeding"] + hours["meeting"] + hours["maintenance"] + hours["idle"]
+    daily_total_hours = productive_time + non_productive_time
+
+    # Average speed over all logs of the day, logs without a speed count as 0
+    sewing_speed = ratio(totals["speed_sum"], totals["log_count"])
+    productive_time_percentage = percentage(productive_time, daily_total_hours)
+    non_productive_time_percentage = percentage(non_productive_time, daily_total_hours)
+
+    rows = [
+        {
+            'Date': str(dates[i][0]),
+            'Sewing Hours (PT)': round(float(hours["sewing"][i]), 2),
+            'No Feeding Hours': round(float(hours["no_feeding"][i]), 2),
+            'Meeting Hours': round(float(hours["meeting"][i]), 2),
+            'Maintenance Hours': round(float(hours["maintenance"][i]), 2),
+            'Idle Hours': round(float(hours["idle"][i]), 2),
+            'Total Hours': round(float(daily_total_hours[i]), 2),
+            'Productive Time (PT) %': round(float(productive_time_percentage[i]), 2),
+            'Non-Productive Time (NPT) %': round(float(non_productive_time_percentage[i]), 2),
+            'Sewing Speed': round(float(sewing_speed[i]), 2),
+            'Stitch Count': int(totals["stitch_count"][i]),
+            'Needle Runtime': float(totals["needle_runtime"][i]),
+        }
+        for i in range(len(dates))
+    ]
+    return [key[0] for key in dates], rows, totals
+
+
+def time_summary(totals):
+    """Total, productive and non-productive hours of a report from its daily totals."""
+    hours = {name: float(value.sum()) for name, value in mode_hours(totals).items()}
+    productive_time = hours["sewing"]
+    non_productive_time = hours["no_feeding"] + hours["meeting"] + hours["maintenance"] + hours["idle"]
+    total_hours = productive_time + non_productive_time
+    return {
+        "totalHours": round(total_hours, 2),
+        "totalProductiveTime": {
+            "hours": round(productive_time, 2),
+            "percentage": round(percentage(productive_time, total_hours), 2)
+        },
+        "totalNonProductiveTime": {
+            "hours": round(non_productive_time, 2),
+            "percentage": round(percentage(non_productive_time, total_hours), 2),
+            "breakdown": {
+                "noFeedingHours": round(hours["no_feeding"], 2),
+                "meetingHours": round(hours["meeting"], 2),
+                "maintenanceHours": round(hours["maintenance"], 2),
+                "idleHours": round(hours["idle"], 2)
+            }
+        },
+    }
+
+
+def compute_line_report(columns, line_number):
+    """Report of one line (see line_reports) from its rollup columns."""
+    dates, rows, daily = daily_breakdown(columns)
+    for row, machine_count in zip(rows, daily["machine_count"].tolist()):
+        row['Machine Count'] = machine_count
+
+    total_working_days = len(dates)
+    average_machines = float(daily["machine_count"].sum()) / total_working_days if total_working_days > 0 else 0
+    total_ideal_hours = float(daily["mode_2_seconds"].sum()) / 3600
+    summary = time_summary(daily)
+    total_hours = float(sum(daily[f"mode_{mode}_seconds"].sum() for mode in REPORT_MODES)) / 3600
+    total_productive_time = float(daily["mode_1_seconds"].sum()) / 3600
+
+    average_sewing_speed = ratio(daily["speed_sum"].sum(), daily["speed_count"].sum())
+    total_needle_runtime = float(daily["needle_runtime"].sum())
+    needle_runtime_instances = float(daily["sewing_log_count"].sum())
+    average_needle_runtime = ratio(total_needle_runtime, needle_runtime_instances)
+    needle_runtime_percentage = percentage(total_needle_runtime / 3600, total_productive_time)
+
+    return {
+        "lineNumber": line_number,
+        "totalIdealHours": round(total_ideal_hours, 2),
+        "utilizationPercentage": round(percentage(total_hours, total_ideal_hours), 2),
+        "totalWorkingDays": total_working_days,
+        "averageMachines": round(average_machines, 2),
+        **summary,
+        "totalStitchCount": int(daily["stitch_count"].sum()),
+        "averageSewingSpeed": round(average_sewing_speed, 2),
+        "totalNeedleRuntime": round(average_needle_runtime, 2),
+        "needleRuntimePercentage": round(needle_runtime_percentage, 2),
+        "tableData": rows
+    }
+
+
+def compute_machine_report(columns, machine_id):
+    """Report of one machine (see machine_reports) from its rollup columns."""
+    dates, rows, daily = daily_breakdown(columns)
+    for row in rows:
+        row['Machine ID'] = machine_id
+
+    total_working_days = len(dates)
+    # Available hours from the shift calendar of the machine's line, if it stayed on one
+    lines = np.unique(columns["LINE_NUMB"])
+    total_available_hours = float(
+        shift_calendar.available_hours(dates, line=lines[0] if len(lines) == 1 else None).sum()
+    )
+    average_sewing_speed = ratio(daily["speed_sum"].sum(), daily["speed_count"].sum())
+
+    return {
+        "machineId": machine_id,
+        "totalAvailableHours": round(total_available_hours, 2),
+        "totalWorkingDays": total_working_days,
+        **time_summary(daily),
+        "totalStitchCount": int(daily["stitch_count"].sum()),
+        "averageSewingSpeed": round(average_sewing_speed, 2),
+        "totalNeedleRuntime": round(float(daily["needle_runtime"].sum()), 2),
+        "tableData": rows
+    }
@@ -0,0 +1,160 @@
+"""
+Querysets of the report views.
+
+The views and the explain_report_queries command both build their queries
+with these functions, so the plans the command checks are the plans of the
+queries the views run. Filters passed as None are not applied.
+"""
+from django.db.models import Avg, Count, ExpressionWrapper, F, FloatField, Q, Sum
+
+from .models import MachineLog, MachineLogDailyRollup, MachineLogHourlyRollup
+
+# Per-mode needle runtime and stitch count of operator_report
+OPERATOR_MODE_TOTALS = dict(
+    sewing_hours=Sum('NEEDLE_RUNTIME', filter=Q(MODE=1)),
+    no_feeding_hours=Sum('NEEDLE_RUNTIME', filter=Q(MODE=3)),
+    meeting_hours=Sum('NEEDLE_RUNTIME', filter=Q(MODE=4)),
+    maintenance_hours=Sum('NEEDLE_RUNTIME', filter=Q(MODE=5)),
+    idle_hours=Sum('NEEDLE_RUNTIME', filter=Q(MODE=2)),
+    total_hours=Sum('NEEDLE_RUNTIME'),
+    stitch_count=Sum('STITCH_COUNT')
+)
+
+
+def in_date_range(queryset, from_date=None, to_date=None):
+    """Filter a queryset on DATE between from_date and to_date (inclusive)."""
+    if from_date:
+        queryset = queryset.filter(DATE__gte=from_date)
+    if to_date:
+        queryset = queryset.filter(DATE__lte=to_date)
+    return queryset
+
+
+def machine_logs(from_date=None, to_date=None, line_number=None, machine_id=None):
+    """Logs of get_machine_logs, filter_logs and filter_logs_by_machine_id."""
+    logs = MachineLog.objects.all()
+    if line_number is not None:
+        logs = logs.filter(LINE_NUMB=line_number)
+    if machine_id is not None:
+        logs = logs.filter(MACHINE_ID=machine_id)
+    return in_date_range(logs, from_date, to_date)
+
+
+def operator_logs(operator_id, from_date=None, to_date=None):
+    """Logs of one operator, for operator_report."""
+    return in_date_range(MachineLog.objects.filter(OPERATOR_ID=operator_id), from_date, to_date)
+
+
+def operator_daily_totals(logs):
+    """Daily table of operator_report: OPERATOR_MODE_TOTALS plus machines and speed per DATE."""
+    return logs.values('DATE').annotate(
+        **OPERATOR_MODE_TOTALS,
+        machine_count=Count('MACHINE_ID', distinct=True),
+        avg_sewing_speed=Avg('reserve_numeric')
+    ).order_by('DATE')
+
+
+def operator_totals(from_date, to_date):
+    """Per-operator totals of all_operators_report, one grouped query."""
+    return MachineLog.objects.filter(
+        DATE__gte=from_date,
+        DATE__lte=to_date
+    ).exclude(OPERATOR_ID="0").values('OPERATOR_ID').annotate(
+        total_hours=Sum('NEEDLE_RUNTIME'),
+        productive_hours=Sum('NEEDLE_RUNTIME', filter=Q(MODE=1)),
+        stitch_count=Sum('STITCH_COUNT'),
+        machine_count=Count('MACHINE_ID', distinct=True)
+    ).order_by('OPERATOR_ID')
+
+
+def consolidated_logs(from_date=None, to_date=None, machine_ids=(), line_numbers=(), operator_ids=None):
+    """
+    Logs of get_consolidated_logs with working time, annotated with
+    duration_hours. Empty machine_ids / line_numbers are not filtered on.
+    """
+    logs = in_date_range(MachineLog.objects.all(), from_date, to_date)
+    if machine_ids:
+        logs = logs.filter(MACHINE_ID__in=machine_ids)
+    if line_numbers:
+        logs = logs.filter(LINE_NUMB__in=line_numbers)
+    if operator_ids is not None:
+        logs = logs.filter(OPERATOR_ID__in=operator_ids)
+
+    # Working hours of each log entry, precomputed at ingest: the part of the
+    # log inside its shift without breaks (see working_time.py)
+    logs = logs.annotate(
+        duration_hours=ExpressionWrapper(
+            F('working_seconds') / 3600.0,
+            output_field=FloatField()
+        )
+    )
+
+    # Only logs with working time count
+    return logs.filter(working_seconds__gt=0)
+
+
+def consolidated_day_totals(logs, dates):
+    """Per-day summary rows of get_consolidated_logs for the consolidated_logs of dates."""
+    return logs.filter(DATE__in=dates).values('DATE').annotate(
+        total_logs=Count('id'),
+        sewing_hours=Sum('duration_hours', filter=Q(MODE=1)),
+        idle_hours=Sum('duration_hours', filter=Q(MODE=2)),
+        meeting_hours=Sum('duration_hours', filter=Q(MODE=3)),
+        no_feeding_hours=Sum('duration_hours', filter=Q(MODE=4)),
+        maintenance_hours=Sum('duration_hours', filter=Q(MODE=5)),
+        total_hours=Sum('duration_hours'),
+        total_stitch_count=Sum('STITCH_COUNT'),
+        total_needle_runtime=Sum('NEEDLE_RUNTIME'),
+        sewing_logs=Count('id', filter=Q(MODE=1)),
+        sewing_stitch_count=Sum('STITCH_COUNT', filter=Q(MODE=1)),
+        sewing_needle_runtime=Sum('NEEDLE_RUNTIME', filter=Q(MODE=1))
+    ).order_by()
+
+
+def daily_rollups(from_date=None, to_date=None, operator_ids=None, line_number=None, machine_id=None):
+    """Daily rollups of line_reports, machine_reports and all_machines_report."""
+    logs = MachineLogDailyRollup.objects.all()
+    if operator_ids is not None:
+        logs = logs.filter(OPERATOR_ID__in=operator_ids)
+    if line_number is not None:
+        logs = logs.filter(LINE_NUMB=line_number)
+    if machine_id is not None:
+        logs = logs.filter(MACHINE_ID=machine_id)
+    return in_date_range(logs, from_date, to_date)
+
+
+def operator_rollups(operator_ids=None, from_date=None, to_date=None):
+    """
+    Daily rollups of operator_reports_by_name, without the idle time logged
+    with no operator card (OPERATOR_ID 0 and MODE 2).
+    """
+    return daily_rollups(from_date, to_date, operator_ids=operator_ids).exclude(Q(OPERATOR_ID=0) & Q(MODE=2))
+
+
+def operator_daily_seconds(operator_ids, from_date=None, to_date=None):
+    """Sewing seconds per operator and working day, for operator_reports_all."""
+    return operator_rollups(operator_ids, from_date, to_date).values('OPERATOR_ID', 'DATE').annotate(
+        production_seconds=Sum('duration_seconds', filter=Q(MODE=1))
+    ).order_by()
+
+
+def hourly_rollups(report_date, operator_ids, line_number=None, machine_id=None):
+    """Hourly rollups of one day, for intraday_utilization."""
+    logs = MachineLogHourlyRollup.objects.filter(DATE=report_date, OPERATOR_ID__in=operator_ids)
+    if line_number is not None:
+        logs = logs.filter(LINE_NUMB=line_number)
+    if machine_id is not None:
+        logs = logs.filter(MACHINE_ID=machine_id)
+    return logs
+
+
+def hourly_totals(logs, group_field):
+    """Per-mode seconds and machine count of hourly_rollups by group_field and HOUR."""
+    return logs.values(group_field, 'HOUR').annotate(
+        sewing_seconds=Sum('duration_seconds', filter=Q(MODE=1)),
+        idle_seconds=Sum('duration_seconds', filter=Q(MODE=2)),
+        no_feeding_seconds=Sum('duration_seconds', filter=Q(MODE=3)),
+        meeting_seconds=Sum('duration_seconds', filter=Q(MODE=4)),
+        maintenance_seconds=Sum('duration_seconds', filter=Q(MODE=5)),
+        machine_count=Count('MACHINE_ID', distinct=True)
+    ).order_by(group_field, 'HOUR')
@@ -0,0 +1,400 @@
+"""
+Daily and hourly rollups of machine logs for the report views.
+
+MachineLogDailyRollup holds one row per (DATE, LINE_NUMB, MACHINE_ID,
+OPERATOR_ID, MODE) with the sums the reports need, covering the logs with
+working time. Their duration is the exact working time of each log
+(working_seconds, see working_time.py). MachineLogHourlyRollup holds the same
+keys per hour of the day, with each log's working time split at the hour
+boundaries it crosses. The ingest path adds
+every inserted log to an in-memory accumulator, which upserts the deltas
+every few seconds. Reports therefore read O(days x entities) rows instead of
+every raw log, and lag ingest by at most one flush interval.
+
+rebuild_rollups() recomputes dates from the raw logs. It is used for the
+initial backfill and as a periodic repair (manage.py rebuild_log_rollups).
+
+Rebuilds and deltas are kept apart by a generation per date
+(MachineLogRollupGeneration):
+
+- A rebuild bumps the date's generation and recomputes its rows in the same
+  transaction, holding the generation row locked.
+- Ingest reads the generation under a shared lock in the transaction that
+  inserts the logs, and tags their deltas with it.
+- The flush upserts only deltas of the current generation, again under a
+  shared lock. Older deltas belong to logs a rebuild has already counted.
+
+So a log is counted either by a rebuild or by its delta, never by both, and
+a rebuild cannot miss a log committed while it runs.
+
+Pending deltas live in the worker's memory. They are flushed at exit, but a
+worker killed by SIGKILL or the OOM killer loses the deltas of its last
+flush interval (MACHINE_LOG_ROLLUP_FLUSH_SECONDS). Run the periodic repair
+for that window, e.g. hourly from cron:
+
+    manage.py rebuild_log_rollups --days 2
+
+Rebuilds are safe while ingestion is running.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .archive import archived_dates
+from .models import MachineLog, MachineLogDailyRollup, MachineLogHourlyRollup, MachineLogRollupGeneration
+from .report_cache import report_cache
+from .working_time import working_time_for
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_KEY_FIELDS = ("DATE", "LINE_NUMB", "MACHINE_ID", "OPERATOR_ID", "MODE")
+ROLLUP_SUM_FIELDS = (
+    "duration_seconds", "stitch_count", "needle_runtime", "needle_stoptime",
+    "speed_sum", "speed_count", "log_count",
+)
+HOURLY_ROLLUP_KEY_FIELDS = ("DATE", "HOUR", "LINE_NUMB", "MACHINE_ID", "OPERATOR_ID", "MODE")
+HOURLY_ROLLUP_SUM_FIELDS = ("duration_seconds", "log_count")
+
+# Tables maintained by the accumulator: model, key fields, sum fields.
+# Accumulator keys are (table name, key tuple, generation of the date), with
+# DATE first in every key tuple.
+ROLLUP_TABLES = {
+    "daily": (MachineLogDailyRollup, ROLLUP_KEY_FIELDS, ROLLUP_SUM_FIELDS),
+    "hourly": (MachineLogHourlyRollup, HOURLY_ROLLUP_KEY_FIELDS, HOURLY_ROLLUP_SUM_FIELDS),
+}
+
+
+def rollup_values(log):
+    """Rollup sums contributed by one log (validated data with time columns)."""
+    speed = log.get("reserve_numeric") or 0
+    return {
+        "duration_seconds": log["working_seconds"],
+        "stitch_count": log.get("STITCH_COUNT") or 0,
+        "needle_runtime": log.get("NEEDLE_RUNTIME") or 0,
+        "needle_stoptime": log.get("NEEDLE_STOPTIME") or 0,
+        "speed_sum": speed if speed > 0 else 0,
+        "speed_count": 1 if speed > 0 else 0,
+        "log_count": 1,
+    }
+
+
+class RollupAccumulator:
+    """
+    Thread-safe map of pending rollup deltas, flushed in the background.
+
+    Args:
+        flush: callable(deltas) that writes the deltas
+        flush_interval: seconds between background flushes
+        max_pending_keys: pending keys that trigger an early flush
+    """
+
+    def __init__(self, flush, flush_interval=5.0, max_pending_keys=10000):
+        self._flush_fn = flush
+        self.flush_interval = flush_interval
+        self.max_pending_keys = max_pending_keys
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="machine-log-rollups", daemon=True
+            )
+            self._thread.start()
+
+    def add(self, key, values):
+        with self._lock:
+            bucket = self._pending.get(key)
+            if bucket is None:
+                self._pending[key] = dict(values)
+            else:
+                for field, value in values.items():
+                    bucket[field] += value
+            if len(self._pending) >= self.max_pending_keys:
+                self._wake.set()
+            self._start()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                self._flush_fn(pending)
+            except Exception:
+                logger.exception("Rollup flush failed, will retry")
+                # Put the deltas back so they are retried on the next flush
+                with self._lock:
+                    for key, values in pending.items():
+                        bucket = self._pending.setdefault(key, dict.fromkeys(values, 0))
+                        for field, value in values.items():
+                            bucket[field] += value
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+
+def _upsert_sql(model, key_names, sum_names, rows):
+    """INSERT ... ON CONFLICT DO UPDATE adding the deltas to existing rows."""
+    opts = model._meta
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    key_fields = [opts.get_field(name) for name in key_names]
+    sum_fields = [opts.get_field(name) for name in sum_names]
+    fields = key_fields + sum_fields
+
+    row_placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    sql = (
+        f"INSERT INTO {table} ({', '.join(qn(f.column) for f in fields)}) "
+        f"VALUES {', '.join([row_placeholder] * len(rows))} "
+        f"ON CONFLICT ({', '.join(qn(f.column) for f in key_fields)}) DO UPDATE SET "
+        + ", ".join(
+            f"{qn(f.column)} = {table}.{qn(f.column)} + EXCLUDED.{qn(f.column)}"
+            for f in sum_fields
+        )
+    )
+    params = []
+    for key, values in rows:
+        params.extend(
+            field.get_db_prep_save(value, connection) for field, value in zip(key_fields, key)
+        )
+        params.extend(values[name] for name in sum_names)
+    return sql, params
+
+
+def upsert_rollups(model, key_names, sum_names, deltas):
+    """Add pending deltas to a rollup table."""
+    rows = list(deltas.items())
+    if connection.vendor in ("postgresql", "sqlite"):
+        fields = [model._meta.get_field(name) for name in key_names + sum_names]
+        batch_size = max(min(500, connection.ops.bulk_batch_size(fields, rows)), 1)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.execute(*_upsert_sql(model, key_names, sum_names, rows[start:start + batch_size]))
+        return
+
+    for key, values in rows:
+        lookup = dict(zip(key_names, key))
+        increments = {name: F(name) + value for name, value in values.items()}
+        if model.objects.filter(**lookup).update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **values)
+        except IntegrityError:
+            # Created by another worker in the meantime
+            model.objects.filter(**lookup).update(**increments)
+
+
+_generation_dates = set()
+
+
+def ensure_generations(dates):
+    """
+    Create the missing generation rows of the given dates. Runs in autocommit
+    before the transactions that lock them, so concurrent creations of the
+    same row cannot fail a caller's transaction.
+    """
+    missing = set(dates) - _generation_dates
+    for log_date in missing:
+        MachineLogRollupGeneration.objects.get_or_create(DATE=log_date)
+    _generation_dates.update(missing)
+
+
+def rollup_generations(dates, exclusive=False):
+    """
+    Current rollup generation of each date, with the generation rows locked
+    until the end of the transaction: shared while inserting logs or
+    flushing deltas, exclusive to keep rebuilds out. Call inside
+    transaction.atomic(), after ensure_generations().
+    """
+    dates = sorted(set(dates))
+    if not dates:
+        return {}
+
+    if connection.vendor == "sqlite":
+        # A single writer at a time, the transaction's write lock serializes
+        lock = ""
+    elif exclusive:
+        lock = " FOR UPDATE"
+    elif connection.vendor == "postgresql":
+        lock = " FOR SHARE"
+    elif connection.vendor == "mysql":
+        lock = " LOCK IN SHARE MODE"
+    else:
+        lock = " FOR UPDATE"
+
+    opts = MachineLogRollupGeneration._meta
+    qn = connection.ops.quote_name
+    date_field = opts.get_field("DATE")
+    date_column = qn(date_field.column)
+    sql = (
+        f"SELECT {date_column}, {qn(opts.get_field('generation').column)} "
+        f"FROM {qn(opts.db_table)} "
+        f"WHERE {date_column} IN ({', '.join(['%s'] * len(dates))}) "
+        f"ORDER BY {date_column}{lock}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [date_field.get_db_prep_value(log_date, connection) for log_date in dates])
+        return {date_field.to_python(log_date): generation for log_date, generation in cursor.fetchall()}
+
+
+def reportable_logs(logs):
+    """Restrict a MachineLog queryset to the logs that count towards the reports."""
+    return logs.filter(working_seconds__gt=0)
+
+
+def rebuild_daily_rollups(dates):
+    """Recompute the rollup rows of the given dates from the raw logs."""
+    dates = sorted(set(dates))
+    for log_date in dates:
+        grouped = reportable_logs(MachineLog.objects.filter(DATE=log_date)).values(
+            *ROLLUP_KEY_FIELDS
+        ).annotate(
+            total_duration=Sum("working_seconds"),
+            total_stitch_count=Sum("STITCH_COUNT"),
+            total_needle_runtime=Sum("NEEDLE_RUNTIME"),
+            total_needle_stoptime=Sum("NEEDLE_STOPTIME"),
+            total_speed=Sum("reserve_numeric", filter=Q(reserve_numeric__gt=0)),
+            total_speed_count=Count("id", filter=Q(reserve_numeric__gt=0)),
+            total_logs=Count("id"),
+        ).order_by()
+
+        rollups = [
+            MachineLogDailyRollup(
+                **{name: row[name] for name in ROLLUP_KEY_FIELDS},
+                duration_seconds=row["total_duration"] or 0,
+                stitch_count=row["total_stitch_count"] or 0,
+                needle_runtime=row["total_needle_runtime"] or 0,
+                needle_stoptime=row["total_needle_stoptime"] or 0,
+                speed_sum=row["total_speed"] or 0,
+                speed_count=row["total_speed_count"],
+                log_count=row["total_logs"],
+            )
+            for row in grouped.iterator()
+        ]
+        with transaction.atomic():
+            MachineLogDailyRollup.objects.filter(DATE=log_date).delete()
+            MachineLogDailyRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+def rebuild_hourly_rollups(dates):
+    """Recompute the hourly rollup rows of the given dates from the raw logs."""
+    dates = sorted(set(dates))
+    for log_date in dates:
+        logs = reportable_logs(MachineLog.objects.filter(DATE=log_date)).values_list(
+            "LINE_NUMB", "MACHINE_ID", "OPERATOR_ID", "MODE", "start_seconds", "end_seconds"
+        ).order_by()
+
+        totals = defaultdict(lambda: {"duration_seconds": 0, "log_count": 0})
+        working_times = {}
+        for line, machine, operator, mode, start_seconds, end_seconds in logs.iterator():
+            working_time = working_times.get(line)
+            if working_time is None:
+                working_time = working_times[line] = working_time_for(log_date, line)
+            for hour, seconds in working_time.overlap_by_hour(start_seconds, end_seconds):
+                bucket = totals[(hour, line, machine, operator, mode)]
+                bucket["duration_seconds"] += seconds
+                bucket["log_count"] += 1
+
+        rollups = [
+            MachineLogHourlyRollup(
+                DATE=log_date, HOUR=hour, LINE_NUMB=line, MACHINE_ID=machine,
+                OPERATOR_ID=operator, MODE=mode, **values
+            )
+            for (hour, line, machine, operator, mode), values in totals.items()
+        ]
+        with transaction.atomic():
+            MachineLogHourlyRollup.objects.filter(DATE=log_date).delete()
+            MachineLogHourlyRollup.objects.bulk_create(rollups, batch_size=1000)
+
+
+def rebuild_rollups(dates):
+    """
+    Recompute the daily and hourly rollups of the given dates, one
+    transaction per date that bumps its generation first, so pending ingest
+    deltas of the logs counted here are dropped by the flush.
+    """
+    dates = set(dates)
+    # The raw logs of archived dates are gone, rebuilding would drop their rollups
+    archived = dates.intersection(archived_dates(min(dates), max(dates))) if dates else set()
+    if archived:
+        logger.warning("Not rebuilding the rollups of %d archived dates", len(archived))
+        dates -= archived
+
+    ensure_generations(dates)
+    for log_date in sorted(dates):
+        with transaction.atomic():
+            # Waits for the transactions inserting logs of this date, and
+            # holds off new ones until the rebuild is committed
+            MachineLogRollupGeneration.objects.filter(DATE=log_date).update(generation=F("generation") + 1)
+            rebuild_daily_rollups([log_date])
+            rebuild_hourly_rollups([log_date])
+    report_cache.invalidate_dates(dates)
+
+
+def _flush_rollups(deltas):
+    dates = {key[0] for _, key, _ in deltas}
+    ensure_generations(dates)
+    with transaction.atomic():
+        generations = rollup_generations(dates)
+        by_table = defaultdict(dict)
+        for (table, key, generation), values in deltas.items():
+            # Deltas of an older generation were counted by a rebuild
+            if generations.get(key[0]) == generation:
+                by_table[table][key] = values
+        for table, table_deltas in by_table.items():
+            upsert_rollups(*ROLLUP_TABLES[table], table_deltas)
+    # Reports of these dates may have been cached before the deltas landed
+    report_cache.invalidate_dates(dates)
+
+
+rollup_accumulator = RollupAccumulator(
+    flush=_flush_rollups,
+    flush_interval=getattr(settings, "MACHINE_LOG_ROLLUP_FLUSH_SECONDS", 5.0),
+)
+
+
+def record_rollups(logs, generations):
+    """
+    Add inserted logs (validated data with time columns) to the accumulator.
+
+    Args:
+        generations: dict of DATE to the rollup generation read in the
+            transaction that inserted the logs (see rollup_generations)
+    """
+    working_times = {}
+    for log in logs:
+        if log["working_seconds"] <= 0:
+            continue
+        key = tuple(log.get(name) for name in ROLLUP_KEY_FIELDS)
+        generation = generations[key[0]]
+        rollup_accumulator.add(("daily", key, generation), rollup_values(log))
+
+        line, machine, operator, mode = key[1:]
+        working_time = working_times.get((key[0], line))
+        if working_time is None:
+            working_time = working_times[(key[0], line)] = working_time_for(key[0], line)
+        for hour, seconds in working_time.overlap_by_hour(log["start_seconds"], log["end_seconds"]):
+            rollup_accumulator.add(
+                ("hourly", (key[0], hour, line, machine, operator, mode), generation),
+                {"duration_seconds": seconds, "log_count": 1},
+            )
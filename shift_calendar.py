@@ -0,0 +1,204 @@
+"""
+Working hours and break windows of the sewing floor, in seconds of day.
+
+The WORKDAY_* and BREAK_WINDOWS constants are the default shift. Lines and
+weekdays with different hours, and holidays, are configured with the
+ShiftPattern and Holiday models. shift_calendar answers "how many working
+hours did these dates have" for the reports from a per-process copy of
+those tables, reloaded when they change. The shared version stamp marking a
+change is read at most every MACHINE_LOG_SHIFT_CALENDAR_CHECK_SECONDS, so
+per-log lookups on the ingest path cost no cache round trip.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Holiday, ShiftPattern
+
+logger = logging.getLogger(__name__)
+
+# Working hours: 8:25 AM to 7:35 PM
+WORKDAY_START_SECONDS = 30300
+WORKDAY_END_SECONDS = 70500
+
+# Breaks: 10:30-10:40, 13:20-14:00 and 16:20-16:30
+BREAK_WINDOWS = (
+    (37800, 38400),
+    (48000, 50400),
+    (58800, 59400),
+)
+
+
+Shift = namedtuple("Shift", ["start_seconds", "end_seconds", "breaks"])
+
+DEFAULT_SHIFT = Shift(WORKDAY_START_SECONDS, WORKDAY_END_SECONDS, BREAK_WINDOWS)
+
+# Cache key of the version stamp shared by all processes
+VERSION_CACHE_KEY = "machine_log:shift_calendar:version"
+
+
+def shift_seconds(shift, until_seconds=None):
+    """Working seconds of a shift without its breaks, counted up to until_seconds if given."""
+    end_seconds = shift.end_seconds if until_seconds is None else min(shift.end_seconds, until_seconds)
+    seconds = max(end_seconds - shift.start_seconds, 0)
+    for break_start, break_end in shift.breaks:
+        seconds -= max(min(break_end, end_seconds) - max(break_start, shift.start_seconds), 0)
+    return seconds
+
+
+def shift_hours(shift):
+    """Hours of day (0-23) that a shift's working time falls in."""
+    return range(shift.start_seconds // 3600, -(-shift.end_seconds // 3600))
+
+
+class ShiftCalendar:
+    """
+    Available working time per date and line.
+
+    A date uses the most specific ShiftPattern: the line's pattern for that
+    weekday, the line's pattern for every day, the all-lines pattern for
+    that weekday, the all-lines pattern for every day, then DEFAULT_SHIFT.
+    Holidays of the line or of all lines have no working time.
+
+    Args:
+        load_patterns: callable returning (line, weekday, start, end, breaks)
+            tuples, line "" for all lines and weekday None for every day
+        load_holidays: callable returning (date, line) pairs, line "" for all lines
+        ttl: seconds after which the tables are reloaded even without a change
+        check_seconds: seconds between reads of the shared version stamp
+    """
+
+    def __init__(self, load_patterns, load_holidays, ttl=None, check_seconds=1.0):
+        self._load_patterns = load_patterns
+        self._load_holidays = load_holidays
+        self.ttl = ttl
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    def _current_version(self):
+        try:
+            return cache.get(VERSION_CACHE_KEY, 0)
+        except Exception:
+            logger.exception("Could not read shift calendar version")
+            return self._version
+
+    def _get(self):
+        snapshot = self._snapshot
+        now = time.monotonic()
+        expired = self.ttl is not None and now - self._loaded_at > self.ttl
+        if snapshot is not None and not expired and now - self._checked_at < self.check_seconds:
+            return snapshot
+
+        version = self._current_version()
+        self._checked_at = now
+        if snapshot is not None and version == self._version and not expired:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is snapshot:
+                patterns = {
+                    (line or "", weekday): Shift(start, end, tuple(tuple(window) for window in breaks or ()))
+                    for line, weekday, start, end, breaks in self._load_patterns()
+                }
+                holidays = {}
+                for holiday, line in self._load_holidays():
+                    holidays.setdefault(line or "", set()).add(holiday)
+                # Full-day seconds per (line, weekday) and holiday arrays per line, filled lazily
+                self._snapshot = (patterns, holidays, {}, {})
+                self._version = version
+                self._loaded_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self):
+        """Drop the local copy and make other processes reload theirs."""
+        with self._lock:
+            self._snapshot = None
+        try:
+            cache.add(VERSION_CACHE_KEY, 0, timeout=None)
+            cache.incr(VERSION_CACHE_KEY)
+        except Exception:
+            logger.exception("Could not bump shift calendar version")
+
+    def _shift(self, patterns, line, weekday):
+        for key in ((line, weekday), (line, None), ("", weekday), ("", None)):
+            if key in patterns:
+                return patterns[key]
+        return DEFAULT_SHIFT
+
+    def pattern_for(self, log_date, line=None):
+        """Shift pattern of a date on a line (None for all lines), ignoring holidays."""
+        patterns = self._get()[0]
+        return self._shift(patterns, "" if line is None else str(line), log_date.weekday())
+
+    def shift_for(self, log_date, line=None):
+        """Shift of a date on a line (None for all lines), or None on a holiday."""
+        holidays = self._get()[1]
+        if log_date in holidays.get("" if line is None else str(line), ()) or log_date in holidays.get("", ()):
+            return None
+        return self.pattern_for(log_date, line)
+
+    def available_seconds(self, dates, line=None, now=None):
+        """
+        Available working seconds of each date, as an array. Holidays and
+        future dates have none, today counts up to the current time.
+        """
+        patterns, holidays, weekday_seconds, holiday_dates = self._get()
+        line = "" if line is None else str(line)
+        if line not in weekday_seconds:
+            # Precompute the line's full-day seconds per weekday (Monday first) and its holidays
+            weekday_seconds[line] = np.array([
+                shift_seconds(self._shift(patterns, line, weekday)) for weekday in range(7)
+            ])
+            holiday_dates[line] = np.array(
+                sorted(holidays.get(line, set()) | holidays.get("", set())), dtype="datetime64[D]"
+            )
+
+        dates = np.asarray(dates, dtype="datetime64[D]")
+        # Day 0 of datetime64 (1970-01-01) was a Thursday
+        weekdays = (dates.astype(np.int64) + 3) % 7
+        seconds = weekday_seconds[line][weekdays]
+        seconds[np.isin(dates, holiday_dates[line])] = 0
+
+        now = now or datetime.now()
+        today = np.datetime64(now.date(), "D")
+        seconds[dates > today] = 0
+        is_today = dates == today
+        if is_today.any():
+            shift = self.shift_for(now.date(), line or None)
+            current_seconds = now.hour * 3600 + now.minute * 60 + now.second
+            seconds[is_today] = shift_seconds(shift, until_seconds=current_seconds) if shift else 0
+        return seconds
+
+    def available_hours(self, dates, line=None, now=None):
+        """Available working hours of each date, as an array."""
+        return self.available_seconds(dates, line, now) / 3600
+
+
+shift_calendar = ShiftCalendar(
+    load_patterns=lambda: ShiftPattern.objects.values_list(
+        "LINE_NUMB", "WEEKDAY", "start_seconds", "end_seconds", "breaks"
+    ),
+    load_holidays=lambda: Holiday.objects.values_list("DATE", "LINE_NUMB"),
+    ttl=getattr(settings, "MACHINE_LOG_SHIFT_CALENDAR_TTL", 300),
+    check_seconds=getattr(settings, "MACHINE_LOG_SHIFT_CALENDAR_CHECK_SECONDS", 1.0),
+)
+
+
+@receiver(post_save, sender=ShiftPattern)
+@receiver(post_delete, sender=ShiftPattern)
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def invalidate_shift_calendar(sender, **kwargs):
+    shift_calendar.invalidate()
@@ -0,0 +1,318 @@
+"""
+Durable on-disk spool for machine logs accepted while the database is down.
+
+Records are appended to a per-process spool file as length-prefixed JSON
+(4-byte big-endian length, then the payload). fsync is batched: the file is
+synced every fsync_every records or fsync_interval_ms milliseconds, and the
+replay worker syncs it on every tick so nothing waits longer than that.
+
+Once the database is healthy again the replay worker rotates the active file
+into a segment and bulk-loads every segment back through the normal dedup
+path. A batch failing with anything but an outage error is split until the
+records failing on their own are found; those are moved to a quarantine file
+(QUARANTINE_SUFFIX, same format) so the rest of the spool can replay. Files
+are claimed with an exclusive flock, so several worker
+processes can share one spool directory and a crashed worker's files are
+picked up by the others. Requires a POSIX system (fcntl).
+"""
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LENGTH_PREFIX = struct.Struct(">I")
+ACTIVE_SUFFIX = ".log"
+SEGMENT_SUFFIX = ".seg"
+# Records that failed to load on their own, kept for inspection
+QUARANTINE_SUFFIX = ".bad"
+
+
+def read_records(path):
+    """
+    Yield the records stored in a spool file.
+
+    A truncated record at the end of the file (a write cut short by a crash)
+    is ignored.
+    """
+    with open(path, "rb") as spool_file:
+        while True:
+            header = spool_file.read(LENGTH_PREFIX.size)
+            if len(header) < LENGTH_PREFIX.size:
+                return
+            (length,) = LENGTH_PREFIX.unpack(header)
+            payload = spool_file.read(length)
+            if len(payload) < length:
+                return
+            yield json.loads(payload)
+
+
+def write_records(spool_file, records):
+    """Write records (JSON-serialisable dicts) to an open spool file."""
+    for record in records:
+        payload = json.dumps(record, cls=DjangoJSONEncoder).encode()
+        spool_file.write(LENGTH_PREFIX.pack(len(payload)) + payload)
+
+
+def load_bisected(load_batch, records, outage_errors, reject):
+    """
+    Load records with load_batch, splitting a batch that fails.
+
+    An error in outage_errors propagates. Any other error splits the batch
+    in halves that are loaded separately, down to the single records that
+    fail on their own, which are passed to reject(record, exc). load_batch
+    must be idempotent, as halves of a failed batch are loaded again.
+
+    Returns:
+        Number of records loaded
+    """
+    try:
+        load_batch(records)
+    except outage_errors:
+        raise
+    except Exception as e:
+        if len(records) == 1:
+            reject(records[0], e)
+            return 0
+        middle = len(records) // 2
+        return (load_bisected(load_batch, records[:middle], outage_errors, reject)
+                + load_bisected(load_batch, records[middle:], outage_errors, reject))
+    return len(records)
+
+
+def _try_lock(spool_file):
+    try:
+        fcntl.flock(spool_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+class LogSpool:
+    """
+    Append-only spool file owned by the current process.
+
+    Args:
+        directory: spool directory, shared by all worker processes
+        fsync_every: records appended before the file is fsynced
+        fsync_interval_ms: longest time an appended record stays unsynced
+            while appends keep arriving
+    """
+
+    def __init__(self, directory, fsync_every=100, fsync_interval_ms=200):
+        if fcntl is None:
+            raise RuntimeError("The machine log spool requires fcntl (POSIX)")
+        self.directory = directory
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval_ms / 1000
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.stats = {"spooled": 0, "replayed": 0, "segments_replayed": 0, "quarantined": 0}
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = os.path.join(
+            self.directory, f"spool-{os.getpid()}-{uuid.uuid4().hex}{ACTIVE_SUFFIX}"
+        )
+        self._file = open(self._path, "ab")
+        # Held for the life of the file so other processes leave it alone
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+    def append(self, records):
+        """Append records (JSON-serialisable dicts) to the active spool file."""
+        with self._lock:
+            if self._file is None:
+                self._open()
+            write_records(self._file, records)
+            self._file.flush()
+            self._unsynced += len(records)
+            self.stats["spooled"] += len(records)
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync_locked()
+
+    def _sync_locked(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        """fsync any records appended since the last sync."""
+        with self._lock:
+            self._sync_locked()
+
+    def rotate(self):
+        """Turn the active file into a segment that the replay worker can claim."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._sync_locked()
+            segment_path = self._path[:-len(ACTIVE_SUFFIX)] + SEGMENT_SUFFIX
+            # Rename while still holding the lock so no other process can
+            # mistake the file for an orphan in between
+            os.rename(self._path, segment_path)
+            self._file.close()
+            self._file = None
+            self._path = None
+
+    def has_pending(self):
+        """True if this process spooled records or any segment is waiting."""
+        with self._lock:
+            if self._file is not None:
+                return True
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return False
+        return any(name.endswith((ACTIVE_SUFFIX, SEGMENT_SUFFIX)) for name in names)
+
+    def replay(self, load_batch, batch_size=1000, outage_errors=(Exception,)):
+        """
+        Bulk-load every claimable spool file with load_batch, oldest first.
+
+        A file is deleted only after all of its records were loaded or
+        quarantined. If load_batch raises one of outage_errors, the file is
+        left in place (load_batch must be idempotent) and the exception
+        propagates. Records failing with any other error are appended to
+        the file's quarantine file and the replay goes on, see
+        load_bisected.
+        """
+        try:
+            names = sorted(
+                os.listdir(self.directory),
+                key=lambda name: os.path.getmtime(os.path.join(self.directory, name)),
+            )
+        except FileNotFoundError:
+            return
+
+        for name in names:
+            if not name.endswith((ACTIVE_SUFFIX, SEGMENT_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                claimed = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with claimed:
+                # Locked files are another process's active spool or replay
+                if not _try_lock(claimed) or not os.path.exists(path):
+                    continue
+                rejected = []
+
+                def reject(record, exc):
+                    logger.warning("Quarantining spooled log %r from %s: %s", record, name, exc)
+                    rejected.append(record)
+
+                batch = []
+                for record in read_records(path):
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        self.stats["replayed"] += load_bisected(load_batch, batch, outage_errors, reject)
+                        batch = []
+                if batch:
+                    self.stats["replayed"] += load_bisected(load_batch, batch, outage_errors, reject)
+                if rejected:
+                    self.quarantine(path, rejected)
+                os.unlink(path)
+                self.stats["segments_replayed"] += 1
+
+    def quarantine(self, path, records):
+        """Append records of the spool file at path to its quarantine file."""
+        quarantine_path = os.path.splitext(path)[0] + QUARANTINE_SUFFIX
+        with open(quarantine_path, "ab") as quarantine_file:
+            write_records(quarantine_file, records)
+            quarantine_file.flush()
+            # Synced before the spool file they come from is deleted
+            os.fsync(quarantine_file.fileno())
+        self.stats["quarantined"] += len(records)
+
+
+class DatabaseHealth:
+    """
+    Circuit breaker for the database.
+
+    After a failure the database counts as unhealthy for retry_after seconds;
+    after that, check() probes it again.
+    """
+
+    def __init__(self, probe, retry_after=5.0):
+        self.probe = probe
+        self.retry_after = retry_after
+        self._failed_at = None
+
+    @property
+    def healthy(self):
+        return self._failed_at is None or time.monotonic() - self._failed_at >= self.retry_after
+
+    def mark_failure(self):
+        self._failed_at = time.monotonic()
+
+    def check(self):
+        """Probe the database if the retry window passed. Returns True if healthy."""
+        if self._failed_at is not None and not self.healthy:
+            return False
+        try:
+            self.probe()
+        except Exception:
+            self.mark_failure()
+            return False
+        self._failed_at = None
+        return True
+
+
+class SpoolReplayer:
+    """
+    Background thread that syncs the spool and replays it once the database
+    is healthy again.
+    """
+
+    def __init__(self, spool, health, load_batch, interval=5.0, batch_size=1000,
+                 outage_errors=(Exception,)):
+        self.spool = spool
+        self.health = health
+        self.load_batch = load_batch
+        self.outage_errors = outage_errors
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="machine-log-spool-replay", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Spool replay failed")
+                self.health.mark_failure()
+
+    def run_once(self):
+        self.spool.sync()
+        if not self.spool.has_pending() or not self.health.check():
+            return
+        self.spool.rotate()
+        self.spool.replay(self.load_batch, self.batch_size, self.outage_errors)
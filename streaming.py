@@ -0,0 +1,128 @@
+"""
+Streaming JSON responses for the raw log endpoints.
+
+Instead of building every row and one Response body in memory, the rows are
+read from the queryset in chunks (a server-side cursor on PostgreSQL, see
+QuerySet.iterator), encoded one chunk at a time and sent through a
+StreamingHttpResponse. Peak memory is bounded by the chunk size instead of
+the date range.
+
+The rows are encoded with the JSON settings of DRF's JSONRenderer, so a
+streamed body is the same JSON the buffered Response would render.
+
+Streaming is opt-in (?stream=1) and only used when content negotiation chose
+a JSON renderer; otherwise the views return a regular Response, so other
+renderers (e.g. the browsable API) keep working.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+# Rows fetched from the database and encoded per chunk
+STREAM_CHUNK_SIZE = getattr(settings, "MACHINE_LOG_STREAM_CHUNK_SIZE", 2000)
+
+
+def wants_stream(request):
+    """
+    Whether to stream the response: the request asked for it (?stream=1) and
+    the negotiated renderer renders JSON.
+    """
+    if request.GET.get('stream', '').lower() not in ('1', 'true', 'yes'):
+        return False
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer is not None and renderer.format == 'json'
+
+
+def _content_type(request):
+    """Content type of the negotiated renderer, as Response would set it."""
+    renderer = request.accepted_renderer
+    media_type = getattr(request, 'accepted_media_type', None) or renderer.media_type
+    if renderer.charset and 'charset' not in media_type:
+        return f'{media_type}; charset={renderer.charset}'
+    return media_type
+
+
+def _separators():
+    return (',', ':') if api_settings.COMPACT_JSON else (', ', ': ')
+
+
+_encoders = {}
+
+
+def _json_encoder():
+    key = (api_settings.UNICODE_JSON, api_settings.STRICT_JSON, api_settings.COMPACT_JSON)
+    encoder = _encoders.get(key)
+    if encoder is None:
+        encoder = _encoders[key] = JSONEncoder(
+            ensure_ascii=not api_settings.UNICODE_JSON,
+            allow_nan=not api_settings.STRICT_JSON,
+            separators=_separators(),
+        )
+    return encoder
+
+
+def encode(value):
+    """One value encoded like JSONRenderer does."""
+    ret = _json_encoder().encode(value)
+    # Escaped by JSONRenderer too, they are line terminators in JavaScript
+    return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def chunked(rows, size=STREAM_CHUNK_SIZE):
+    """Split an iterable into lists of at most size items."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def json_array(chunks):
+    """
+    Yield the bytes of a JSON array.
+
+    Args:
+        chunks: iterable of lists of JSON-serializable rows
+    """
+    separator = _separators()[0].encode()
+    yield b'['
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        # The whole chunk in one encoder call, without its brackets
+        body = encode(chunk)[1:-1]
+        yield body if first else separator + body
+        first = False
+    yield b']'
+
+
+def json_object(fields):
+    """
+    Yield the bytes of a JSON object whose values may be streamed.
+
+    Args:
+        fields: list of (key, value) pairs; a value that is a generator of
+            bytes (e.g. from json_array) is streamed, other values are encoded
+    """
+    separator, key_separator = (part.encode() for part in _separators())
+    yield b'{'
+    for position, (key, value) in enumerate(fields):
+        yield (separator if position else b'') + encode(key) + key_separator
+        if hasattr(value, '__next__'):
+            yield from value
+        else:
+            yield encode(value)
+    yield b'}'
+
+
+def streaming_json_response(request, content, status=200):
+    """
+    StreamingHttpResponse of the bytes yielded by json_array / json_object,
+    with the content type of the request's negotiated renderer.
+    """
+    return StreamingHttpResponse(content, status=status, content_type=_content_type(request))
@@ -0,0 +1,104 @@
+from datetime import date, timedelta
+
+from django.test import SimpleTestCase
+
+from ..dedup_index import BloomFilter, DedupIndex, RecentKeys
+
+TODAY = date(2024, 5, 10)
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_added_keys_are_always_found(self):
+        bloom = BloomFilter(1000)
+        keys = [(TODAY, "M1", log_id) for log_id in range(1000)]
+        for key in keys:
+            bloom.add(key)
+
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_false_positive_rate_stays_near_the_target(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for log_id in range(1000):
+            bloom.add((TODAY, "M1", log_id))
+
+        false_positives = sum((TODAY, "M2", log_id) in bloom for log_id in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class RecentKeysTests(SimpleTestCase):
+    def test_least_recently_used_key_is_evicted(self):
+        recent = RecentKeys(2)
+        recent.add("a")
+        recent.add("b")
+        self.assertIn("a", recent)
+        recent.add("c")
+
+        self.assertNotIn("b", recent)
+        self.assertIn("a", recent)
+        self.assertIn("c", recent)
+        self.assertEqual(len(recent), 2)
+
+
+class DedupIndexTests(SimpleTestCase):
+    def setUp(self):
+        # Stored rows per date as (row id, key), keys are (DATE, MACHINE_ID, log_id)
+        self.stored = {}
+        self.loads = []
+        self.today = TODAY
+        self.index = DedupIndex(
+            self.load_keys, lambda key: key[0], lru_size=10, bloom_capacity=100,
+            max_days=7, today=lambda: self.today,
+        )
+
+    def load_keys(self, log_date, after_id):
+        self.loads.append((log_date, after_id))
+        return [(row_id, key) for row_id, key in self.stored.get(log_date, []) if row_id > after_id]
+
+    def store(self, row_id, key):
+        self.stored.setdefault(key[0], []).append((row_id, key))
+
+    def test_unsynced_date_might_exist(self):
+        self.assertTrue(self.index.might_exist((TODAY, "M1", 1)))
+        self.assertEqual(self.index.stats["unindexed"], 1)
+
+    def test_synced_date_tells_stored_from_new_keys(self):
+        self.store(1, (TODAY, "M1", 1))
+        self.store(2, (TODAY, "M1", 2))
+        self.index.sync([TODAY])
+
+        self.assertTrue(self.index.might_exist((TODAY, "M1", 2)))
+        self.assertFalse(self.index.might_exist((TODAY, "M1", 3)))
+        self.assertEqual(self.index.stats["definitely_new"], 1)
+
+    def test_sync_loads_only_rows_above_the_high_water_mark(self):
+        self.store(1, (TODAY, "M1", 1))
+        self.index.sync([TODAY])
+        # Stored by another worker since the last sync
+        self.store(5, (TODAY, "M2", 1))
+        self.index.sync([TODAY])
+
+        self.assertEqual(self.loads, [(TODAY, 0), (TODAY, 1)])
+        self.assertTrue(self.index.might_exist((TODAY, "M2", 1)))
+
+    def test_added_keys_might_exist(self):
+        self.index.sync([TODAY])
+        self.index.add((TODAY, "M1", 7))
+
+        self.assertTrue(self.index.might_exist((TODAY, "M1", 7)))
+
+    def test_dates_older_than_max_days_are_not_loaded(self):
+        old_date = TODAY - timedelta(days=7)
+        self.store(1, (old_date, "M1", 1))
+        self.index.sync([old_date])
+
+        self.assertEqual(self.loads, [])
+        self.assertTrue(self.index.might_exist((old_date, "M1", 2)))
+
+    def test_day_filters_are_evicted_as_the_server_date_advances(self):
+        self.index.sync([TODAY])
+        self.assertFalse(self.index.might_exist((TODAY, "M1", 1)))
+
+        self.today = TODAY + timedelta(days=7)
+        self.index.sync([self.today])
+
+        self.assertTrue(self.index.might_exist((TODAY, "M1", 1)))
@@ -0,0 +1,55 @@
+from datetime import date, datetime, timezone
+
+from django.test import SimpleTestCase
+
+from ..pagination import PAGE_MAX_LIMIT, _next_cursor, decode_cursor, encode_cursor, parse_limit
+
+
+class CursorTests(SimpleTestCase):
+    def test_db_position_round_trips(self):
+        created_at = datetime(2024, 5, 10, 8, 30, 15, 123456, tzinfo=timezone.utc)
+
+        self.assertEqual(
+            decode_cursor(_next_cursor("db", (created_at, 42), 100)),
+            {"source": "db", "index": 100, "created_at": created_at, "id": 42},
+        )
+
+    def test_archive_position_round_trips(self):
+        self.assertEqual(
+            decode_cursor(_next_cursor("archive", (date(2024, 1, 31), 7), 250)),
+            {"source": "archive", "index": 250, "date": date(2024, 1, 31), "id": 7},
+        )
+
+    def test_start_of_a_source(self):
+        self.assertEqual(decode_cursor(_next_cursor("archive", None, 5)), {"source": "archive", "index": 5})
+
+    def test_token_is_url_safe(self):
+        token = _next_cursor("db", (datetime(2024, 5, 10, 23, 59, 59), 2 ** 40), 10 ** 6)
+
+        self.assertRegex(token, r"^[A-Za-z0-9_-]+$")
+
+    def test_malformed_tokens_are_rejected(self):
+        tokens = [
+            "",
+            "not a cursor!",
+            encode_cursor([1, 2]),
+            encode_cursor({"source": "db"}),
+            encode_cursor({"source": "elsewhere", "index": 1}),
+            encode_cursor({"source": "db", "index": "x"}),
+            encode_cursor({"source": "db", "index": 1, "created_at": "yesterday", "id": 1}),
+            encode_cursor({"source": "db", "index": 1, "created_at": "2024-05-10T08:30:00"}),
+            encode_cursor({"source": "archive", "index": 1, "date": "2024-02-30", "id": 1}),
+        ]
+        for token in tokens:
+            with self.subTest(token=token), self.assertRaisesMessage(ValueError, "Invalid cursor"):
+                decode_cursor(token)
+
+
+class ParseLimitTests(SimpleTestCase):
+    def test_valid_limit(self):
+        self.assertEqual(parse_limit("25"), 25)
+
+    def test_invalid_limits(self):
+        for value in (None, "ten", "0", str(PAGE_MAX_LIMIT + 1)):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_limit(value)
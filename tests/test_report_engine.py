@@ -0,0 +1,192 @@
+from collections import defaultdict
+from datetime import date
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from .. import report_engine
+from ..report_engine import ROLLUP_COLUMNS, ReportColumns, compute_line_report, compute_machine_report
+
+# Raw logs: (DATE, LINE_NUMB, MACHINE_ID, OPERATOR_ID, MODE, working_seconds,
+# STITCH_COUNT, NEEDLE_RUNTIME, reserve_numeric)
+LOGS = [
+    (date(2024, 5, 6), "1", "M1", "R1", 1, 1800, 900, 1500, 3000),
+    (date(2024, 5, 6), "1", "M1", "R1", 1, 3600, 2100, 3100, 0),
+    (date(2024, 5, 6), "1", "M1", "R1", 2, 900, 0, 0, 0),
+    (date(2024, 5, 6), "1", "M2", "R2", 1, 2700, 1500, 2400, 2500),
+    (date(2024, 5, 6), "1", "M2", "R2", 3, 600, 0, 0, 0),
+    (date(2024, 5, 6), "1", "M2", "0", 2, 1200, 0, 0, 0),
+    (date(2024, 5, 7), "1", "M1", "R1", 1, 5400, 3300, 5000, 2800),
+    (date(2024, 5, 7), "1", "M1", "R1", 4, 1800, 0, 0, 0),
+    (date(2024, 5, 7), "1", "M1", "R1", 5, 900, 0, 0, 0),
+    (date(2024, 5, 7), "1", "M1", "R1", 2, 300, 0, 0, 0),
+    (date(2024, 5, 8), "1", "M1", "R1", 2, 3600, 0, 0, 0),
+]
+LOG_FIELDS = (
+    "DATE", "LINE_NUMB", "MACHINE_ID", "OPERATOR_ID", "MODE", "working_seconds",
+    "STITCH_COUNT", "NEEDLE_RUNTIME", "reserve_numeric",
+)
+
+
+def raw_logs(machine_id=None):
+    logs = [dict(zip(LOG_FIELDS, log)) for log in LOGS]
+    for log in logs:
+        log["duration_hours"] = log["working_seconds"] / 3600
+    return [log for log in logs if machine_id is None or log["MACHINE_ID"] == machine_id]
+
+
+def rollup_columns(logs):
+    """Daily rollup rows of the logs, summed like rollups.rollup_values()."""
+    rows = defaultdict(lambda: defaultdict(int))
+    for log in logs:
+        row = rows[log["DATE"], log["LINE_NUMB"], log["MACHINE_ID"], log["OPERATOR_ID"], log["MODE"]]
+        speed = log["reserve_numeric"]
+        row["duration_seconds"] += log["working_seconds"]
+        row["stitch_count"] += log["STITCH_COUNT"]
+        row["needle_runtime"] += log["NEEDLE_RUNTIME"]
+        row["speed_sum"] += speed if speed > 0 else 0
+        row["speed_count"] += 1 if speed > 0 else 0
+        row["log_count"] += 1
+    records = [
+        key + tuple(sums[name] for name, _ in ROLLUP_COLUMNS[5:])
+        for key, sums in rows.items()
+    ]
+    return ReportColumns({
+        name: np.array([record[position] for record in records], dtype=dtype)
+        for position, (name, dtype) in enumerate(ROLLUP_COLUMNS)
+    })
+
+
+def baseline_daily_table(logs):
+    """Daily table and totals of the original process_line_data / process_machine_data queries."""
+    by_date = defaultdict(list)
+    for log in logs:
+        by_date[log["DATE"]].append(log)
+
+    totals = defaultdict(float)
+    table = []
+    for log_date in sorted(by_date):
+        day = by_date[log_date]
+        hours = {mode: sum(log["duration_hours"] for log in day if log["MODE"] == mode) for mode in range(1, 6)}
+        productive_time = hours[1]
+        non_productive_time = hours[3] + hours[4] + hours[5] + hours[2]
+        daily_total_hours = productive_time + non_productive_time
+        sewing_speed = sum(max(log["reserve_numeric"], 0) for log in day) / len(day)
+        table.append({
+            'Date': str(log_date),
+            'Sewing Hours (PT)': round(hours[1], 2),
+            'No Feeding Hours': round(hours[3], 2),
+            'Meeting Hours': round(hours[4], 2),
+            'Maintenance Hours': round(hours[5], 2),
+            'Idle Hours': round(hours[2], 2),
+            'Total Hours': round(daily_total_hours, 2),
+            'Productive Time (PT) %': round(productive_time / daily_total_hours * 100, 2) if daily_total_hours > 0 else 0,
+            'Non-Productive Time (NPT) %': round(non_productive_time / daily_total_hours * 100, 2) if daily_total_hours > 0 else 0,
+            'Sewing Speed': round(sewing_speed, 2),
+            'Stitch Count': sum(log["STITCH_COUNT"] for log in day),
+            'Needle Runtime': sum(log["NEEDLE_RUNTIME"] for log in day),
+            'Machine Count': len({log["MACHINE_ID"] for log in day}),
+        })
+        for mode, value in hours.items():
+            totals[mode] += value
+        totals["total"] += daily_total_hours
+        totals["stitch_count"] += table[-1]['Stitch Count']
+        totals["needle_runtime"] += table[-1]['Needle Runtime']
+
+    productive_time = totals[1]
+    non_productive_time = totals[3] + totals[4] + totals[5] + totals[2]
+    speeds = [log["reserve_numeric"] for log in logs if log["reserve_numeric"] > 0]
+    summary = {
+        "totalHours": round(totals["total"], 2),
+        "totalProductiveTime": {
+            "hours": round(productive_time, 2),
+            "percentage": round(productive_time / totals["total"] * 100, 2) if totals["total"] > 0 else 0
+        },
+        "totalNonProductiveTime": {
+            "hours": round(non_productive_time, 2),
+            "percentage": round(non_productive_time / totals["total"] * 100, 2) if totals["total"] > 0 else 0,
+            "breakdown": {
+                "noFeedingHours": round(totals[3], 2),
+                "meetingHours": round(totals[4], 2),
+                "maintenanceHours": round(totals[5], 2),
+                "idleHours": round(totals[2], 2)
+            }
+        },
+        "totalStitchCount": int(totals["stitch_count"]),
+        "averageSewingSpeed": round(sum(speeds) / len(speeds), 2) if speeds else 0,
+    }
+    return table, totals, summary
+
+
+def baseline_line_report(logs, line_number):
+    table, totals, summary = baseline_daily_table(logs)
+    total_ideal_hours = totals[2]
+    sewing_logs = [log for log in logs if log["MODE"] == 1]
+    average_needle_runtime = totals["needle_runtime"] / len(sewing_logs) if sewing_logs else 0
+    needle_runtime_percentage = (totals["needle_runtime"] / 3600 / totals[1] * 100) if totals[1] > 0 else 0
+    return {
+        "lineNumber": line_number,
+        "totalIdealHours": round(total_ideal_hours, 2),
+        "utilizationPercentage": round(totals["total"] / total_ideal_hours * 100, 2) if total_ideal_hours > 0 else 0,
+        "totalWorkingDays": len(table),
+        "averageMachines": round(sum(row['Machine Count'] for row in table) / len(table), 2) if table else 0,
+        **summary,
+        "totalNeedleRuntime": round(average_needle_runtime, 2),
+        "needleRuntimePercentage": round(needle_runtime_percentage, 2),
+        "tableData": table,
+    }
+
+
+def baseline_machine_report(logs, machine_id):
+    table, totals, summary = baseline_daily_table(logs)
+    for row in table:
+        del row['Machine Count']
+        row['Machine ID'] = machine_id
+    return {
+        "machineId": machine_id,
+        # 11 available hours per working day
+        "totalAvailableHours": len(table) * 11,
+        "totalWorkingDays": len(table),
+        **summary,
+        "totalNeedleRuntime": round(totals["needle_runtime"], 2),
+        "tableData": table,
+    }
+
+
+class ReportEngineTests(SimpleTestCase):
+    def test_line_report_matches_the_baseline(self):
+        self.assertEqual(compute_line_report(rollup_columns(raw_logs()), "1"), baseline_line_report(raw_logs(), "1"))
+
+    def test_machine_report_matches_the_baseline(self):
+        calendar = mock.Mock()
+        calendar.available_hours.side_effect = lambda dates, line=None: np.full(len(dates), 11.0)
+
+        with mock.patch.object(report_engine, "shift_calendar", calendar):
+            report = compute_machine_report(rollup_columns(raw_logs("M1")), "M1")
+
+        self.assertEqual(report, baseline_machine_report(raw_logs("M1"), "M1"))
+
+    def test_empty_report(self):
+        report = compute_line_report(ReportColumns.empty(), "1")
+
+        self.assertEqual(report["totalHours"], 0)
+        self.assertEqual(report["utilizationPercentage"], 0)
+        self.assertEqual(report["tableData"], [])
+
+    def test_partition_splits_rows_by_value(self):
+        columns = rollup_columns(raw_logs())
+
+        parts = dict(columns.partition("MACHINE_ID"))
+
+        self.assertEqual(sorted(parts), ["M1", "M2"])
+        self.assertEqual(len(parts["M1"]) + len(parts["M2"]), len(columns))
+        self.assertTrue((parts["M2"]["MACHINE_ID"] == "M2").all())
+
+    def test_aggregate_by_date(self):
+        keys, totals = rollup_columns(raw_logs()).aggregate("DATE")
+
+        self.assertEqual([key[0] for key in keys], [date(2024, 5, 6), date(2024, 5, 7), date(2024, 5, 8)])
+        self.assertEqual(totals["mode_1_seconds"].tolist(), [8100, 5400, 0])
+        self.assertEqual(totals["machine_count"].tolist(), [2, 1, 1])
+        self.assertEqual(totals["sewing_log_count"].tolist(), [3, 1, 0])
@@ -0,0 +1,102 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from ..spool import (
+    LENGTH_PREFIX, QUARANTINE_SUFFIX, SEGMENT_SUFFIX, LogSpool, load_bisected, read_records,
+)
+
+
+class Outage(Exception):
+    pass
+
+
+class LoadBisectedTests(SimpleTestCase):
+    def test_rejects_only_the_failing_records(self):
+        loaded, rejected = [], []
+
+        def load_batch(records):
+            if any(record.get("bad") for record in records):
+                raise ValueError("bad record")
+            loaded.extend(records)
+
+        records = [{"n": n, "bad": n in (3, 6)} for n in range(8)]
+        count = load_bisected(load_batch, records, (Outage,), lambda record, exc: rejected.append(record))
+
+        self.assertEqual(count, 6)
+        self.assertEqual(sorted(record["n"] for record in loaded), [0, 1, 2, 4, 5, 7])
+        self.assertEqual([record["n"] for record in rejected], [3, 6])
+
+    def test_outage_errors_propagate(self):
+        def load_batch(records):
+            raise Outage()
+
+        with self.assertRaises(Outage):
+            load_bisected(load_batch, [{"n": 1}, {"n": 2}], (Outage,), lambda record, exc: None)
+
+
+class LogSpoolTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = LogSpool(self.directory, fsync_every=1)
+
+    def files(self, suffix):
+        return [name for name in os.listdir(self.directory) if name.endswith(suffix)]
+
+    def test_replay_loads_and_deletes_the_segment(self):
+        self.spool.append([{"n": n} for n in range(5)])
+        self.spool.rotate()
+        loaded = []
+
+        self.spool.replay(loaded.extend, batch_size=2, outage_errors=(Outage,))
+
+        self.assertEqual([record["n"] for record in loaded], [0, 1, 2, 3, 4])
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(self.spool.stats["replayed"], 5)
+
+    def test_bad_record_is_quarantined_and_the_rest_replays(self):
+        self.spool.append([{"n": 1}, {"n": 2, "bad": True}, {"n": 3}])
+        self.spool.rotate()
+        self.spool.append([{"n": 4}])
+        self.spool.rotate()
+        loaded = []
+
+        def load_batch(records):
+            if any(record.get("bad") for record in records):
+                raise ValueError("bad record")
+            loaded.extend(records)
+
+        self.spool.replay(load_batch, outage_errors=(Outage,))
+
+        self.assertEqual(sorted(record["n"] for record in loaded), [1, 3, 4])
+        self.assertEqual(self.files(SEGMENT_SUFFIX), [])
+        (quarantine,) = self.files(QUARANTINE_SUFFIX)
+        self.assertEqual(
+            list(read_records(os.path.join(self.directory, quarantine))), [{"n": 2, "bad": True}]
+        )
+        self.assertEqual(self.spool.stats["quarantined"], 1)
+        self.assertFalse(self.spool.has_pending())
+
+    def test_outage_leaves_the_segment_in_place(self):
+        self.spool.append([{"n": 1}])
+        self.spool.rotate()
+
+        def load_batch(records):
+            raise Outage()
+
+        with self.assertRaises(Outage):
+            self.spool.replay(load_batch, outage_errors=(Outage,))
+        self.assertEqual(len(self.files(SEGMENT_SUFFIX)), 1)
+        self.assertTrue(self.spool.has_pending())
+
+    def test_torn_record_at_the_end_is_ignored(self):
+        self.spool.append([{"n": 1}, {"n": 2}])
+        self.spool.rotate()
+        (segment,) = self.files(SEGMENT_SUFFIX)
+        path = os.path.join(self.directory, segment)
+        with open(path, "ab") as spool_file:
+            # Length prefix of a record whose payload was never written
+            spool_file.write(LENGTH_PREFIX.pack(100) + b'{"n": 3')
+
+        self.assertEqual(list(read_records(path)), [{"n": 1}, {"n": 2}])
@@ -0,0 +1,60 @@
+from django.test import SimpleTestCase
+
+from ..shift_calendar import Shift
+from ..working_time import WorkingTime
+
+HOUR = 3600
+
+
+class WorkingTimeTests(SimpleTestCase):
+    def setUp(self):
+        # 8:00 to 17:00 with a lunch break from 12:00 to 13:00
+        self.working_time = WorkingTime(Shift(8 * HOUR, 17 * HOUR, ((12 * HOUR, 13 * HOUR),)))
+
+    def overlap(self, start, end):
+        return int(self.working_time.overlap(start, end))
+
+    def test_log_inside_working_time_counts_fully(self):
+        self.assertEqual(self.overlap(9 * HOUR, 10 * HOUR), HOUR)
+
+    def test_log_spanning_a_break_skips_the_break(self):
+        self.assertEqual(self.overlap(11 * HOUR + 1800, 13 * HOUR + 1800), HOUR)
+
+    def test_log_inside_a_break_counts_nothing(self):
+        self.assertEqual(self.overlap(12 * HOUR + 900, 12 * HOUR + 2700), 0)
+
+    def test_log_is_clipped_to_the_shift_edges(self):
+        self.assertEqual(self.overlap(7 * HOUR, 8 * HOUR + 1800), 1800)
+        self.assertEqual(self.overlap(16 * HOUR + 1800, 19 * HOUR), 1800)
+        self.assertEqual(self.overlap(0, 24 * HOUR), 8 * HOUR)
+
+    def test_reversed_interval_counts_nothing(self):
+        self.assertEqual(self.overlap(10 * HOUR, 9 * HOUR), 0)
+
+    def test_overlap_of_many_logs_at_once(self):
+        starts = [9 * HOUR, 11 * HOUR + 1800, 12 * HOUR + 900, 7 * HOUR]
+        ends = [10 * HOUR, 13 * HOUR + 1800, 12 * HOUR + 2700, 8 * HOUR + 1800]
+
+        self.assertEqual(self.working_time.overlap(starts, ends).tolist(), [HOUR, HOUR, 0, 1800])
+
+    def test_unsorted_breaks_past_the_shift_edges_are_clipped(self):
+        working_time = WorkingTime(Shift(
+            8 * HOUR, 17 * HOUR, ((16 * HOUR + 1800, 18 * HOUR), (7 * HOUR, 8 * HOUR + 1800))
+        ))
+
+        self.assertEqual(int(working_time.overlap(0, 24 * HOUR)), 8 * HOUR)
+        self.assertEqual(int(working_time.overlap(8 * HOUR, 9 * HOUR)), 1800)
+
+    def test_shift_without_working_time(self):
+        working_time = WorkingTime(Shift(8 * HOUR, 17 * HOUR, ((8 * HOUR, 17 * HOUR),)))
+
+        self.assertEqual(working_time.overlap([0, 9 * HOUR], [24 * HOUR, 10 * HOUR]).tolist(), [0, 0])
+
+    def test_overlap_by_hour_splits_at_hour_boundaries(self):
+        self.assertEqual(
+            self.working_time.overlap_by_hour(10 * HOUR + 1800, 13 * HOUR + 1800),
+            [(10, 1800), (11, HOUR), (13, 1800)],
+        )
+
+    def test_overlap_by_hour_of_a_reversed_interval(self):
+        self.assertEqual(self.working_time.overlap_by_hour(10 * HOUR, 10 * HOUR), [])
@@ -0,0 +1,142 @@
+"""
+Exact overlap of logs with the working time of the shift calendar.
+
+The working time of a shift is a sorted list of segments: the shift window
+with its breaks cut out. For a time of day t, elapsed(t) is the working time
+between midnight and t. It is found with one searchsorted over the segment
+starts plus the cumulative segment lengths. The working time of a log is
+then elapsed(end) - elapsed(start), which counts a log spanning a break or
+the shift edges only for its part inside working time.
+
+working_seconds is stored on every log at ingest (see ingest.py) and
+recomputed in bulk with manage.py recompute_working_seconds, so the reports
+can sum it directly.
+"""
+import numpy as np
+from django.db import transaction
+
+from .models import MachineLog
+from .shift_calendar import shift_calendar
+
+# Logs read and updated per batch by recompute_working_seconds()
+RECOMPUTE_BATCH_SIZE = 5000
+
+
+class WorkingTime:
+    """
+    Working segments of one shift.
+
+    Args:
+        shift: shift_calendar.Shift
+    """
+
+    def __init__(self, shift):
+        starts, ends = [], []
+        cursor = shift.start_seconds
+        for break_start, break_end in sorted(shift.breaks):
+            break_start = max(break_start, shift.start_seconds)
+            break_end = min(break_end, shift.end_seconds)
+            if break_start > cursor:
+                starts.append(cursor)
+                ends.append(break_start)
+            cursor = max(cursor, break_end)
+        if shift.end_seconds > cursor:
+            starts.append(cursor)
+            ends.append(shift.end_seconds)
+
+        self.starts = np.array(starts, dtype=np.int64)
+        self.lengths = np.array(ends, dtype=np.int64) - self.starts
+        # Working time before each segment
+        self.cumulative = np.concatenate(([0], np.cumsum(self.lengths)[:-1])).astype(np.int64)
+
+    def elapsed(self, seconds):
+        """Working seconds between midnight and each time of day in seconds."""
+        seconds = np.asarray(seconds, dtype=np.int64)
+        if not len(self.starts):
+            return np.zeros_like(seconds)
+        segment = np.searchsorted(self.starts, seconds, side="right") - 1
+        safe_segment = np.maximum(segment, 0)
+        within = np.clip(seconds - self.starts[safe_segment], 0, self.lengths[safe_segment])
+        return np.where(segment >= 0, self.cumulative[safe_segment] + within, 0)
+
+    def overlap(self, start_seconds, end_seconds):
+        """Working seconds between each start and end (0 for reversed intervals)."""
+        return np.maximum(self.elapsed(end_seconds) - self.elapsed(start_seconds), 0)
+
+    def overlap_by_hour(self, start_seconds, end_seconds):
+        """Working seconds of one log per hour of day, as (hour, seconds) pairs."""
+        if end_seconds <= start_seconds:
+            return []
+        hours = np.arange(start_seconds // 3600, (end_seconds - 1) // 3600 + 1)
+        seconds = self.overlap(
+            np.maximum(hours * 3600, start_seconds), np.minimum((hours + 1) * 3600, end_seconds)
+        )
+        return [(hour, value) for hour, value in zip(hours.tolist(), seconds.tolist()) if value > 0]
+
+
+_working_times = {}
+
+
+def working_time_for(log_date, line=None):
+    """WorkingTime of the shift a log on this date and line was recorded in."""
+    shift = shift_calendar.pattern_for(log_date, line)
+    working_time = _working_times.get(shift)
+    if working_time is None:
+        working_time = _working_times[shift] = WorkingTime(shift)
+    return working_time
+
+
+def working_seconds(dates, lines, start_seconds, end_seconds):
+    """
+    Working seconds of many logs in one vectorized pass per distinct
+    (date, line) shift.
+
+    Args:
+        dates, lines, start_seconds, end_seconds: sequences, one value per log
+
+    Returns:
+        Integer array with the working seconds of each log
+    """
+    start_seconds = np.asarray(start_seconds, dtype=np.int64)
+    end_seconds = np.asarray(end_seconds, dtype=np.int64)
+    result = np.zeros(len(start_seconds), dtype=np.int64)
+
+    groups = {}
+    for index, key in enumerate(zip(dates, lines)):
+        groups.setdefault(key, []).append(index)
+    for (log_date, line), indexes in groups.items():
+        indexes = np.array(indexes)
+        result[indexes] = working_time_for(log_date, line).overlap(
+            start_seconds[indexes], end_seconds[indexes]
+        )
+    return result
+
+
+def recompute_working_seconds(dates, batch_size=RECOMPUTE_BATCH_SIZE):
+    """
+    Recompute working_seconds of the stored logs of the given dates, e.g.
+    after the shift calendar changed. Returns the number of updated logs.
+    """
+    updated = 0
+    for log_date in sorted(set(dates)):
+        logs = MachineLog.objects.filter(DATE=log_date, start_seconds__isnull=False).order_by("id")
+        last_id = 0
+        while True:
+            rows = list(logs.filter(id__gt=last_id).values_list(
+                "id", "LINE_NUMB", "start_seconds", "end_seconds", "working_seconds"
+            )[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            ids, lines, starts, ends, stored = zip(*rows)
+            clipped = working_seconds([log_date] * len(rows), lines, starts, ends)
+            changed = [
+                MachineLog(id=log_id, working_seconds=seconds)
+                for log_id, seconds, old in zip(ids, clipped.tolist(), stored)
+                if seconds != old
+            ]
+            with transaction.atomic():
+                MachineLog.objects.bulk_update(changed, ["working_seconds"], batch_size=1000)
+            updated += len(changed)
+    return updated
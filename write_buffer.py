@@ -0,0 +1,208 @@
+"""
+Write-behind buffer for machine log ingestion.
+
+Validated records are put on a bounded in-process queue and acknowledged
+right away. A background thread writes them in batches every batch_size
+records or flush_interval_ms milliseconds, whichever comes first, so device
+response time does not depend on database commit latency.
+
+The records were already acknowledged, so a batch that fails to write is
+not dropped. Without an on_failure handler it is retried with exponential
+backoff, ahead of everything queued after it. Until it goes through,
+submit() refuses new records, so callers write them synchronously and
+report errors to the device instead of acknowledging records that cannot
+be stored. Only records still failing at shutdown are lost, and they are
+reported.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Bounded queue drained by a background flusher thread.
+
+    Args:
+        write_batch: callable(list of records) that persists one batch
+        batch_size: largest number of records written per flush
+        flush_interval_ms: longest time a record waits before being flushed
+        max_queue_size: records held before submit() starts refusing
+        on_failure: optional callable(records, exc) that takes over batches
+            that failed; without it they are retried
+        retry_ms: first delay before retrying a failed batch, doubled on
+            every further failure up to max_retry_ms
+    """
+
+    def __init__(self, write_batch, batch_size=500, flush_interval_ms=200,
+                 max_queue_size=20000, on_failure=None, retry_ms=500, max_retry_ms=30000):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.on_failure = on_failure
+        self.retry_delay = retry_ms / 1000
+        self.max_retry_delay = max_retry_ms / 1000
+        self._failed = None  # Batch waiting to be retried
+        self._next_delay = self.retry_delay
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "rejected": 0,
+            "flushed_records": 0,
+            "failed_records": 0,
+            "retries": 0,
+            "lost_records": 0,
+            "flush_count": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        atexit.register(self.stop)
+
+    def start(self):
+        """Start the flusher thread if it is not running yet."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="machine-log-write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, record):
+        """
+        Queue a record for writing.
+
+        Returns:
+            False if the queue is full, stopping or a failed batch is waiting
+            to be retried, in which case the caller must write the record
+            itself
+        """
+        if self._stop.is_set():
+            return False
+        if self._failed is not None:
+            self._count("rejected")
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count("rejected")
+            return False
+        self._count("submitted")
+        return True
+
+    def stop(self, timeout=30):
+        """Stop accepting records and drain everything already queued."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _collect(self):
+        """Wait for the first record, then gather a batch until full or due."""
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self._failed is None:
+                self._flush(self._collect())
+            elif not self._stop.wait(self._next_delay):
+                self._count("retries")
+                self._flush(self._failed)
+
+        # Shutdown: write whatever is still queued, one last attempt each
+        batch = self._failed or self._drain()
+        while batch:
+            self._flush(batch, final=True)
+            batch = self._drain()
+
+    def _flush(self, batch, final=False):
+        if not batch:
+            return
+
+        started = time.monotonic()
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            self._count("failed_records", len(batch))
+            if self.on_failure is not None:
+                logger.exception("Write-behind flush of %d logs failed", len(batch))
+                self.on_failure(batch, e)
+            elif final:
+                logger.exception("Write-behind flush of %d logs failed at shutdown, they are lost", len(batch))
+                self._count("lost_records", len(batch))
+                self._failed = None
+            else:
+                if self._failed is batch:
+                    self._next_delay = min(self._next_delay * 2, self.max_retry_delay)
+                else:
+                    self._failed, self._next_delay = batch, self.retry_delay
+                logger.exception(
+                    "Write-behind flush of %d logs failed, retrying in %.1fs", len(batch), self._next_delay
+                )
+            return
+
+        self._failed = None
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._stats_lock:
+            self._stats["flushed_records"] += len(batch)
+            self._stats["flush_count"] += 1
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+            self._stats["total_flush_ms"] += elapsed_ms
+
+    def stats(self):
+        """Queue depth and flush latency counters."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        flush_count = stats.pop("flush_count")
+        total_flush_ms = stats.pop("total_flush_ms")
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "retrying_records": len(self._failed or ()),
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "flush_count": flush_count,
+            "avg_flush_ms": round(total_flush_ms / flush_count, 2) if flush_count else 0,
+            "last_flush_ms": round(stats.pop("last_flush_ms"), 2),
+            "max_flush_ms": round(stats.pop("max_flush_ms"), 2),
+            **stats,
+        }